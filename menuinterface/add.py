@@ -1,6 +1,7 @@
 import click
 import requests
 
+import constants
 import helpers
 import search
 
@@ -10,7 +11,7 @@ def add_entry(credentials, entry_type, entry=None):
 
     :param credentials: A tuple containing valid MAL account details in the format (username, password)
     :param entry_type: A string, must be either "anime" or "manga"
-    :param entry: A beautiful soup tag, an entry to add
+    :param entry: A records.SearchEntry, an entry to add
     :return: None, if the user cancelled
     """
 
@@ -40,22 +41,22 @@ def add_entry(credentials, entry_type, entry=None):
 
         if entry_type == "anime":
             if status == 2:
-                episodes = entry.episodes.get_text()
+                episodes = entry.episodes
             else:
                 # get the choice of episode count
-                episodes = helpers.get_new_count_from_user("episode", int(entry.episodes.get_text()))
+                episodes = helpers.get_new_count_from_user("episode", entry.episodes)
 
             # append the episode count if the user didn't opt to skip
             if episodes is not None:
                 xml_field_tags += xml_tag_format.format("episode", episodes)
         else:
             if status == 2:
-                chapters = entry.chapters.get_text()
-                volumes = entry.volumes.get_text()
+                chapters = entry.chapters
+                volumes = entry.volumes
             else:
                 # get the choice of chapter and volume count
-                chapters = helpers.get_new_count_from_user("chapter", int(entry.chapters.get_text()))
-                volumes = helpers.get_new_count_from_user("volume", int(entry.volumes.get_text()))
+                chapters = helpers.get_new_count_from_user("chapter", entry.chapters)
+                volumes = helpers.get_new_count_from_user("volume", entry.volumes)
 
             # append chapter and volume choice if the user didn't opt to skip
             if chapters is not None:
@@ -74,12 +75,12 @@ def add_entry(credentials, entry_type, entry=None):
     xml = '<?xml version="1.0" encoding="UTF-8"?><entry>{}</entry>'.format(xml_field_tags)
 
     # make the request to the server to add
-    r = requests.get("https://myanimelist.net/api/{}list/add/{}.xml".format(entry_type, entry.id.get_text()),
+    r = requests.get("{}/api/{}list/add/{}.xml".format(constants.BASE_URL, entry_type, entry.id),
                      params={"data": xml}, auth=credentials)
 
     # inform the user whether the request was successful or not
     if r.status_code == 201:
-        click.echo("Added \"{}\" to your {}list".format(entry.title.get_text(), entry_type))
+        click.echo("Added \"{}\" to your {}list".format(entry.title, entry_type))
     else:
         click.echo("Error adding {}. {}.".format(entry_type, r.text))
 
@@ -90,7 +91,7 @@ def add_anime_entry(credentials, entry=None):
     """Add a new anime entry to the user's anime list
 
     :param credentials: A tuple containing valid MAL account details in the format (username, password)
-    :param entry: A beautiful soup tag, an entry to add
+    :param entry: A records.SearchEntry, an entry to add
     """
     add_entry(credentials, "anime", entry)
 
@@ -99,6 +100,6 @@ def add_manga_entry(credentials, entry=None):
     """Add a new manga entry to the user's manga list
 
     :param credentials: A tuple containing valid MAL account details in the format (username, password)
-    :param entry: A beautiful soup tag, an entry to add
+    :param entry: A records.SearchEntry, an entry to add
     """
     add_entry(credentials, "manga", entry)
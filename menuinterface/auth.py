@@ -1,6 +1,12 @@
+from concurrent.futures import Future
+import threading
+
 import requests
 import click
 
+import constants
+import credcache
+
 
 def _get_user_credentials():
     """Prompts the user to enter their username and password
@@ -18,21 +24,64 @@ def _get_user_credentials():
     return username, password
 
 
+def _check_credentials(credentials):
+    """Ask MAL whether a combination of username/password is valid
+
+    :param credentials: A tuple containing strings in the format (username, password)
+    :return: A requests.Response
+    """
+    # make a GET request to the server for an xml (we aren't really concerned with the contents though)
+    return requests.get("{}/api/account/verify_credentials.xml".format(constants.BASE_URL), auth=credentials)
+
+
+def _check_in_background(credentials):
+    """Start checking a combination of username/password without waiting for the answer
+
+    :param credentials: A tuple containing strings in the format (username, password)
+    :return: A concurrent.futures.Future of the requests.Response, or of the exception if the request failed
+    """
+    future = Future()
+
+    def check():
+        """Check the credentials and hand the result to the future"""
+        try:
+            future.set_result(_check_credentials(credentials))
+        except requests.exceptions.RequestException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=check, daemon=True).start()
+
+    return future
+
+
+# the check of a remembered login that the user hasn't been told the result of, see confirm_login
+_login_check = None
+
+
 def authenticate_user():
     """Get a user's login details and verify the validity
 
-    Connects to the MAL website to check whether a given combination of username/password is valid
+    Connects to the MAL website to check whether a given combination of username/password is valid. If the user asked
+    for their login to be remembered (with SAMMY_REMEMBER_LOGIN) and it was used recently, it is returned straight away
+    and checked in the background instead, see confirm_login.
 
     :return: If successful a tuple containing strings in format (username, password), False otherwise
     """
+    global _login_check
+
+    cache = credcache.get_cache()
+    remembered = cache.load() if cache is not None else None
+
+    if remembered is not None:
+        _login_check = _check_in_background(remembered)
+        return remembered
 
     while True:
         # get the credentials from the user
         credentials = _get_user_credentials()
 
         try:
-            # make a GET request to the server for an xml (we aren't really concerned with the contents though)
-            r = requests.get("https://myanimelist.net/api/account/verify_credentials.xml", auth=credentials)
+            r = _check_credentials(credentials)
         except requests.exceptions.ConnectionError:
             click.echo("An error occurred when connecting. Please check your internet connection.")
             return False
@@ -40,6 +89,10 @@ def authenticate_user():
         if r.status_code == 200:
             # credentials were successfully authenticated
             click.echo("Authenticated")
+
+            if cache is not None:
+                cache.save(credentials)
+
             return credentials
         elif r.status_code == 401:
             # server returned unauthorised as the credentials were not valid
@@ -53,3 +106,35 @@ def authenticate_user():
             continue
         else:
             return False
+
+
+def confirm_login(credentials):
+    """Wait for the check of a remembered login to finish, asking the user to log in again if MAL turned it down
+
+    :param credentials: A tuple containing strings in the format (username, password), the login in use
+    :return: The tuple of credentials to carry on with, or False if the user gave up logging in
+    """
+    global _login_check
+
+    if _login_check is None:
+        return credentials
+
+    login_check, _login_check = _login_check, None
+
+    try:
+        status_code = login_check.result().status_code
+    except requests.exceptions.RequestException:
+        # the menus will report the problem when they can't reach MAL either
+        return credentials
+
+    cache = credcache.get_cache()
+
+    if status_code == 401:
+        cache.forget()
+        click.echo("Your saved login was not accepted, please log in again")
+        return authenticate_user()
+    elif status_code == 200:
+        # start the remembered login's validity window again
+        cache.save(credentials)
+
+    return credentials
@@ -1,5 +1,22 @@
 from collections import OrderedDict
+import os
 
+import click
+
+# the root of every MAL url, can be pointed at a stand-in server (e.g. python -m stubserver) with MAL_BASE_URL
+BASE_URL = os.environ.get("MAL_BASE_URL", "https://myanimelist.net").rstrip("/")
+
+# the directory where data is saved between runs, shared with the natural language interface and can be overridden
+# with SAMMY_DATA_DIR
+DATA_DIR = os.environ.get("SAMMY_DATA_DIR") or click.get_app_dir("Sammy")
+
+# where the results of database searches are cached: "disk" to reuse them between runs (the default), "memory" to
+# only reuse them until the program exits or "off", can be overridden with SAMMY_SEARCH_CACHE
+SEARCH_CACHE = os.environ.get("SAMMY_SEARCH_CACHE", "disk").lower()
+
+# whether a login that MAL has accepted is remembered between runs, so the program can start without asking for it,
+# turned on by setting SAMMY_REMEMBER_LOGIN to 1
+REMEMBER_LOGIN = os.environ.get("SAMMY_REMEMBER_LOGIN", "").lower() in ["1", "true", "yes"]
 
 ANIME_STATUS_MAP = OrderedDict([
     ("1", "Watching"),
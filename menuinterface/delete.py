@@ -1,6 +1,7 @@
 import click
 import requests
 
+import constants
 import update
 
 
@@ -17,17 +18,16 @@ def _delete_entry(credentials, entry_type):
 
     if entry is not None:
         # confirm that this is what the user intended
-        if click.confirm("Are you sure you want to delete {}?".format(entry.series_title.get_text())):
-            entry_id = entry.series_animedb_id.get_text() if entry_type == "anime" \
-                                                          else entry.series_mangadb_id.get_text()
+        if click.confirm("Are you sure you want to delete {}?".format(entry.title)):
+            entry_id = entry.series_id
 
             # prepare the url and send the delete request to the server
-            url = "https://myanimelist.net/api/{}list/delete/{}.xml".format(entry_type, entry_id)
+            url = "{}/api/{}list/delete/{}.xml".format(constants.BASE_URL, entry_type, entry_id)
             r = requests.delete(url, auth=credentials)
 
             # inform the user of the result
             if r.status_code == 200:
-                click.echo("{} was successfully deleted.".format(entry.series_title.get_text()))
+                click.echo("{} was successfully deleted.".format(entry.title))
             else:
                 click.echo("Error deleting {}. Please try again.".format(entry_type))
         else:
@@ -1,5 +1,6 @@
 import click
 
+import auth
 import delete
 import search
 import update
@@ -38,6 +39,11 @@ def main_menu(credentials):
         choice = click.prompt("Please choose an option", type=int)
 
         if choice in range(1, 5):
+            # make sure a remembered login still works before using it
+            credentials = auth.confirm_login(credentials)
+            if not credentials:
+                return
+
             _mm_mapping[choice](credentials)
         elif choice == 0:
             return
@@ -0,0 +1,214 @@
+from collections import OrderedDict
+import sys
+
+
+def _int(text):
+    """Convert the text of a numeric XML field to an int, treating an empty field as 0
+
+    :param text: A string
+    :return: An int
+    """
+    return int(text) if text else 0
+
+
+def _code(text):
+    """Intern the text of a status or type code field so every entry shares the same few strings
+
+    :param text: A string, e.g. "1"
+    :return: The interned string
+    """
+    return sys.intern(text)
+
+
+class Record:
+    """The base of the compact records that entries from MAL are parsed into
+
+    Subclasses list their XML fields in XML_FIELDS, mapping the name of each element to the attribute it is stored in
+    and the function that converts its text, and only store those attributes (using __slots__).
+    """
+    __slots__ = ()
+
+    # the name of each XML element mapped to a tuple of (attribute name, conversion function)
+    XML_FIELDS = OrderedDict()
+
+    def __init__(self, fields):
+        """
+        :param fields: A dictionary mapping the names of XML elements to their text, missing fields are left empty
+        """
+        for name, (attribute, convert) in self.XML_FIELDS.items():
+            setattr(self, attribute, convert(fields.get(name, "")))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_fields() == other.to_fields()
+
+    def __repr__(self):
+        return "{}({!r})".format(type(self).__name__, dict(self.to_fields()))
+
+    @classmethod
+    def converter(cls, attribute):
+        """Get the function that converts the text of a field to the value of an attribute
+
+        :param attribute: A string, the name of the attribute
+        :return: A function
+        """
+        for name, (field_attribute, convert) in cls.XML_FIELDS.items():
+            if field_attribute == attribute:
+                return convert
+
+        raise ValueError("Invalid argument for {}, must be one of {}.".format(
+            attribute, [field_attribute for field_attribute, convert in cls.XML_FIELDS.values()]))
+
+    def to_fields(self):
+        """Convert the record back into the text of its XML fields
+
+        :return: An OrderedDict mapping XML element names to strings
+        """
+        return OrderedDict((name, str(getattr(self, attribute))) for name, (attribute, convert)
+                           in self.XML_FIELDS.items())
+
+
+class ListEntry(Record):
+    """An entry on a user's anime or manga list, as returned by malappinfo.php"""
+    __slots__ = ()
+
+    # the media type of the list the entry is on
+    media_type = None
+
+    # maps the fields sent to the list add/update endpoints to the attributes that they change
+    UPDATE_FIELDS = {}
+
+    def apply_fields(self, fields):
+        """Copy the fields sent to the list add/update endpoints onto the entry
+
+        :param fields: A dictionary, the fields sent to MAL, e.g. {"episode": 3}
+        """
+        for name, value in fields.items():
+            if name in self.UPDATE_FIELDS:
+                attribute = self.UPDATE_FIELDS[name]
+                setattr(self, attribute, self.converter(attribute)(str(value)))
+
+
+class AnimeListEntry(ListEntry):
+    """An entry on a user's anime list"""
+    media_type = "anime"
+
+    XML_FIELDS = OrderedDict([
+        ("series_animedb_id", ("series_id", _int)),
+        ("series_title", ("title", str)),
+        ("series_synonyms", ("synonyms", str)),
+        ("series_type", ("series_type", _code)),
+        ("series_episodes", ("series_episodes", _int)),
+        ("my_watched_episodes", ("watched_episodes", _int)),
+        ("my_score", ("score", _int)),
+        ("my_status", ("status", _code))
+    ])
+
+    UPDATE_FIELDS = {"episode": "watched_episodes", "status": "status", "score": "score"}
+
+    __slots__ = tuple(attribute for attribute, convert in XML_FIELDS.values())
+
+
+class MangaListEntry(ListEntry):
+    """An entry on a user's manga list"""
+    media_type = "manga"
+
+    XML_FIELDS = OrderedDict([
+        ("series_mangadb_id", ("series_id", _int)),
+        ("series_title", ("title", str)),
+        ("series_synonyms", ("synonyms", str)),
+        ("series_type", ("series_type", _code)),
+        ("series_chapters", ("series_chapters", _int)),
+        ("series_volumes", ("series_volumes", _int)),
+        ("my_read_chapters", ("read_chapters", _int)),
+        ("my_read_volumes", ("read_volumes", _int)),
+        ("my_score", ("score", _int)),
+        ("my_status", ("status", _code))
+    ])
+
+    UPDATE_FIELDS = {"chapter": "read_chapters", "volume": "read_volumes", "status": "status", "score": "score"}
+
+    __slots__ = tuple(attribute for attribute, convert in XML_FIELDS.values())
+
+
+class SearchEntry(Record):
+    """An entry in the MAL database, as returned by api/{type}/search.xml"""
+    __slots__ = ()
+
+    # the media type of the database the entry is from
+    media_type = None
+
+
+class AnimeSearchEntry(SearchEntry):
+    """An anime in the MAL database"""
+    media_type = "anime"
+
+    XML_FIELDS = OrderedDict([
+        ("id", ("id", _int)),
+        ("title", ("title", str)),
+        ("english", ("english", str)),
+        ("synonyms", ("synonyms", str)),
+        ("episodes", ("episodes", _int)),
+        ("score", ("score", str)),
+        ("type", ("type", _code)),
+        ("status", ("status", _code)),
+        ("start_date", ("start_date", str)),
+        ("end_date", ("end_date", str)),
+        ("synopsis", ("synopsis", str)),
+        ("image", ("image", str))
+    ])
+
+    __slots__ = tuple(attribute for attribute, convert in XML_FIELDS.values())
+
+
+class MangaSearchEntry(SearchEntry):
+    """A manga in the MAL database"""
+    media_type = "manga"
+
+    XML_FIELDS = OrderedDict([
+        ("id", ("id", _int)),
+        ("title", ("title", str)),
+        ("english", ("english", str)),
+        ("synonyms", ("synonyms", str)),
+        ("chapters", ("chapters", _int)),
+        ("volumes", ("volumes", _int)),
+        ("score", ("score", str)),
+        ("type", ("type", _code)),
+        ("status", ("status", _code)),
+        ("start_date", ("start_date", str)),
+        ("end_date", ("end_date", str)),
+        ("synopsis", ("synopsis", str)),
+        ("image", ("image", str))
+    ])
+
+    __slots__ = tuple(attribute for attribute, convert in XML_FIELDS.values())
+
+
+def _check_media_type(media_type):
+    """Raise a ValueError if the media type isn't one that MAL supports
+
+    :param media_type: A string, should be either "anime" or "manga"
+    """
+    if media_type not in ["anime", "manga"]:
+        raise ValueError("Invalid argument for {}, must be either {} or {}.".format(media_type, "anime", "manga"))
+
+
+def list_entry(media_type, fields):
+    """Create a list entry record from the text of its XML fields
+
+    :param media_type: A string, must be either "anime" or "manga"
+    :param fields: A dictionary mapping the names of XML elements to their text
+    :return: An AnimeListEntry or MangaListEntry
+    """
+    _check_media_type(media_type)
+    return AnimeListEntry(fields) if media_type == "anime" else MangaListEntry(fields)
+
+
+def search_entry(media_type, fields):
+    """Create a database entry record from the text of its XML fields
+
+    :param media_type: A string, must be either "anime" or "manga"
+    :param fields: A dictionary mapping the names of XML elements to their text
+    :return: An AnimeSearchEntry or MangaSearchEntry
+    """
+    _check_media_type(media_type)
+    return AnimeSearchEntry(fields) if media_type == "anime" else MangaSearchEntry(fields)
@@ -1,32 +1,29 @@
 import html
 
 import click
+from lxml import etree
 import requests
-from bs4 import BeautifulSoup
 
 import add
+import constants
+import records
+import searchcache
+import xmlstream
 
 
 def display_entry_details(entry):
     """Display all the details of a given entry
 
-    :param entry: an anime or manga entry as a Beautiful Soup Tag object
+    :param entry: An anime or manga entry as a records.SearchEntry
     """
-    for detail in entry.children:
-        # ignore newlines in children
-        if detail != "\n":
-            # replace in tag name the underscores with spaces and convert to title case
-            detail_name = detail.name.replace("_", " ").title()
+    for name, value in entry.to_fields().items():
+        # replace in the field name the underscores with spaces and convert to title case
+        detail_name = name.replace("_", " ").title()
 
-            # set the string to be the detail.string by default
-            detail_string = detail.string
+        # unescape html entities and remove break tags
+        detail_string = html.unescape(value).replace("<br />", "")
 
-            # check that the string contains something
-            if detail_string is not None:
-                # unescape html entities and remove break tags
-                detail_string = html.unescape(detail_string).replace("<br />", "")
-
-            click.echo("{}: {}".format(detail_name, detail_string))
+        click.echo("{}: {}".format(detail_name, detail_string))
 
 
 def search(credentials, search_type):
@@ -49,21 +46,37 @@ def search(credentials, search_type):
     if search_string == "q":
         return
 
-    # get the results
-    r = requests.get("https://myanimelist.net/api/{}/search.xml".format(search_type),
-                     params={"q": search_string.replace(" ", "+")}, auth=credentials, stream=True)
-
-    if r.status_code == 204:
+    # reuse the results of a recent search for the same thing
+    cache = searchcache.get_cache()
+    matches = cache.get(search_type, search_string)
+
+    if matches is None:
+        # get the results
+        r = requests.get("{}/api/{}/search.xml".format(constants.BASE_URL, search_type),
+                         params={"q": search_string.replace(" ", "+")}, auth=credentials, stream=True)
+
+        if r.status_code == 204:
+            matches = []
+        elif r.status_code != 200:
+            click.echo("Error searching for {}. Please try again.".format(search_type))
+            click.pause()
+            return
+        else:
+            # parse the entries as they are streamed in, the connection can still fail partway through
+            try:
+                matches = [records.search_entry(search_type, fields)
+                           for fields in xmlstream.iter_response_entries(r, "entry")]
+            except (etree.XMLSyntaxError, requests.exceptions.RequestException):
+                click.echo("Error searching for {}. Please try again.".format(search_type))
+                click.pause()
+                return
+
+        cache.put(search_type, search_string, matches)
+
+    if not matches:
         click.echo("No results found for query \"{}\"".format(search_string))
         click.pause()
     else:
-        # decode the raw content so beautiful soup can read it as xml not a string
-        r.raw.decode_content = True
-        soup = BeautifulSoup(r.raw, "xml")
-
-        # get all entries
-        matches = soup.find_all("entry")
-
         # store the length of all_matched list since needed multiple times
         num_results = len(matches)
 
@@ -75,8 +88,8 @@ def search(credentials, search_type):
             # iterate over the matches and print them out
             for i in range(num_results):
                 # use a different layout for entries that don't have any synonyms
-                title_format = "{}> {} ({})" if matches[i].synonyms.get_text() != "" else "{}> {}"
-                click.echo(title_format.format(i + 1, matches[i].title.get_text(), matches[i].synonyms.get_text()))
+                title_format = "{}> {} ({})" if matches[i].synonyms != "" else "{}> {}"
+                click.echo(title_format.format(i + 1, matches[i].title, matches[i].synonyms))
 
             click.echo("{}> [None of these]".format(num_results + 1))
 
@@ -0,0 +1,192 @@
+from collections import OrderedDict
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from constants import DATA_DIR, SEARCH_CACHE
+import records
+
+# the most searches to remember, the least recently used are forgotten first
+MAX_ENTRIES = 256
+
+# the seconds that the results of a search are reused for, the MAL database changes rarely
+TTL = 24 * 60 * 60
+
+# the name of the database file in the data directory, shared by both interfaces
+CACHE_FILENAME = "searches.sqlite3"
+
+
+def normalise_query(query):
+    """Normalise a search so that ones differing only in case or spacing share the same results
+
+    :param query: A string, e.g. " Fullmetal  Alchemist"
+    :return: A string, e.g. "fullmetal alchemist"
+    """
+    return " ".join(query.lower().split())
+
+
+class SearchCache:
+    """The results of recent database searches, so that repeating a search doesn't have to ask MAL again
+
+    Results are kept in memory in least recently used order and, if the cache has a path, saved in an SQLite database
+    so that later runs (of either interface) can use them too. Results older than the TTL are searched for again.
+    """
+
+    def __init__(self, path=None, max_entries=MAX_ENTRIES, ttl=TTL):
+        """
+        :param path: A string, the path of the database file, or None for a cache that is only kept in memory
+        :param max_entries: An int, the most searches to remember, 0 to remember none
+        :param ttl: A number, the seconds that the results of a search are reused for
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        # the number of lookups that were and weren't answered from the cache
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+
+        # the results of each search as a tuple (fetched at, list of records.SearchEntry), keyed by
+        # (media type, normalised query) and ordered from least to most recently used
+        self._entries = OrderedDict()
+
+        self._connection = None
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS searches (
+                    media_type TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    used_at REAL NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (media_type, query)
+                );
+            """)
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+
+    def get(self, media_type, query):
+        """Get the results of an earlier search
+
+        :param media_type: A string, must be either "anime" or "manga"
+        :param query: A string, the anime or manga that was searched for
+        :return: A list of records.SearchEntry, empty if nothing matched, or None if the search isn't in the cache
+        """
+        key = (media_type, normalise_query(query))
+        now = time.time()
+
+        with self._lock:
+            cached = self._entries.get(key)
+
+            if cached is None and self._connection is not None:
+                row = self._connection.execute("SELECT fetched_at, data FROM searches WHERE media_type = ? AND "
+                                               "query = ?", key).fetchone()
+                if row is not None:
+                    cached = (row[0], [records.search_entry(media_type, fields) for fields in json.loads(row[1])])
+                    self._remember(key, cached)
+
+            if cached is None or now - cached[0] > self.ttl:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.execute("UPDATE searches SET used_at = ? WHERE media_type = ? AND query = ?",
+                                             (now,) + key)
+
+            self.hits += 1
+            return list(cached[1])
+
+    def put(self, media_type, query, entries):
+        """Save the results of a search
+
+        :param media_type: A string, must be either "anime" or "manga"
+        :param query: A string, the anime or manga that was searched for
+        :param entries: A list of records.SearchEntry, the results of the search
+        """
+        if self.max_entries <= 0:
+            return
+
+        key = (media_type, normalise_query(query))
+        now = time.time()
+
+        with self._lock:
+            self._remember(key, (now, list(entries)))
+
+            if self._connection is not None:
+                data = json.dumps([entry.to_fields() for entry in entries])
+
+                with self._connection:
+                    self._connection.execute("INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?, ?)",
+                                             key + (now, now, data))
+
+                    # forget results that have expired or that haven't been used for the longest
+                    self._connection.execute("DELETE FROM searches WHERE fetched_at < ?", (now - self.ttl,))
+                    self._connection.execute("DELETE FROM searches WHERE rowid NOT IN (SELECT rowid FROM searches "
+                                             "ORDER BY used_at DESC LIMIT ?)", (self.max_entries,))
+
+    def clear(self):
+        """Forget the results of every search"""
+        with self._lock:
+            self._entries.clear()
+
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.execute("DELETE FROM searches")
+
+    def _remember(self, key, cached):
+        """Keep the results of a search in memory as the most recently used (must hold the lock)
+
+        :param key: A tuple (media type, normalised query)
+        :param cached: A tuple (fetched at, list of records.SearchEntry)
+        """
+        self._entries[key] = cached
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# the cache shared by the whole program, created on first use
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Get the shared search cache, opening it in the data directory on first use unless SEARCH_CACHE says otherwise
+
+    :return: A SearchCache
+    """
+    global _cache
+
+    with _cache_lock:
+        if _cache is None:
+            if SEARCH_CACHE == "off":
+                _cache = SearchCache(max_entries=0)
+            elif SEARCH_CACHE == "memory":
+                _cache = SearchCache()
+            else:
+                _cache = SearchCache(os.path.join(DATA_DIR, CACHE_FILENAME))
+        return _cache
+
+
+def set_cache(cache):
+    """Replace the shared search cache, e.g. with one that is only kept in memory
+
+    :param cache: A SearchCache
+    """
+    global _cache
+
+    with _cache_lock:
+        _cache = cache
@@ -16,6 +16,38 @@ class TestGetUserCredentials(unittest.TestCase):
                 self.assertEqual(auth._get_user_credentials(), (key, cases[key]))
 
 
+class TestRememberedLogin(unittest.TestCase):
+    def setUp(self):
+        self.cache = mock.Mock()
+        self.cache.load.return_value = ("user", "password")
+        auth.credcache.set_cache(self.cache)
+        self.addCleanup(auth.credcache.set_cache, None)
+
+    def test_used_without_asking(self):
+        with mock.patch.object(auth, "_check_credentials", return_value=mock.Mock(status_code=200)), \
+                mock.patch("click.prompt") as prompt:
+            credentials = auth.authenticate_user()
+            self.assertEqual(auth.confirm_login(credentials), ("user", "password"))
+
+        prompt.assert_not_called()
+        self.cache.save.assert_called_once_with(("user", "password"))
+
+    def test_turned_down(self):
+        with mock.patch.object(auth, "_check_credentials", return_value=mock.Mock(status_code=401)):
+            credentials = auth.authenticate_user()
+
+            self.cache.load.return_value = None
+            with mock.patch.object(auth, "_get_user_credentials", return_value=("user", "new")) as ask, \
+                    mock.patch("click.echo"):
+                auth._check_credentials.return_value = mock.Mock(status_code=200)
+                auth._login_check.result()
+
+                self.assertEqual(auth.confirm_login(credentials), ("user", "new"))
+
+        ask.assert_called_once_with()
+        self.cache.forget.assert_called_once_with()
+
+
 # class TestAuthenticateUser(unittest.TestCase):
 #     def test_invalid_credentials(self):
 #         with mock.patch("auth._get_user_credentials", return_value=("username", "password")):
@@ -0,0 +1,79 @@
+import io
+import unittest
+from unittest import mock
+
+import requests
+import urllib3
+
+from menuinterface import search
+
+searchcache = search.searchcache
+
+
+class BrokenStream:
+    """The raw stream of a response whose connection drops after the first chunk"""
+
+    def stream(self, chunk_size, decode_content=True):
+        yield b"<?xml version=\"1.0\"?><anime><entry><id>1</id><tit"
+        raise urllib3.exceptions.ProtocolError("Connection broken")
+
+    def close(self):
+        pass
+
+
+def make_response(status_code, raw):
+    """Create a streamed response with a given body
+
+    :param status_code: An int, the status code of the response
+    :param raw: A file-like object with a stream method, the body of the response
+    :return: A requests.Response
+    """
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = raw
+
+    return response
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        searchcache.set_cache(searchcache.SearchCache())
+        self.addCleanup(searchcache.set_cache, None)
+
+    def search(self, response):
+        with mock.patch.object(search.requests, "get", return_value=response), \
+                mock.patch("click.prompt", return_value="naruto"), mock.patch("click.pause"), \
+                mock.patch("click.echo") as echo:
+            result = search.search(("user", "password"), "anime")
+
+        return result, [call[0][0] for call in echo.call_args_list if call[0]]
+
+    def test_error_status(self):
+        result, messages = self.search(make_response(503, io.BytesIO(b"")))
+
+        self.assertIsNone(result)
+        self.assertIn("Error searching for anime. Please try again.", messages)
+        self.assertIsNone(searchcache.get_cache().get("anime", "naruto"))
+
+    def test_empty_body(self):
+        result, messages = self.search(make_response(200, io.BytesIO(b"")))
+
+        self.assertIsNone(result)
+        self.assertIn("Error searching for anime. Please try again.", messages)
+
+    def test_connection_lost_while_reading(self):
+        result, messages = self.search(make_response(200, BrokenStream()))
+
+        self.assertIsNone(result)
+        self.assertIn("Error searching for anime. Please try again.", messages)
+
+    def test_no_results(self):
+        result, messages = self.search(make_response(204, io.BytesIO(b"")))
+
+        self.assertIsNone(result)
+        self.assertIn("No results found for query \"naruto\"", messages)
+        self.assertEqual(searchcache.get_cache().get("anime", "naruto"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import io
+import unittest
+from unittest import mock
+
+from menuinterface import update
+from menuinterface.tests.test_search import BrokenStream, make_response
+
+LIST_XML = b"<?xml version=\"1.0\"?><myanimelist><anime><series_animedb_id>20</series_animedb_id>" \
+           b"<series_title>Naruto</series_title><series_synonyms></series_synonyms><series_type>1</series_type>" \
+           b"<series_episodes>220</series_episodes><my_watched_episodes>3</my_watched_episodes><my_score>0</my_score>" \
+           b"<my_status>1</my_status></anime></myanimelist>"
+
+
+class TestSearchList(unittest.TestCase):
+    def search_list(self, response):
+        with mock.patch.object(update.requests, "get", return_value=response), \
+                mock.patch("click.prompt", return_value="naruto"), mock.patch("click.pause"), \
+                mock.patch("click.echo") as echo:
+            result = update.search_list("user", "anime")
+
+        return result, [call[0][0] for call in echo.call_args_list if call[0]]
+
+    def test_found(self):
+        result, _ = self.search_list(make_response(200, io.BytesIO(LIST_XML)))
+
+        self.assertEqual(result.title, "Naruto")
+
+    def test_error_status(self):
+        result, messages = self.search_list(make_response(401, io.BytesIO(b"")))
+
+        self.assertIsNone(result)
+        self.assertIn("Error getting your anime list. Please try again.", messages)
+
+    def test_connection_lost_while_reading(self):
+        result, messages = self.search_list(make_response(200, BrokenStream()))
+
+        self.assertIsNone(result)
+        self.assertIn("Error getting your anime list. Please try again.", messages)
+
+
+class TestViewList(unittest.TestCase):
+    def view_list(self, response):
+        with mock.patch.object(update.requests, "get", return_value=response), mock.patch("click.pause"), \
+                mock.patch("click.echo") as echo:
+            update.view_list("user", "anime")
+
+        return [call[0][0] for call in echo.call_args_list if call[0]]
+
+    def test_view(self):
+        messages = self.view_list(make_response(200, io.BytesIO(LIST_XML)))
+
+        self.assertTrue(messages[0].startswith("1> Naruto"))
+
+    def test_empty_body(self):
+        messages = self.view_list(make_response(200, io.BytesIO(b"")))
+
+        self.assertEqual(messages, ["Error getting your anime list. Please try again."])
+
+    def test_error_status(self):
+        messages = self.view_list(make_response(500, io.BytesIO(b"")))
+
+        self.assertEqual(messages, ["Error getting your anime list. Please try again."])
+
+
+if __name__ == '__main__':
+    unittest.main()
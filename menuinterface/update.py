@@ -1,8 +1,11 @@
 import click
+from lxml import etree
 import requests
-from bs4 import BeautifulSoup
 
+import constants
 import helpers
+import records
+import xmlstream
 from constants import ANIME_STATUS_MAP, ANIME_TYPE_MAP, MANGA_STATUS_MAP, MANGA_TYPE_MAP
 
 
@@ -11,7 +14,7 @@ def _update_anime_list_entry(credentials, field_type, anime_entry, new_value=Non
 
     :param credentials: A tuple containing valid MAL account details in the format (username, password)
     :param field_type: A string, the detail to update, must be either "episode", "status" or "score"
-    :param anime_entry: A beautiful soup tag, the entry on the list to update
+    :param anime_entry: A records.AnimeListEntry, the entry on the list to update
     :param new_value: An int (or string) or None, the new value to set for the field_type
     """
 
@@ -33,10 +36,10 @@ def _update_anime_list_entry(credentials, field_type, anime_entry, new_value=Non
         if field_type == "episode":
             # we are are incrementing the count
             if new_value is None:
-                current_ep_count = int(anime_entry.my_watched_episodes.get_text())
+                current_ep_count = anime_entry.watched_episodes
                 new_value = current_ep_count + 1
 
-            series_episodes = int(anime_entry.series_episodes.get_text())
+            series_episodes = anime_entry.series_episodes
 
             # check if the user has reached the last episode
             if new_value == series_episodes and series_episodes != 0:
@@ -45,27 +48,27 @@ def _update_anime_list_entry(credentials, field_type, anime_entry, new_value=Non
                     xml_field_tags += xml_tag_format.format("status", "2")
                     new_status = 2
             # check if the user has a status of not watching
-            elif anime_entry.my_status.get_text() != "1":
+            elif anime_entry.status != "1":
                 if click.confirm("Do you wish to change the status to watching?"):
                     xml_field_tags += xml_tag_format.format("status", "1")
                     new_status = 1
 
         # set the number of episodes to number in series if status set to completed
-        elif field_type == "status" and new_value == 2 and anime_entry.series_episodes.get_text() != "0":
-            xml_field_tags += xml_tag_format.format("episode", anime_entry.series_episodes.get_text())
+        elif field_type == "status" and new_value == 2 and anime_entry.series_episodes != 0:
+            xml_field_tags += xml_tag_format.format("episode", anime_entry.series_episodes)
 
         xml_field_tags += xml_tag_format.format(field_type, new_value)
 
         # prepare xml data and url for sending to server
         xml = '<?xml version="1.0" encoding="UTF-8"?><entry>{}</entry>'.format(xml_field_tags)
-        url = "https://myanimelist.net/api/animelist/update/{}.xml".format(anime_entry.series_animedb_id.get_text())
+        url = "{}/api/animelist/update/{}.xml".format(constants.BASE_URL, anime_entry.series_id)
 
         # send the request to the server, uses GET due to bug in API handling POST requests
         r = requests.get(url, params={"data": xml}, auth=credentials)
 
         # inform the user whether the request was successful or not
         if r.status_code == 200:
-            anime_title = anime_entry.series_title.get_text()
+            anime_title = anime_entry.title
             updated_msg_format = 'Updated "{}" to {} "{}".'
             updated_msg = updated_msg_format.format(anime_title, field_type, new_value)
 
@@ -149,7 +152,7 @@ def _update_manga_list_entry(credentials, field_type, manga_entry, new_value=Non
 
     :param credentials: A tuple containing valid MAL account details in the format (username, password)
     :param field_type: A string, the detail to update, must be either "chapter", "volume", "status" or "score"
-    :param manga_entry: A beautiful soup tag, the entry on the list to update
+    :param manga_entry: A records.MangaListEntry, the entry on the list to update
     :param new_value: An int (or string) or None, the new value to set for the field_type
     """
 
@@ -161,7 +164,7 @@ def _update_manga_list_entry(credentials, field_type, manga_entry, new_value=Non
 
     # check the searching the list returned a valid result
     if manga_entry is not None:
-        manga_title = manga_entry.series_title.get_text()
+        manga_title = manga_entry.title
 
         xml_tag_format = "<{0}>{1}</{0}>"
         xml_field_tags = ""
@@ -173,13 +176,13 @@ def _update_manga_list_entry(credentials, field_type, manga_entry, new_value=Non
             # we are incrementing the count
             if new_value is None:
                 if field_type == "chapter":
-                    current_value = int(manga_entry.my_read_chapters.get_text())
+                    current_value = manga_entry.read_chapters
                 else:
-                    current_value = int(manga_entry.my_read_volumes.get_text())
+                    current_value = manga_entry.read_volumes
                 new_value = current_value + 1
 
-            series_chapters = int(manga_entry.series_chapters.get_text())
-            series_volumes = int(manga_entry.series_volumes.get_text())
+            series_chapters = manga_entry.series_chapters
+            series_volumes = manga_entry.series_volumes
 
             # check if the user has reached either the last chapter or last volume
             if (new_value == series_chapters and field_type == "chapter" and series_chapters != 0) or \
@@ -192,24 +195,24 @@ def _update_manga_list_entry(credentials, field_type, manga_entry, new_value=Non
                     xml_field_tags += xml_tag_format.format("volume", series_volumes)
                     new_status = 2
             # check if the user has a status of not reading
-            elif manga_entry.my_status.get_text() != "1":
+            elif manga_entry.status != "1":
                 if click.confirm("Do you wish to change the status to watching?"):
                     xml_field_tags += xml_tag_format.format("status", "1")
                     new_status = 1
 
         # set the number of chapters and volumes to number in series if status set to completed
         elif field_type == "status" and new_value == 2:
-            if manga_entry.series_chapters.get_text() != "0":
-                xml_field_tags += xml_tag_format.format("chapter", manga_entry.series_chapters.get_text())
-            if manga_entry.series_volumes.get_text() != "0":
-                xml_field_tags += xml_tag_format.format("volume", manga_entry.series_volumes.get_text())
+            if manga_entry.series_chapters != 0:
+                xml_field_tags += xml_tag_format.format("chapter", manga_entry.series_chapters)
+            if manga_entry.series_volumes != 0:
+                xml_field_tags += xml_tag_format.format("volume", manga_entry.series_volumes)
 
         if new_status != 2:
             xml_field_tags += xml_tag_format.format(field_type, new_value)
 
         # prepare xml data and url for sending to server
         xml = '<?xml version="1.0" encoding="UTF-8"?><entry>{}</entry>'.format(xml_field_tags)
-        url = "https://myanimelist.net/api/mangalist/update/{}.xml".format(manga_entry.series_mangadb_id.get_text())
+        url = "{}/api/mangalist/update/{}.xml".format(constants.BASE_URL, manga_entry.series_id)
 
         # send the request to the server, uses GET due to bug in API handling POST requests
         r = requests.get(url, params={"data": xml}, auth=credentials)
@@ -330,7 +333,7 @@ def search_list(username, search_type):
 
     :param username: A string, the username of a MAL user
     :param search_type: A string, must be either "anime" or "manga"
-    :return: A beautiful soup tag or None if unsuccessful
+    :return: A records.ListEntry or None if unsuccessful
     """
 
     if search_type not in ["anime", "manga"]:
@@ -349,30 +352,40 @@ def search_list(username, search_type):
         search_tokens = search_lower.split()
 
         # make the request to the server and get the results
-        r = requests.get("https://myanimelist.net/malappinfo.php", params={"u": username, "type": search_type},
+        r = requests.get("{}/malappinfo.php".format(constants.BASE_URL), params={"u": username, "type": search_type},
                          stream=True)
-        r.raw.decode_content = True
 
-        soup = BeautifulSoup(r.raw, "xml")
+        if r.status_code != 200:
+            click.echo("Error getting your {} list. Please try again.".format(search_type))
+            click.pause()
+            return
 
         matches = []
 
-        # iterate over the returned entries for the search type
-        for entry in soup.find_all(search_type):
-            # normalise the title and synonyms to lowercase
-            series_title_lower = entry.series_title.get_text().lower()
-            series_synonyms_lower = entry.series_synonyms.get_text().lower()
+        try:
+            # iterate over the entries as they are parsed from the response
+            for fields in xmlstream.iter_response_entries(r, search_type):
+                entry = records.list_entry(search_type, fields)
 
-            # if the whole search string matches the entry then add it to our list of matches
-            if search_lower in series_title_lower or search_lower in series_synonyms_lower:
-                matches.append(entry)
-                continue
+                # normalise the title and synonyms to lowercase
+                series_title_lower = entry.title.lower()
+                series_synonyms_lower = entry.synonyms.lower()
 
-            # check if any of our tokens matches the entry
-            for token in search_tokens:
-                if token in series_title_lower or token in series_synonyms_lower:
+                # if the whole search string matches the entry then add it to our list of matches
+                if search_lower in series_title_lower or search_lower in series_synonyms_lower:
                     matches.append(entry)
-                    break
+                    continue
+
+                # check if any of our tokens matches the entry
+                for token in search_tokens:
+                    if token in series_title_lower or token in series_synonyms_lower:
+                        matches.append(entry)
+                        break
+        except (etree.XMLSyntaxError, requests.exceptions.RequestException):
+            # the connection can still fail partway through the list
+            click.echo("Error getting your {} list. Please try again.".format(search_type))
+            click.pause()
+            return
 
         num_results = len(matches)
 
@@ -389,9 +402,8 @@ def search_list(username, search_type):
 
             # iterate over the matches and print them out
             for i in range(len(matches)):
-                title_format = "{}> {} ({})" if matches[i].series_synonyms.get_text() != "" else "{}> {}"
-                click.echo(title_format.format(i + 1, matches[i].series_title.get_text(),
-                                               matches[i].series_synonyms.get_text()))
+                title_format = "{}> {} ({})" if matches[i].synonyms != "" else "{}> {}"
+                click.echo(title_format.format(i + 1, matches[i].title, matches[i].synonyms))
 
             click.echo("{}> [None of these]".format(num_results + 1))
 
@@ -419,36 +431,44 @@ def view_list(username, search_type):
         raise ValueError("Invalid argument for {}, must be either {} or {}.".format(search_type, "anime", "manga"))
 
     # the base url of the user list xml data
-    malappinfo = "https://myanimelist.net/malappinfo.php"
+    malappinfo = "{}/malappinfo.php".format(constants.BASE_URL)
 
     # make the request to the server and get the results
     r = requests.get(malappinfo, params={"u": username, "type": search_type}, stream=True)
-    r.raw.decode_content = True
 
-    soup = BeautifulSoup(r.raw, "xml")
+    if r.status_code != 200:
+        click.echo("Error getting your {} list. Please try again.".format(search_type))
+        click.pause()
+        return
 
     i = 1
-    for entry in soup.find_all(search_type):
-        # use a different layout depending on whether it is anime or manga
-        layout_string = "{}> {}" + ("\n    - {}: {}" * (4 if search_type == "anime" else 5))
-
-        if search_type == "anime":
-            click.echo(layout_string.format(
-                i, entry.series_title.get_text(),
-                "Status", ANIME_STATUS_MAP[entry.my_status.get_text()],
-                "Score", entry.my_score.get_text(),
-                "Type", ANIME_TYPE_MAP[entry.series_type.get_text()],
-                "Progress", entry.my_watched_episodes.get_text() + "/" + entry.series_episodes.get_text()))
-        else:
-            click.echo(layout_string.format(
-                i, entry.series_title.get_text(),
-                "Status", MANGA_STATUS_MAP[entry.my_status.get_text()],
-                "Score", entry.my_score.get_text(),
-                "Type", MANGA_TYPE_MAP[entry.series_type.get_text()],
-                "Chapters", entry.my_read_chapters.get_text() + "/" + entry.series_chapters.get_text(),
-                "Volumes", entry.my_read_volumes.get_text() + "/" + entry.series_volumes.get_text()))
-
-        i += 1
+    try:
+        for fields in xmlstream.iter_response_entries(r, search_type):
+            entry = records.list_entry(search_type, fields)
+
+            # use a different layout depending on whether it is anime or manga
+            layout_string = "{}> {}" + ("\n    - {}: {}" * (4 if search_type == "anime" else 5))
+
+            if search_type == "anime":
+                click.echo(layout_string.format(
+                    i, entry.title,
+                    "Status", ANIME_STATUS_MAP[entry.status],
+                    "Score", entry.score,
+                    "Type", ANIME_TYPE_MAP[entry.series_type],
+                    "Progress", "{}/{}".format(entry.watched_episodes, entry.series_episodes)))
+            else:
+                click.echo(layout_string.format(
+                    i, entry.title,
+                    "Status", MANGA_STATUS_MAP[entry.status],
+                    "Score", entry.score,
+                    "Type", MANGA_TYPE_MAP[entry.series_type],
+                    "Chapters", "{}/{}".format(entry.read_chapters, entry.series_chapters),
+                    "Volumes", "{}/{}".format(entry.read_volumes, entry.series_volumes)))
+
+            i += 1
+    except (etree.XMLSyntaxError, requests.exceptions.RequestException):
+        # the connection can still fail partway through the list
+        click.echo("Error getting your {} list. Please try again.".format(search_type))
 
     click.pause()
 
@@ -472,4 +492,4 @@ def view_manga_list(credentials):
 
 
 def echo_entry_title(entry):
-    click.echo("Updating details for the entry \"{}\"...".format(entry.series_title.get_text()))
+    click.echo("Updating details for the entry \"{}\"...".format(entry.title))
@@ -0,0 +1,69 @@
+from collections import OrderedDict
+
+from lxml import etree
+
+
+# the bytes read from a response at a time
+CHUNK_SIZE = 64 * 1024
+
+
+def _iter_fields(events):
+    """Turn the end events of entry elements into their fields, throwing each entry away once it has been yielded
+
+    :param events: An iterable of (event, element) tuples from lxml
+    :return: A generator of OrderedDicts mapping the name of each child element of an entry to its text
+    """
+    for event, element in events:
+        # ignore comments and processing instructions, which don't have a string tag
+        yield OrderedDict((child.tag, child.text or "") for child in element if isinstance(child.tag, str))
+
+        # free the entry and any earlier siblings that are still attached to the root
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+def iter_entries(source, tag):
+    """Parse an XML document incrementally, yielding the fields of each entry as soon as it has been read
+
+    Each entry is thrown away once it has been yielded, so memory use stays flat however long the document is. Like
+    BeautifulSoup's "xml" parser, malformed markup (e.g. HTML entities that XML doesn't define) is skipped over rather
+    than stopping the parse.
+
+    :param source: A file-like object to read the document from
+    :param tag: A string, the name of the entry elements, e.g. "anime" for malappinfo.php or "entry" for search.xml
+    :return: A generator of OrderedDicts mapping the name of each child element of an entry to its text
+    """
+    return _iter_fields(etree.iterparse(source, events=("end",), tag=tag, recover=True, huge_tree=True))
+
+
+def iter_chunk_entries(chunks, tag):
+    """Parse an XML document that arrives in chunks, yielding the fields of each entry as soon as it has been read,
+    see iter_entries
+
+    :param chunks: An iterable of bytes, the document in order
+    :param tag: A string, the name of the entry elements
+    :return: A generator of OrderedDicts mapping the name of each child element of an entry to its text
+    :raises lxml.etree.XMLSyntaxError: If the document doesn't have any elements, e.g. because it was cut off
+    """
+    parser = etree.XMLPullParser(events=("end",), tag=tag, recover=True, huge_tree=True)
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from _iter_fields(parser.read_events())
+
+    parser.close()
+    yield from _iter_fields(parser.read_events())
+
+
+def iter_response_entries(response, tag):
+    """Parse the entries of a streamed response from MAL as they arrive
+
+    The body is read with iter_content, so a gzipped response is parsed as xml and a connection that fails partway
+    through raises a requests exception (e.g. requests.exceptions.ChunkedEncodingError) while iterating.
+
+    :param response: A requests.Response made with stream=True
+    :param tag: A string, the name of the entry elements
+    :return: A generator of OrderedDicts, see iter_entries
+    """
+    return iter_chunk_entries(response.iter_content(CHUNK_SIZE), tag)
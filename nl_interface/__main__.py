@@ -1,15 +1,99 @@
+import time
+
+# the time the program was launched, so that startup can be timed
+STARTED_AT = time.perf_counter()
+
+import sys
+
+import click
+
+import bootstrap
+import constants
+import credcache
 import ui
 
-def main():
-    """Main function"""
-    def import_agent():
-        """Wrapper for threaded action to import the agent module into global namespace"""
-        globals()["agent"] = __import__("agent")
 
-    ui.threaded_action(import_agent, "Loading program")
+@click.command()
+@click.option("--batch", "batch_file", type=click.File("r"), metavar="FILE",
+              help="Carry out the commands in FILE (- for stdin), one per line, instead of asking for them.")
+@click.option("--serve", is_flag=True, help="Run as a daemon that answers queries sent with --send.")
+@click.option("--send", "query", metavar="QUERY", help="Send QUERY to a running daemon and print its answer.")
+@click.option("--port", default=constants.DAEMON_PORT, help="The port the daemon listens on.")
+@click.option("--username", envvar="SAMMY_USERNAME", help="The MAL username to use with --batch or --send.")
+@click.option("--password", envvar="SAMMY_PASSWORD", help="The MAL password to use with --batch or --send.")
+@click.option("--ambiguity", type=click.Choice(["best", "skip"]), default="best",
+              help="With --batch or --serve, whether to choose the best match or skip the command when a title is "
+                   "ambiguous.")
+@click.option("--jobs", default=constants.BATCH_JOBS,
+              help="With --batch, the most commands to carry out at the same time.")
+@click.option("--verbose", is_flag=True, help="With --serve, log every request.")
+@click.option("--timings", is_flag=True, help="Report how long startup took.")
+def main(batch_file, serve, query, port, username, password, ambiguity, jobs, verbose, timings):
+    """Sammy, a natural language interface for MyAnimeList"""
+    policy = ui.AnswerPolicy.BEST if ambiguity == "best" else ui.AnswerPolicy.SKIP
+
+    # ask for the credentials if they weren't given (they must be given when the commands are read from stdin)
+    if (batch_file is not None or query is not None) and (username is None or password is None):
+        username = click.prompt("Please enter your username")
+        password = click.prompt("And now your password", hide_input=True)
+
+    if batch_file is not None:
+        import batch
+
+        sys.exit(batch.main(batch_file, (username, password), policy, jobs))
+
+    elif serve:
+        import daemon
+
+        daemon.serve(constants.DAEMON_HOST, port, policy, verbose)
+        return
+
+    elif query is not None:
+        # only the standard library is needed to talk to the daemon, so this returns quickly
+        import daemonclient
+
+        try:
+            status, body = daemonclient.send_query("http://{}:{}".format(constants.DAEMON_HOST, port),
+                                                   (username, password), query)
+        # the daemon isn't running or didn't answer in time
+        except OSError:
+            click.echo("Sammy> I couldn't reach the daemon. Start it with: python nl_interface --serve", err=True)
+            sys.exit(1)
+
+        if status != 200:
+            click.echo("Sammy> The daemon couldn't carry out the query ({}).".format(body["error"]), err=True)
+            sys.exit(1)
+
+        click.echo(body["output"], nl=False)
+
+        # like --batch, fail if the query wasn't understood
+        result = body["result"]
+        sys.exit(0 if result.get("operation") is not None or result.get("extra") is not None else 1)
+
+    # load the program and connect to MAL while the user is reading the welcome message and typing their credentials
+    startup = bootstrap.Bootstrap(STARTED_AT)
+
+    # a login remembered from an earlier run is used without asking and checked before the first command
+    cache = credcache.get_cache()
+    credentials = cache.load() if cache is not None else None
+    remembered = credentials is not None
+
+    bootstrap.greet(remembered)
+
+    if not remembered:
+        username = startup.ask(click.prompt, "Please enter your username")
+        password = startup.ask(click.prompt, "And now your password", hide_input=True)
+        credentials = (username, password)
+
+    agent = startup.wait(connected=not remembered)
+    user_session = agent.welcome(credentials, remembered)
+    startup.mark("ready")
+
+    if user_session is not None:
+        if timings:
+            agent.print_msg(startup.report())
 
-    if agent.welcome():
-        agent.get_query()
+        agent.get_query(user_session)
 
 if __name__ == "__main__":
     main()
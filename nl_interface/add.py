@@ -1,19 +1,21 @@
-import requests
+from collections import OrderedDict
 
 import agent
 import helpers
+import journal
+import liststore
 import network
 import search
 import ui
 
 
-def add_entry(credentials, entry_type, search_string=None, entry=None):
+def add_entry(session, entry_type, search_string=None, entry=None):
     """Add a new entry to the user's anime or manga list
 
-    :param credentials: A tuple containing valid MAL account details in the format (username, password)
+    :param session: A session.Session, the account whose list to add the entry to
     :param entry_type: A string, must be either "anime" or "manga"
     :param search_string: A string, the anime or manga the user wants to add to their list
-    :param entry: A beautiful soup tag, an entry to add
+    :param entry: A records.SearchEntry, an entry to add
     """
     if entry_type not in ["anime", "manga"]:
         raise ValueError("Invalid argument for {}, must be either {} or {}.".format(entry_type, "anime", "manga"))
@@ -23,18 +25,15 @@ def add_entry(credentials, entry_type, search_string=None, entry=None):
 
     if entry is None and search_string is not None:
         # search the database for the anime/manga the user wants added
-        entry = search.search(credentials, entry_type, search_string, display_details=False)
+        entry = search.search(session, entry_type, search_string, display_details=False)
 
         # if a valid entry entry wasn't returned
         if entry == search.StatusCode.NO_RESULTS or entry == search.StatusCode.USER_CANCELLED \
-                or entry == network.StatusCode.CONNECTION_ERROR or entry == network.StatusCode.OTHER_ERROR:
+                or isinstance(entry, network.StatusCode):
             return
 
-    # the format of an XML tag
-    xml_tag_format = "<{0}>{1}</{0}>"
-
-    # the tags that add to the XML string
-    xml_field_tags = ""
+    # the fields to send to MAL, in the order they should appear in the XML
+    fields = OrderedDict()
 
     # get the choice of status
     status = helpers.get_status_choice_from_user(entry_type, skip_option=False)
@@ -42,59 +41,67 @@ def add_entry(credentials, entry_type, search_string=None, entry=None):
     # if not plan to read
     if status != 6:
         # append the status tag to our xml string if the user didn't opt to skip
-        xml_field_tags += xml_tag_format.format("status", status)
+        fields["status"] = status
 
         if entry_type == "anime":
             # if status is completed
             if status == 2:
-                episodes = entry.episodes.get_text()
+                episodes = entry.episodes
             else:
                 # get the choice of episode count
-                episodes = helpers.get_new_count_from_user("episode", int(entry.episodes.get_text()))
+                episodes = helpers.get_new_count_from_user("episode", entry.episodes)
 
             # append the episode count if the user didn't opt to skip
             if episodes is not None:
-                xml_field_tags += xml_tag_format.format("episode", episodes)
+                fields["episode"] = episodes
         else:
             # if status is completed
             if status == 2:
-                chapters = entry.chapters.get_text()
-                volumes = entry.volumes.get_text()
+                chapters = entry.chapters
+                volumes = entry.volumes
             else:
                 # get the choice of chapter and volume count
-                chapters = helpers.get_new_count_from_user("chapter", int(entry.chapters.get_text()))
-                volumes = helpers.get_new_count_from_user("volume", int(entry.volumes.get_text()))
+                chapters = helpers.get_new_count_from_user("chapter", entry.chapters)
+                volumes = helpers.get_new_count_from_user("volume", entry.volumes)
 
             # append chapter and volume choice if the user didn't opt to skip
             if chapters is not None:
-                xml_field_tags += xml_tag_format.format("chapter", chapters)
+                fields["chapter"] = chapters
             if volumes is not None:
-                xml_field_tags += xml_tag_format.format("volume", volumes)
+                fields["volume"] = volumes
 
         # get the choice of score
         score = helpers.get_score_choice_from_user()
 
         # append score choice if the user didn't opt to skip
         if score is not None:
-            xml_field_tags += xml_tag_format.format("score", score)
+            fields["score"] = score
 
-        # form the XML string
-        xml = '<?xml version="1.0" encoding="UTF-8"?><entry>{}</entry>'.format(xml_field_tags)
+        new_entry = liststore.new_list_entry(entry, fields)
 
-        # prepare the url
-        url = "https://myanimelist.net/api/{}list/add/{}.xml".format(entry_type, entry.id.get_text())
+        # send the add request to the server, keeping it to be sent later if MAL can't be reached
+        r = journal.send_change(session, journal.Action.ADD, entry_type, entry.id, fields, entry.title, "Adding",
+                                new_entry)
 
-        # send the async add request to the server, use GET due to a bug with POST requests
-        r = ui.threaded_action(network.make_request, msg="Adding", request=requests.get, url=url, params={"data": xml},
-                               auth=credentials)
+        # MAL couldn't be reached, so add the entry to the stored copy of the list until it can be
+        if r is None:
+            if session.has_list(entry_type):
+                session.store.put_entry(session.username, entry_type, new_entry)
+            agent.print_msg("I couldn't reach MAL, so I will add \"{}\" to your {} list as soon as I can."
+                            .format(entry.title, entry_type))
+            return
 
         # if there was a connection error
-        if r == network.StatusCode.CONNECTION_ERROR:
-            agent.print_connection_error_msg()
+        if isinstance(r, network.StatusCode):
+            agent.print_network_error_msg(r)
             return
 
         # inform the user whether the request was successful or not
         if r.status_code == 201:
-            agent.print_msg("I successfully added \"{}\" to your {} list".format(entry.title.get_text(), entry_type))
+            # add the new entry to the stored copy of the list, if the list has been fetched before
+            if session.has_list(entry_type):
+                session.store.put_entry(session.username, entry_type, new_entry)
+
+            agent.print_msg("I successfully added \"{}\" to your {} list".format(entry.title, entry_type))
         else:
             agent.print_msg("I'm sorry, there was an error adding that to your list. {}".format(r.text))
@@ -1,17 +1,24 @@
+from concurrent.futures import Future
+import importlib
 import random
+import threading
 
 import click
 
-import add
-import auth
-import delete
-import network
 import query_processing as qp
-import search
-import update
+import ui
 
-# the pair of user credentials
-credentials = "default", "default"
+# the modules that log the user in and carry out commands, which (with requests, asyncio and lxml) are imported the
+# first time they are needed rather than with the agent, so that the first prompt doesn't wait for them (see preload)
+COMMAND_MODULES = ["network", "auth", "session", "journal", "writequeue", "search", "update", "add", "delete"]
+
+
+def preload():
+    """Import the modules that logging in and carrying out commands need, e.g. on a background thread while the user is
+    typing, so that the first command doesn't have to wait for them
+    """
+    for name in COMMAND_MODULES:
+        importlib.import_module(name)
 
 
 def print_msg(msg):
@@ -40,80 +47,196 @@ def print_connection_error_msg():
     print_msg("Oh no, there was an error connecting to MAL. Please check your internet connection")
 
 
-def authorise_user():
+def print_network_error_msg(status):
+    """Print out a message corresponding to a failed network request
+
+    :param status: A network.StatusCode enum value, the reason the request failed
+    """
+    import network
+
+    if status == network.StatusCode.CONNECTION_ERROR:
+        print_connection_error_msg()
+    elif status == network.StatusCode.TIMEOUT:
+        print_msg("MAL is taking too long to respond. Please try again in a little while.")
+    elif status == network.StatusCode.CIRCUIT_OPEN:
+        print_msg("MAL seems to be having problems right now, so I'm going to give it a break. Please try again soon.")
+    elif status == network.StatusCode.OTHER_ERROR:
+        print_msg("Some kind of error has occurred :'(")
+
+
+def authorise_user(credentials=None, remembered=False):
     """Get a pair of credentials from the user
 
-    :return: True is successfully authenticated, False if their was an error and user quit
+    :param credentials: A tuple of strings in the form (username, password) to try first, or None to ask for them
+    :param remembered: A boolean, whether the credentials were remembered from an earlier run, in which case they are
+                       used straight away and checked in the background (see confirm_login)
+    :return: A session.Session for the user if successfully authenticated, None if there was an error and user quit
     """
-    global credentials
+    import session
+
+    if credentials is not None and remembered:
+        user_session = session.Session(credentials)
+        user_session.login_check = Future()
+
+        # the prompt is shown straight away while the rest of the program loads in the background
+        threading.Thread(target=_start_remembered_login, args=(user_session,), daemon=True).start()
+
+        return user_session
+
+    import auth
+    import network
 
     while True:
         # get the pair of credentials from the user (username, password)
-        credentials = auth.get_user_credentials("Please enter your username", "And now your password")
+        if credentials is None:
+            credentials = auth.get_user_credentials("Please enter your username", "And now your password")
 
         # check that the credentials are valid
         result = auth.validate_credentials(credentials)
 
         if result is not network.StatusCode.SUCCESS:
-            if result == network.StatusCode.CONNECTION_ERROR:
-                print_connection_error_msg()
-            elif result == network.StatusCode.UNAUTHORISED:
+            if result == network.StatusCode.UNAUTHORISED:
                 print_msg("Something was wrong with the username or password :(")
-            elif result == network.StatusCode.OTHER_ERROR:
-                print_msg("Some kind of error has occurred :'(")
+            else:
+                print_network_error_msg(result)
 
             if click.confirm("Sammy> Do you want to try again?"):
+                credentials = None
                 continue
             else:
-                return False
+                return
 
-        return True
+        auth.remember_credentials(credentials)
 
+        # download and index the lists while the user reads the welcome text and types their first command
+        user_session = session.Session(credentials)
+        user_session.prefetch_lists()
 
-def welcome():
-    """Print out the welcome message and bootstrap program functionality
-    
-    :return: True if the user authenticated successfully, False otherwise
+        return user_session
+
+
+def _start_remembered_login(user_session):
+    """Start getting a remembered login's lists ready and check it with MAL, on a background thread since the modules
+    this needs may still be loading
+
+    :param user_session: A session.Session, whose login_check future is given the network.StatusCode of the check
+    """
+    try:
+        import auth
+
+        user_session.prefetch_lists()
+        result = auth.check_credentials(user_session.credentials)
+    except Exception as e:
+        # raised again by confirm_login
+        user_session.login_check.set_exception(e)
+    else:
+        user_session.login_check.set_result(result)
+
+
+def welcome(credentials=None, remembered=False):
+    """Log the user in and tell them whether it worked, once bootstrap.greet has welcomed them
+
+    :param credentials: A tuple of strings in the form (username, password) that the user typed while the program was
+                        loading, or None to ask for them
+    :param remembered: A boolean, whether the credentials were remembered from an earlier run
+    :return: A session.Session if the user authenticated successfully, None otherwise
     """
-    click.clear()
-    click.echo("====== MAL Natural Language Interface ======")
-    click.echo()
-    print_msg("Hello! My name is Sammy and I am your MyAnimeList digital assistant.")
-    print_msg("Before we get started, I need you to confirm your MAL account details.")
-    click.echo()
-
-    # authenticate the user, return True if successful, else False
-    if authorise_user():
+    # authenticate the user, return their session if successful, else None
+    user_session = authorise_user(credentials, remembered)
+
+    if user_session is not None and remembered:
+        print_msg("Welcome back, {}! What can I do for you today?".format(user_session.username))
+    elif user_session is not None:
         click.echo()
         print_msg("Yay, everything checked out! Let's get started.")
         print_msg("What can I do for you today?")
-        return True
     else:
         print_msg("Bye bye!")
-        return False
 
+    return user_session
+
+
+def confirm_login(user_session):
+    """Wait for the check of a remembered login to finish, asking the user to log in again if MAL turned it down
 
-def get_query():
-    """Get the query from the user and process it"""
+    :param user_session: A session.Session
+    :return: The session.Session to carry on with, or None if the user gave up logging in
+    """
+    login_check = user_session.login_check
+
+    if login_check is None:
+        return user_session
+
+    import auth
+    import network
+
+    try:
+        result = login_check.result() if login_check.done() else ui.threaded_action(login_check.result,
+                                                                                     "Authenticating")
+    except Exception:
+        # the check failed before MAL could answer, keep the login and let the commands report the problem
+        result = network.StatusCode.CONNECTION_ERROR
+
+    user_session.login_check = None
+
+    if result == network.StatusCode.UNAUTHORISED:
+        auth.forget_credentials()
+        user_session.cancel_prefetch()
+
+        print_msg("MAL didn't accept your saved account details, please enter them again.")
+        return authorise_user()
+    elif result == network.StatusCode.SUCCESS:
+        # start the remembered login's validity window again
+        auth.remember_credentials(user_session.credentials)
+
+    # if MAL couldn't be reached the commands will say so themselves
+    return user_session
+
+
+def get_query(user_session):
+    """Get the query from the user and process it
+
+    :param user_session: A session.Session, the account to carry out the queries for
+    """
     # keep prompting for a query until the user quits
     while True:
         click.echo()
-        query = click.prompt(credentials[0], prompt_suffix="> ")
+        query = click.prompt(user_session.username, prompt_suffix="> ")
         click.echo()
 
+        # make sure a remembered login still works before carrying out the first command with it
+        user_session = confirm_login(user_session)
+        if user_session is None:
+            print_msg("Bye bye!")
+            return
+
         # process the user query
-        processed = process_query(query)
+        processed = process_query(query, user_session)
 
-        # quit the program if the user decided
+        # quit the program if the user decided, once every change has reached MAL
         if processed == qp.Extras.EXIT:
+            user_session.cancel_prefetch()
+
+            import writequeue
+
+            queue = writequeue.get_queue()
+            if queue.pending_count():
+                ui.threaded_action(queue.flush, "Saving changes", writequeue.FLUSH_TIMEOUT)
             return
 
 
-def process_query(query):
+def process_query(query, user_session):
     """Process the user query and carry out the requested action
 
     :param query: A string, the raw user query
+    :param user_session: A session.Session, the account to carry out the query for
+    :return: A dictionary, the result of the query processing or Extras.EXIT if the user wants to quit
     """
+    import journal
+
+    # send any changes that were saved while MAL couldn't be reached
+    journal.replay_in_background(user_session)
+
     # process the query and get a dictionary with the result
     process_result = qp.process(query)
 
@@ -128,7 +251,7 @@ def process_query(query):
     # the user said hello
     if process_result["extra"] == qp.Extras.GREETING:
         greetings = ["Hi", "Hello", "Yo"]
-        print_msg("{}, {}!".format(random.choice(greetings), credentials[0]))
+        print_msg("{}, {}!".format(random.choice(greetings), user_session.username))
     # the user said thanks
     elif process_result["extra"] == qp.Extras.THANKS:
         thanks = ["No problem", "You're welcome", "Any time", "You are very welcome"]
@@ -136,100 +259,119 @@ def process_query(query):
 
     # search database queries
     if process_result["operation"] == qp.OperationType.SEARCH:
+        import search
+
         # search for an anime
         if process_result["type"] == qp.MediaType.ANIME:
-            search.search(credentials, "anime", process_result["term"])
+            search.search(user_session, "anime", process_result["term"])
         # search for a manga
         elif process_result["type"] == qp.MediaType.MANGA:
-            search.search(credentials, "manga", process_result["term"])
+            search.search(user_session, "manga", process_result["term"])
 
     # update list entry details queries
     elif process_result["operation"] == qp.OperationType.UPDATE:
+        import update
+
         # update anime
         if process_result["type"] == qp.MediaType.ANIME:
             # update anime status
             if process_result["modifier"] == qp.UpdateModifier.STATUS:
                 if process_result["value"] == qp.StatusType.WATCHING:
-                    update.update_anime_list_entry(credentials, "status", process_result["term"], 1)
+                    update.update_anime_list_entry(user_session, "status", process_result["term"], 1)
                 elif process_result["value"] == qp.StatusType.COMPLETED:
-                    update.update_anime_list_entry(credentials, "status", process_result["term"], 2)
+                    update.update_anime_list_entry(user_session, "status", process_result["term"], 2)
                 elif process_result["value"] == qp.StatusType.ON_HOLD:
-                    update.update_anime_list_entry(credentials, "status", process_result["term"], 3)
+                    update.update_anime_list_entry(user_session, "status", process_result["term"], 3)
                 elif process_result["value"] == qp.StatusType.DROPPED:
-                    update.update_anime_list_entry(credentials, "status", process_result["term"], 4)
+                    update.update_anime_list_entry(user_session, "status", process_result["term"], 4)
                 elif process_result["value"] == qp.StatusType.PLAN_TO_WATCH:
-                    update.update_anime_list_entry(credentials, "status", process_result["term"], 6)
+                    update.update_anime_list_entry(user_session, "status", process_result["term"], 6)
             # update anime score
             elif process_result["modifier"] == qp.UpdateModifier.SCORE:
-                update.update_anime_list_entry(credentials, "score", process_result["term"], process_result["value"])
+                update.update_anime_list_entry(user_session, "score", process_result["term"],
+                                               process_result["value"])
             # update anime episode count
             elif process_result["modifier"] == qp.UpdateModifier.EPISODE:
-                update.update_anime_list_entry(credentials, "episode", process_result["term"], process_result["value"])
+                update.update_anime_list_entry(user_session, "episode", process_result["term"],
+                                               process_result["value"])
         # update manga
         elif process_result["type"] == qp.MediaType.MANGA:
             # update manga status
             if process_result["modifier"] == qp.UpdateModifier.STATUS:
                 if process_result["value"] == qp.StatusType.READING:
-                    update.update_manga_list_entry(credentials, "status", process_result["term"], 1)
+                    update.update_manga_list_entry(user_session, "status", process_result["term"], 1)
                 elif process_result["value"] == qp.StatusType.COMPLETED:
-                    update.update_manga_list_entry(credentials, "status", process_result["term"], 2)
+                    update.update_manga_list_entry(user_session, "status", process_result["term"], 2)
                 elif process_result["value"] == qp.StatusType.ON_HOLD:
-                    update.update_manga_list_entry(credentials, "status", process_result["term"], 3)
+                    update.update_manga_list_entry(user_session, "status", process_result["term"], 3)
                 elif process_result["value"] == qp.StatusType.DROPPED:
-                    update.update_manga_list_entry(credentials, "status", process_result["term"], 4)
+                    update.update_manga_list_entry(user_session, "status", process_result["term"], 4)
                 elif process_result["value"] == qp.StatusType.PLAN_TO_READ:
-                    update.update_manga_list_entry(credentials, "status", process_result["term"], 6)
+                    update.update_manga_list_entry(user_session, "status", process_result["term"], 6)
             # update manga score
             elif process_result["modifier"] == qp.UpdateModifier.SCORE:
-                update.update_manga_list_entry(credentials, "score", process_result["term"], process_result["value"])
+                update.update_manga_list_entry(user_session, "score", process_result["term"],
+                                               process_result["value"])
             # update manga chapter count
             elif process_result["modifier"] == qp.UpdateModifier.CHAPTER:
-                update.update_manga_list_entry(credentials, "chapter", process_result["term"], process_result["value"])
+                update.update_manga_list_entry(user_session, "chapter", process_result["term"],
+                                               process_result["value"])
             # update manga volume count
             elif process_result["modifier"] == qp.UpdateModifier.VOLUME:
-                update.update_manga_list_entry(credentials, "volume", process_result["term"], process_result["value"])
+                update.update_manga_list_entry(user_session, "volume", process_result["term"],
+                                               process_result["value"])
 
     # increment counts for list entries
     elif process_result["operation"] == qp.OperationType.UPDATE_INCREMENT:
+        import update
+
         # increment episode count for anime
         if process_result["type"] == qp.MediaType.ANIME:
-            update.update_anime_list_entry(credentials, "episode", process_result["term"])
+            update.update_anime_list_entry(user_session, "episode", process_result["term"])
         # increment manga counts
         elif process_result["type"] == qp.MediaType.MANGA:
             # increment chapter count for manga
             if process_result["modifier"] == qp.UpdateModifier.CHAPTER:
-                update.update_manga_list_entry(credentials, "chapter", process_result["term"])
+                update.update_manga_list_entry(user_session, "chapter", process_result["term"])
             # increment volume count for manga
             elif process_result["modifier"] == qp.UpdateModifier.VOLUME:
-                update.update_manga_list_entry(credentials, "volume", process_result["term"])
+                update.update_manga_list_entry(user_session, "volume", process_result["term"])
 
     # add new entry queries
     elif process_result["operation"] == qp.OperationType.ADD:
+        import add
+
         # add new anime entry
         if process_result["type"] == qp.MediaType.ANIME:
-            add.add_entry(credentials, "anime", process_result["term"])
+            add.add_entry(user_session, "anime", process_result["term"])
         # add new manga entry
         elif process_result["type"] == qp.MediaType.MANGA:
-            add.add_entry(credentials, "manga", process_result["term"])
+            add.add_entry(user_session, "manga", process_result["term"])
 
     # delete list entry queries
     elif process_result["operation"] == qp.OperationType.DELETE:
+        import delete
+
         # delete anime entry
         if process_result["type"] == qp.MediaType.ANIME:
-            delete.delete_entry(credentials, "anime", process_result["term"])
+            delete.delete_entry(user_session, "anime", process_result["term"])
         # delete manga entry
         elif process_result["type"] == qp.MediaType.MANGA:
-            delete.delete_entry(credentials, "manga", process_result["term"])
+            delete.delete_entry(user_session, "manga", process_result["term"])
 
     # view all list entries queries
     elif process_result["operation"] == qp.OperationType.VIEW_LIST:
+        import update
+
         # view anime list
         if process_result["type"] == qp.MediaType.ANIME:
-            update.view_list(credentials[0], "anime")
+            update.view_list(user_session, "anime")
         # view manga list
         elif process_result["type"] == qp.MediaType.MANGA:
-            update.view_list(credentials[0], "manga")
+            update.view_list(user_session, "manga")
 
     # default response if the system failed to understand the query
     elif process_result["extra"] is None:
         print_failure()
+
+    return process_result
@@ -1,7 +1,8 @@
-import requests
 import click
 from enum import Enum
 
+import client
+import credcache
 import network
 import ui
 
@@ -29,19 +30,15 @@ def get_user_credentials(username_msg, password_msg):
     return username, password
 
 
-def validate_credentials(credentials):
-    """Verify the validity of a pair of credentials
+def _check_credentials(credentials):
+    """Send a pair of credentials to MAL to be checked
 
     :param credentials: A tuple of strings in the form (username, password)
     :return: A network.StatusCode enum value
     """
-    # prepare the url
-    url = "https://myanimelist.net/api/account/verify_credentials.xml"
-
-    # send the async add request to the server
-    r = ui.threaded_action(network.make_request, msg="Authenticating", request=requests.get, url=url, auth=credentials)
+    r = client.run(client.verify_credentials(credentials))
 
-    if r == network.StatusCode.CONNECTION_ERROR:
+    if isinstance(r, network.StatusCode):
         return r
     elif r.status_code == 200:
         return network.StatusCode.SUCCESS
@@ -49,3 +46,42 @@ def validate_credentials(credentials):
         return network.StatusCode.UNAUTHORISED
     else:
         return network.StatusCode.OTHER_ERROR
+
+
+def check_credentials(credentials):
+    """Verify the validity of a pair of credentials without showing a loading animation, e.g. on a background thread
+
+    Checks of the same credentials that are already in progress (e.g. from the first few queries a daemon is sent by a
+    user) are waited for rather than sent again.
+
+    :param credentials: A tuple of strings in the form (username, password)
+    :return: A network.StatusCode enum value
+    """
+    return network.flights.do(("auth", credentials), _check_credentials, credentials)
+
+
+def validate_credentials(credentials):
+    """Verify the validity of a pair of credentials, see check_credentials
+
+    :param credentials: A tuple of strings in the form (username, password)
+    :return: A network.StatusCode enum value
+    """
+    # send the async verify request to the server
+    return ui.threaded_action(check_credentials, "Authenticating", credentials)
+
+
+def remember_credentials(credentials):
+    """Remember a login that MAL has accepted for later runs, if remembering logins has been turned on
+
+    :param credentials: A tuple of strings in the form (username, password)
+    """
+    cache = credcache.get_cache()
+    if cache is not None:
+        cache.save(credentials)
+
+
+def forget_credentials():
+    """Forget the remembered login, e.g. because MAL has turned it down"""
+    cache = credcache.get_cache()
+    if cache is not None:
+        cache.forget()
@@ -0,0 +1,208 @@
+from concurrent.futures import ThreadPoolExecutor
+import sys
+
+import click
+
+import agent
+import auth
+import constants
+import network
+import query_processing as qp
+import session
+import ui
+import writequeue
+
+# the operations on a single entry, which can run at the same time as operations on other entries
+ENTRY_OPERATIONS = [qp.OperationType.SEARCH, qp.OperationType.UPDATE, qp.OperationType.UPDATE_INCREMENT,
+                    qp.OperationType.ADD, qp.OperationType.DELETE]
+
+# the operations that change an entry already on a list, which are carried out one at a time for each list
+LIST_CHANGES = [qp.OperationType.UPDATE, qp.OperationType.UPDATE_INCREMENT, qp.OperationType.DELETE]
+
+
+def read_commands(lines):
+    """Get the commands from the lines of a batch file, skipping blank lines and comments starting with #
+
+    :param lines: An iterable of strings, e.g. an open file
+    :return: A generator of strings, the commands
+    """
+    for line in lines:
+        command = line.strip()
+        if command and not command.startswith("#"):
+            yield command
+
+
+def command_key(process_result):
+    """Get the key of the entry that a processed command applies to
+
+    Commands with the same key are carried out in the order they were given, commands with different keys may be carried
+    out at the same time. The key is the name the entry was given, so two names for the same entry (e.g. "naruto" and
+    "Naruto Shippuden") get different keys, which is why changes to entries on a list also wait for each other (see
+    list_key).
+
+    :param process_result: A dictionary, the result of query_processing.process
+    :return: A tuple (MediaType, string), or None if the command has to wait for every earlier command to finish
+    """
+    if process_result["operation"] not in ENTRY_OPERATIONS:
+        return None
+
+    return process_result["type"], process_result["term"].lower()
+
+
+def list_key(process_result):
+    """Get the key of the list that a processed command changes an entry on
+
+    Different names can pick out the same entry, so changes to a list are made in order, one at a time, to stop e.g.
+    two increments of the same episode count from overwriting each other. Adds and searches don't wait for them.
+
+    :param process_result: A dictionary, the result of query_processing.process
+    :return: A MediaType, or None if the command doesn't change an entry already on a list
+    """
+    if process_result["operation"] not in LIST_CHANGES:
+        return None
+
+    return process_result["type"]
+
+
+def is_understood(process_result):
+    """Check whether a processed command was understood
+
+    :param process_result: A dictionary, the result of query_processing.process
+    :return: A boolean
+    """
+    return process_result["operation"] is not None or process_result["extra"] is not None
+
+
+def run_command(query, user_session):
+    """Carry out a single command, collecting everything it prints
+
+    :param query: A string, the raw user query
+    :param user_session: A session.Session, the account to carry out the command for
+    :return: A string, what the command printed
+    """
+    def carry_out():
+        """Lay the output out like the interactive prompt in agent.get_query and carry out the command"""
+        click.echo()
+        click.echo("{}> {}".format(user_session.username, query))
+        click.echo()
+
+        agent.process_query(query, user_session)
+
+    # batch jobs give way to anyone using the prompt or the daemon at the same time
+    with network.priority(network.Priority.BACKGROUND):
+        return ui.capture_output(carry_out)[1]
+
+
+def _run_after(previous, query, user_session):
+    """Carry out a command once the earlier commands it has to wait for have finished
+
+    :param previous: A list of concurrent.futures.Future or None, the previous commands for the entry and list
+    :param query: A string, the raw user query
+    :param user_session: A session.Session, the account to carry out the command for
+    :return: A string, what the command printed
+    """
+    for future in previous:
+        if future is not None:
+            future.exception()
+
+    return run_command(query, user_session)
+
+
+def run_batch(commands, user_session, jobs=constants.BATCH_JOBS):
+    """Carry out a sequence of commands, running commands for different entries at the same time
+
+    The output of each command is printed in the order the commands were given. Viewing a list waits for every earlier
+    command to finish first, and an exit command stops the batch.
+
+    :param commands: An iterable of strings, the raw user queries
+    :param user_session: A session.Session, the account to carry out the commands for
+    :param jobs: An int, the most commands to carry out at the same time
+    :return: An int, the number of commands that weren't understood
+    """
+    stdout = sys.stdout
+    not_understood = 0
+
+    # the futures of the commands that haven't been printed yet, in order
+    pending = []
+
+    # the future of the latest command for each entry and of the latest change to each list
+    latest = {}
+
+    def print_pending():
+        """Print the output of every pending command in order, waiting for each to finish"""
+        for future in pending:
+            stdout.write(future.result())
+            stdout.flush()
+
+        pending.clear()
+        latest.clear()
+
+    sys.stdout = ui.ThreadOutput(stdout)
+
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for query in commands:
+                process_result = qp.process(query)
+
+                if process_result == qp.Extras.EXIT:
+                    break
+
+                not_understood += not is_understood(process_result)
+
+                key = command_key(process_result)
+
+                if key is None:
+                    # let every earlier command finish before carrying this one out
+                    print_pending()
+                    stdout.write(run_command(query, user_session))
+                else:
+                    # wait for the latest command for the entry, and for the latest change to the list if this is one
+                    keys = [key]
+                    if list_key(process_result) is not None:
+                        keys.append(list_key(process_result))
+
+                    future = executor.submit(_run_after, [latest.get(name) for name in keys], query, user_session)
+
+                    for name in keys:
+                        latest[name] = future
+                    pending.append(future)
+
+            print_pending()
+    finally:
+        sys.stdout = stdout
+
+    return not_understood
+
+
+def main(lines, credentials, policy=ui.AnswerPolicy.BEST, jobs=constants.BATCH_JOBS):
+    """Authenticate the user and carry out the commands in a batch file without prompting for anything
+
+    :param lines: An iterable of strings, the lines of the batch file
+    :param credentials: A tuple containing MAL account details in the format (username, password)
+    :param policy: A ui.AnswerPolicy enum value, how to answer questions such as which of several matches was meant
+    :param jobs: An int, the most commands to carry out at the same time
+    :return: An int, the exit status: 0 if every command was understood and every change saved, otherwise 1
+    """
+    ui.set_answer_policy(policy)
+
+    result = auth.validate_credentials(credentials)
+
+    if result is not network.StatusCode.SUCCESS:
+        if result == network.StatusCode.UNAUTHORISED:
+            agent.print_msg("Something was wrong with the username or password :(")
+        else:
+            agent.print_network_error_msg(result)
+        return 1
+
+    queue = writequeue.get_queue()
+    failures = queue.failures
+
+    not_understood = run_batch(read_commands(lines), session.Session(credentials), jobs)
+
+    # wait for the changes to reach MAL, the user has already been told about any that couldn't be saved
+    queue.flush(writequeue.FLUSH_TIMEOUT)
+
+    if not_understood:
+        agent.print_msg("I didn't understand {} of the commands.".format(not_understood))
+
+    return 1 if not_understood or queue.failures > failures else 0
@@ -0,0 +1,148 @@
+from collections import OrderedDict
+import importlib
+import threading
+import time
+
+import click
+
+import ui
+
+# what each step of startup is called when reporting how long it took
+STEP_NAMES = OrderedDict([
+    ("load", "program loaded"),
+    ("preload", "commands loaded"),
+    ("connect", "connected to MAL"),
+    ("ready", "ready")
+])
+
+
+def greet(remembered=False):
+    """Print out the welcome message, which only needs click so it can be shown before the program has loaded
+
+    :param remembered: A boolean, whether the user's login was remembered from an earlier run so they aren't asked it
+    """
+    click.clear()
+    click.echo("====== MAL Natural Language Interface ======")
+    click.echo()
+    click.echo("Sammy> Hello! My name is Sammy and I am your MyAnimeList digital assistant.")
+
+    if not remembered:
+        click.echo("Sammy> Before we get started, I need you to confirm your MAL account details.")
+        click.echo()
+
+
+class Bootstrap:
+    """Load the program and open a connection to MAL in the background while the user is logging in
+
+    Loading the program and the DNS, TCP and TLS handshakes with MAL both start on their own threads as soon as the
+    bootstrap is created, so by the time the user has typed their credentials they can be checked straight away over
+    the connection that is already open. The agent itself loads quickly, after which the modules it imports when they
+    are first needed (and with them requests, asyncio and lxml) are loaded on the same thread, see agent.preload.
+    """
+
+    def __init__(self, started_at=None):
+        """
+        :param started_at: A float, the time.perf_counter() the program was launched at, defaults to now
+        """
+        self.started_at = time.perf_counter() if started_at is None else started_at
+
+        # the seconds after launch that each step finished, keyed by the names in STEP_NAMES
+        self.timings = {}
+
+        # the seconds spent waiting for the user to type, which don't count against startup
+        self.user_time = 0.0
+
+        self._lock = threading.Lock()
+        self._agent = None
+        self._error = None
+
+        # set once the agent has been imported (or failed to), before the rest of the program has been
+        self._loaded = threading.Event()
+
+        self._threads = [threading.Thread(target=self._run, args=(step, function), daemon=True)
+                         for step, function in [("preload", self._load), ("connect", self._connect)]]
+        for thread in self._threads:
+            thread.start()
+
+    def _load(self):
+        """Import the agent and then the modules it imports when they are first needed"""
+        try:
+            self._agent = importlib.import_module("agent")
+            self.mark("load")
+        finally:
+            self._loaded.set()
+
+        self._agent.preload()
+
+    def _connect(self):
+        """Open a connection to MAL for the first request to reuse"""
+        importlib.import_module("network").warm_up()
+
+    def _run(self, step, function):
+        """Carry out a step of startup on a background thread and record when it finished
+
+        :param step: A string, the name of the step in STEP_NAMES
+        :param function: A function taking no args
+        """
+        try:
+            function()
+        except Exception as e:
+            # raised again on the main thread by wait
+            self._error = e
+
+        self.mark(step)
+
+    def mark(self, step):
+        """Record that a step of startup has finished
+
+        :param step: A string, the name of the step in STEP_NAMES
+        """
+        with self._lock:
+            self.timings[step] = time.perf_counter() - self.started_at
+
+    def ask(self, function, *args, **kwargs):
+        """Call a function that waits for the user, e.g. click.prompt, without counting the time against startup
+
+        :param function: The function to call
+        :param args: Args to pass to function
+        :param kwargs: Keyword args to pass to function
+        :return: The result of the function
+        """
+        start = time.perf_counter()
+
+        try:
+            return function(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.user_time += time.perf_counter() - start
+
+    def wait(self, connected=True):
+        """Wait for the program to load and the connection to open, showing a loading animation if they haven't yet
+
+        :param connected: A boolean, whether to wait for the whole program and the connection, which aren't needed
+                          straight away if the credentials aren't going to be checked before the first command, in
+                          which case only the agent is waited for
+        :return: The agent module
+        """
+        if connected and any(thread.is_alive() for thread in self._threads):
+            ui.threaded_action(lambda: [thread.join() for thread in self._threads], "Loading program")
+        elif not connected and not self._loaded.is_set():
+            ui.threaded_action(self._loaded.wait, "Loading program")
+
+        if self._error is not None:
+            raise self._error
+
+        return self._agent
+
+    def report(self):
+        """Describe how long startup took
+
+        :return: A string, e.g. "Started in 0.41s (3.20s more was spent logging in): program loaded after 0.30s, ..."
+        """
+        with self._lock:
+            total = self.timings.get("ready", time.perf_counter() - self.started_at)
+            steps = ", ".join("{} after {:.2f}s".format(name, self.timings[step])
+                              for step, name in STEP_NAMES.items() if step in self.timings)
+
+            return "Started in {:.2f}s ({:.2f}s more was spent logging in): {}".format(total - self.user_time,
+                                                                                   self.user_time, steps)
@@ -0,0 +1,186 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import threading
+import weakref
+
+import constants
+import network
+
+# the maximum number of requests to MAL that may be in flight at the same time
+MAX_CONCURRENT_REQUESTS = 8
+
+# the threads that requests are sent from, sharing the pooled session owned by the network module
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS)
+
+# a semaphore per event loop, asyncio primitives can't be shared between loops
+_semaphores = weakref.WeakKeyDictionary()
+_semaphores_lock = threading.Lock()
+
+
+def _check_media_type(media_type):
+    """Raise a ValueError if the media type isn't one that MAL supports
+
+    :param media_type: A string, should be either "anime" or "manga"
+    """
+    if media_type not in ["anime", "manga"]:
+        raise ValueError("Invalid argument for {}, must be either {} or {}.".format(media_type, "anime", "manga"))
+
+
+def _get_semaphore():
+    """Get the semaphore limiting the number of concurrent requests for the running event loop
+
+    :return: An asyncio.Semaphore
+    """
+    loop = asyncio.get_running_loop()
+
+    with _semaphores_lock:
+        if loop not in _semaphores:
+            _semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        return _semaphores[loop]
+
+
+def _call_with_priority(priority, function, *args, **kwargs):
+    """Call a function on a worker thread with the request priority of the thread that asked for it
+
+    :param priority: A network.Priority enum value
+    :param function: The function to call
+    :param args: Args to pass to function
+    :param kwargs: Keyword args to pass to function
+    :return: The result of the function
+    """
+    with network.priority(priority):
+        return function(*args, **kwargs)
+
+
+async def request(method, url, endpoint, **kwargs):
+    """Send a request to MAL without blocking the event loop
+
+    The request is made by network.make_request on a worker thread, so it gets the same connection pooling, timeouts,
+    rate limiting, retries and circuit breaking as synchronous requests do. It keeps the priority of the thread that
+    started it.
+
+    :param method: A string, the HTTP method, e.g. "get" or "delete"
+    :param url: A string, the url to send the request to
+    :param endpoint: A network.Endpoint enum value, the class of MAL endpoint the request is for
+    :param kwargs: Keyword args to pass to network.make_request
+    :return: A requests.Response or a network.StatusCode if the request failed
+    """
+    async with _get_semaphore():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(_call_with_priority, network.current_priority(),
+                                                                       network.make_request, method, url=url,
+                                                                       endpoint=endpoint, **kwargs))
+
+
+async def verify_credentials(credentials):
+    """Check a pair of credentials against MAL
+
+    :param credentials: A tuple of strings in the form (username, password)
+    :return: A requests.Response or a network.StatusCode if the request failed
+    """
+    url = "{}/api/account/verify_credentials.xml".format(constants.BASE_URL)
+    return await request("get", url, network.Endpoint.AUTH, auth=credentials)
+
+
+async def search(credentials, search_type, search_string):
+    """Search the MAL database for an anime or manga
+
+    :param credentials: A tuple containing valid MAL account details in the format (username, password)
+    :param search_type: A string, must be either "anime" or "manga"
+    :param search_string: A string, the anime or manga to search for
+    :return: A streamed requests.Response or a network.StatusCode if the request failed
+    """
+    _check_media_type(search_type)
+
+    url = "{}/api/{}/search.xml?q={}".format(constants.BASE_URL, search_type, search_string.replace(" ", "+"))
+    return await request("get", url, network.Endpoint.SEARCH, auth=credentials, stream=True)
+
+
+async def fetch_list(username, list_type, headers=None):
+    """Download a user's anime or manga list
+
+    :param username: A string, the username of a MAL user
+    :param list_type: A string, must be either "anime" or "manga"
+    :param headers: A dictionary or None, extra headers to send, e.g. If-None-Match to only download a changed list
+    :return: A streamed requests.Response or a network.StatusCode if the request failed
+    """
+    _check_media_type(list_type)
+
+    kwargs = {"headers": headers} if headers else {}
+
+    url = "{}/malappinfo.php".format(constants.BASE_URL)
+    return await request("get", url, network.Endpoint.LIST_READ, params={"u": username, "type": list_type},
+                         stream=True, **kwargs)
+
+
+async def fetch_lists(username, list_types=("anime", "manga")):
+    """Download several of a user's lists at the same time
+
+    :param username: A string, the username of a MAL user
+    :param list_types: An iterable of strings, each either "anime" or "manga"
+    :return: A dictionary mapping each list type to the result of fetch_list
+    """
+    results = await asyncio.gather(*[fetch_list(username, list_type) for list_type in list_types])
+    return dict(zip(list_types, results))
+
+
+async def add_entry(credentials, entry_type, entry_id, xml):
+    """Add a new entry to the user's anime or manga list
+
+    :param credentials: A tuple containing valid MAL account details in the format (username, password)
+    :param entry_type: A string, must be either "anime" or "manga"
+    :param entry_id: A string or int, the MAL database id of the entry
+    :param xml: A string, the XML document describing the entry's details
+    :return: A requests.Response or a network.StatusCode if the request failed
+    """
+    _check_media_type(entry_type)
+
+    # uses GET due to a bug in the API handling POST requests
+    url = "{}/api/{}list/add/{}.xml".format(constants.BASE_URL, entry_type, entry_id)
+    return await request("get", url, network.Endpoint.LIST_WRITE, params={"data": xml}, auth=credentials)
+
+
+async def update_entry(credentials, entry_type, entry_id, xml):
+    """Update an entry on the user's anime or manga list
+
+    :param credentials: A tuple containing valid MAL account details in the format (username, password)
+    :param entry_type: A string, must be either "anime" or "manga"
+    :param entry_id: A string or int, the MAL database id of the entry
+    :param xml: A string, the XML document with the fields to change
+    :return: A requests.Response or a network.StatusCode if the request failed
+    """
+    _check_media_type(entry_type)
+
+    # uses GET due to a bug in the API handling POST requests
+    url = "{}/api/{}list/update/{}.xml".format(constants.BASE_URL, entry_type, entry_id)
+    return await request("get", url, network.Endpoint.LIST_WRITE, params={"data": xml}, auth=credentials)
+
+
+async def delete_entry(credentials, entry_type, entry_id):
+    """Delete an entry from the user's anime or manga list
+
+    :param credentials: A tuple containing valid MAL account details in the format (username, password)
+    :param entry_type: A string, must be either "anime" or "manga"
+    :param entry_id: A string or int, the MAL database id of the entry
+    :return: A requests.Response or a network.StatusCode if the request failed
+    """
+    _check_media_type(entry_type)
+
+    url = "{}/api/{}list/delete/{}.xml".format(constants.BASE_URL, entry_type, entry_id)
+    return await request("delete", url, network.Endpoint.LIST_WRITE, auth=credentials)
+
+
+def run(coroutine):
+    """Run a coroutine to completion on a new event loop and return its result
+
+    Lets synchronous code (e.g. an action passed to ui.threaded_action) call the async functions in this module.
+
+    :param coroutine: A coroutine object
+    :return: The return value of the coroutine
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
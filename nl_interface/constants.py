@@ -1,5 +1,42 @@
 from collections import OrderedDict
+import os
 
+import click
+
+# the root of every MAL url, can be pointed at a stand-in server (e.g. python -m stubserver) with MAL_BASE_URL
+BASE_URL = os.environ.get("MAL_BASE_URL", "https://myanimelist.net").rstrip("/")
+
+# the directory where lists and other data are saved between runs, can be overridden with SAMMY_DATA_DIR
+DATA_DIR = os.environ.get("SAMMY_DATA_DIR") or click.get_app_dir("Sammy")
+
+# the similarity (0 to 1) the best title match must reach to be picked without asking the user which one they meant,
+# can be overridden with SAMMY_AUTO_SELECT_THRESHOLD (a value above 1 always asks)
+AUTO_SELECT_THRESHOLD = float(os.environ.get("SAMMY_AUTO_SELECT_THRESHOLD", 0.85))
+
+# the default number of commands from a batch file (python nl_interface --batch FILE) that are carried out at once
+BATCH_JOBS = 8
+
+# where the daemon (python nl_interface --serve) listens, always on this machine only
+DAEMON_HOST = "127.0.0.1"
+DAEMON_PORT = int(os.environ.get("SAMMY_DAEMON_PORT", 8750))
+
+# overrides for the requests per second allowed to each class of MAL endpoint, e.g. "search=1,list_read=0.5", see
+# network.RATE_LIMITS for the endpoints and their default rates (a rate of 0 turns the limit off)
+RATE_LIMITS = os.environ.get("SAMMY_RATE_LIMITS", "")
+
+# where the results of database searches are cached: "disk" to reuse them between runs (the default), "memory" to
+# only reuse them until the program exits or "off", can be overridden with SAMMY_SEARCH_CACHE
+SEARCH_CACHE = os.environ.get("SAMMY_SEARCH_CACHE", "disk").lower()
+
+# whether a login that MAL has accepted is remembered between runs, so the program can start without asking for it,
+# turned on by setting SAMMY_REMEMBER_LOGIN to 1
+REMEMBER_LOGIN = os.environ.get("SAMMY_REMEMBER_LOGIN", "").lower() in ["1", "true", "yes"]
+
+# the most matches to offer the user to choose from
+MAX_SUGGESTIONS = 10
+
+# the similarity (0 to 1) a misspelt title must reach to be suggested at all
+MIN_FUZZY_SIMILARITY = 0.3
 
 ANIME_STATUS_MAP = OrderedDict([
     ("1", "Watching"),
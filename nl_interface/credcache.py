@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+
+from constants import DATA_DIR, REMEMBER_LOGIN
+
+# the keyring package is optional, without it passwords are saved in the login file instead
+try:
+    import keyring
+    import keyring.errors
+except ImportError:
+    keyring = None
+
+# the name of the file in the data directory that a remembered login is saved in, readable only by the user
+LOGIN_FILENAME = "login.json"
+
+# the name passwords are saved under in the OS keyring
+KEYRING_SERVICE = "Sammy for MyAnimeList"
+
+# the seconds after it was last checked with MAL that a remembered login is used without asking the user for it
+VALID_FOR = 7 * 24 * 60 * 60
+
+
+class CredentialCache:
+    """A login that the user has asked to be remembered between runs, so that it doesn't have to be typed or checked
+    before the program can start
+
+    The username and the time the login was last accepted by MAL are saved in a file that only the user can read. The
+    password is saved in the OS keyring if the keyring package is installed and works, otherwise in the same file.
+    """
+
+    def __init__(self, path, valid_for=VALID_FOR, use_keyring=True):
+        """
+        :param path: A string, the path of the login file
+        :param valid_for: A number, the seconds after it was last checked that a login is still used
+        :param use_keyring: A boolean, whether to save the password in the OS keyring if it is available
+        """
+        self.path = path
+        self.valid_for = valid_for
+        self.use_keyring = use_keyring and keyring is not None
+
+        self._lock = threading.Lock()
+
+    def _read(self):
+        """Read the login file
+
+        :return: A dictionary, or None if there isn't a valid login file
+        """
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if isinstance(data, dict) and isinstance(data.get("username"), str):
+            return data
+
+    def load(self):
+        """Get the remembered login, unless it is too long since it was last checked
+
+        :return: A tuple of strings in the form (username, password), or None if there isn't a login to use
+        """
+        with self._lock:
+            data = self._read()
+
+            if data is None or time.time() - data.get("checked_at", 0) > self.valid_for:
+                return
+
+            password = data.get("password")
+
+            if password is None and self.use_keyring:
+                try:
+                    password = keyring.get_password(KEYRING_SERVICE, data["username"])
+                except keyring.errors.KeyringError:
+                    return
+
+            if isinstance(password, str):
+                return data["username"], password
+
+    def save(self, credentials):
+        """Remember a login that MAL has just accepted, starting its validity window again
+
+        :param credentials: A tuple of strings in the form (username, password)
+        """
+        username, password = credentials
+        data = {"username": username, "checked_at": time.time()}
+
+        with self._lock:
+            if not self._save_password(username, password):
+                data["password"] = password
+
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+            # write the new file with its permissions already restricted, then swap it in
+            temp_path = self.path + ".tmp"
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+            with os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "w") as f:
+                json.dump(data, f)
+
+            os.replace(temp_path, self.path)
+
+    def _save_password(self, username, password):
+        """Save a password in the OS keyring (must hold the lock)
+
+        :param username: A string
+        :param password: A string
+        :return: A boolean, False if the keyring isn't being used or couldn't save the password
+        """
+        if not self.use_keyring:
+            return False
+
+        try:
+            keyring.set_password(KEYRING_SERVICE, username, password)
+        except keyring.errors.KeyringError:
+            return False
+
+        return True
+
+    def forget(self):
+        """Forget the remembered login, e.g. because MAL no longer accepts it"""
+        with self._lock:
+            data = self._read()
+
+            if data is None:
+                return
+
+            if self.use_keyring and "password" not in data:
+                try:
+                    keyring.delete_password(KEYRING_SERVICE, data["username"])
+                except keyring.errors.KeyringError:
+                    pass
+
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+# the cache shared by the whole program, created on first use
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Get the shared credential cache, in the data directory
+
+    :return: A CredentialCache, or None if remembering logins hasn't been turned on with SAMMY_REMEMBER_LOGIN
+    """
+    global _cache
+
+    with _cache_lock:
+        if _cache is None and REMEMBER_LOGIN:
+            _cache = CredentialCache(os.path.join(DATA_DIR, LOGIN_FILENAME))
+        return _cache
+
+
+def set_cache(cache):
+    """Replace the shared credential cache, e.g. with one in a temporary location
+
+    :param cache: A CredentialCache or None to go back to the default
+    """
+    global _cache
+
+    with _cache_lock:
+        _cache = cache
@@ -0,0 +1,170 @@
+from enum import Enum
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+from socketserver import ThreadingMixIn
+import sys
+import threading
+
+import click
+
+import agent
+import auth
+import network
+import query_processing as qp
+import session
+import ui
+import writequeue
+
+
+def result_to_json(process_result):
+    """Convert the result of query_processing.process into something that can be encoded as JSON
+
+    :param process_result: A dictionary or Extras.EXIT
+    :return: A dictionary with each enum value replaced by its name, e.g. {"operation": "UPDATE", ...}
+    """
+    if process_result == qp.Extras.EXIT:
+        return {"extra": qp.Extras.EXIT.name}
+
+    return {name: value.name if isinstance(value, Enum) else value for name, value in process_result.items()}
+
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    """Answer queries sent by daemonclient, each carried out for the account whose credentials it was sent with"""
+
+    # keep connections alive so clients can reuse them
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        """Only log requests if the server was asked to be verbose"""
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        """Answer a GET request, used to check that the daemon is running and how hard the rate limits are biting"""
+        if self.path == "/status":
+            self.respond(200, {"status": "ok", "rate_limits": network.limiter_stats()})
+        else:
+            self.respond(404, {"error": "Not Found"})
+
+    def do_POST(self):
+        """Answer a POST request"""
+        if self.path == "/query":
+            self.handle_query()
+        else:
+            self.respond(404, {"error": "Not Found"})
+
+    def respond(self, status, body):
+        """Send a complete JSON response
+
+        :param status: An int, the HTTP status code
+        :param body: A dictionary, the response body
+        """
+        body = json.dumps(body).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_request(self):
+        """Read the JSON body of the request, responding with a 400 if it isn't valid
+
+        :return: A dictionary, or None if the body wasn't valid
+        """
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8"))
+        except (ValueError, UnicodeDecodeError):
+            body = None
+
+        if not isinstance(body, dict) or not all(isinstance(body.get(name), str)
+                                                 for name in ["query", "username", "password"]):
+            self.respond(400, {"error": "The body must be a JSON object with query, username and password strings"})
+            return
+
+        return body
+
+    def handle_query(self):
+        """Answer /query by carrying out the query and sending back its processed form and everything it printed"""
+        request = self.read_request()
+
+        if request is None:
+            return
+
+        user_session = self.server.get_session((request["username"], request["password"]))
+
+        if user_session == network.StatusCode.UNAUTHORISED:
+            self.respond(401, {"error": user_session.name})
+        elif isinstance(user_session, network.StatusCode):
+            self.respond(502, {"error": user_session.name})
+        else:
+            process_result, output = ui.capture_output(agent.process_query, request["query"], user_session)
+            self.respond(200, {"result": result_to_json(process_result), "output": output})
+
+
+class DaemonServer(ThreadingMixIn, HTTPServer):
+    """A threaded HTTP server that keeps the agent, lists and connections to MAL warm between queries"""
+
+    daemon_threads = True
+
+    def __init__(self, address, verbose=False):
+        """
+        :param address: A tuple (host, port), use port 0 to pick any free port
+        :param verbose: A boolean, whether to log every request to stderr
+        """
+        HTTPServer.__init__(self, address, DaemonRequestHandler)
+        self.verbose = verbose
+
+        # the session of each pair of credentials that MAL has accepted, so they are only checked once
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        """The url to point clients at, e.g. http://127.0.0.1:8750"""
+        host, port = self.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def get_session(self, credentials):
+        """Get the session for a pair of credentials, checking them with MAL unless they have already been accepted
+
+        :param credentials: A tuple of strings in the form (username, password)
+        :return: A session.Session, or a network.StatusCode enum value if the credentials couldn't be checked
+        """
+        with self._lock:
+            if credentials in self._sessions:
+                return self._sessions[credentials]
+
+        result = auth.validate_credentials(credentials)
+
+        if result != network.StatusCode.SUCCESS:
+            return result
+
+        with self._lock:
+            return self._sessions.setdefault(credentials, session.Session(credentials))
+
+
+def serve(host, port, policy=ui.AnswerPolicy.BEST, verbose=False):
+    """Run the daemon until it is interrupted
+
+    :param host: A string, the interface to listen on
+    :param port: An int, the port to listen on
+    :param policy: A ui.AnswerPolicy enum value, how to answer questions such as which of several matches was meant
+    :param verbose: A boolean, whether to log every request to stderr
+    """
+    # there is nobody at the terminal to answer questions, and the output of each query goes back to its client
+    ui.set_answer_policy(policy)
+    sys.stdout = ui.ThreadOutput(sys.stdout)
+
+    server = DaemonServer((host, port), verbose)
+
+    click.echo("Sammy is listening on {}".format(server.base_url))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        writequeue.get_queue().flush(writequeue.FLUSH_TIMEOUT)
+        sys.stdout = sys.stdout.stream
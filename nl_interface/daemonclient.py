@@ -0,0 +1,28 @@
+import json
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+# the seconds to wait for the daemon to carry out a query, which may involve several requests to MAL
+TIMEOUT = 60
+
+
+def send_query(base_url, credentials, query):
+    """Send a query to a running daemon (python nl_interface --serve) and get its answer
+
+    Only uses the standard library, so nothing heavier needs importing to talk to the daemon.
+
+    :param base_url: A string, the url the daemon is listening on, e.g. http://127.0.0.1:8750
+    :param credentials: A tuple of strings in the form (username, password)
+    :param query: A string, the raw user query
+    :return: A tuple (int, dictionary), the status code and JSON body of the response
+    """
+    body = json.dumps({"query": query, "username": credentials[0], "password": credentials[1]}).encode("utf-8")
+    request = Request(base_url + "/query", data=body, headers={"Content-Type": "application/json"})
+
+    try:
+        with urlopen(request, timeout=TIMEOUT) as response:
+            return response.status, json.loads(response.read().decode("utf-8"))
+    except HTTPError as e:
+        # error responses from the daemon still have a JSON body explaining them
+        with e:
+            return e.code, json.loads(e.read().decode("utf-8"))
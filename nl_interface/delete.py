@@ -1,16 +1,15 @@
-import click
-import requests
-
 import agent
+import journal
 import network
 import ui
 import update
+import writequeue
 
 
-def delete_entry(credentials, entry_type, search_string):
+def delete_entry(session, entry_type, search_string):
     """Delete an entry on the user's anime or manga list
 
-    :param credentials: A tuple containing valid MAL account details in the format (username, password)
+    :param session: A session.Session, the account whose list to delete the entry from
     :param entry_type: A string, must be either "anime" or "manga"
     :param search_string: A string, the entry the user wants to delete
     """
@@ -18,34 +17,49 @@ def delete_entry(credentials, entry_type, search_string):
         raise ValueError("Invalid argument for {}, must be either {} or {}.".format(entry_type, "anime", "manga"))
 
     # search the user's list for the relevant entry
-    entry = update.search_list(credentials[0], entry_type, search_string)
+    entry = update.search_list(session, entry_type, search_string)
 
     # if a valid entry wasn't returned
     if entry is None or entry == update.ListSearchStatusCode.USER_CANCELLED \
-            or entry == update.ListSearchStatusCode.NO_RESULTS:
+            or entry == update.ListSearchStatusCode.NO_RESULTS or isinstance(entry, network.StatusCode):
         return
 
     # confirm that this is what the user intended
-    if click.confirm("Sammy> Are you sure you want to delete \"{}\" from your {} list?".format(
-                     entry.series_title.get_text(), entry_type)):
+    if ui.confirm("Sammy> Are you sure you want to delete \"{}\" from your {} list?".format(
+                     entry.title, entry_type)):
 
         # get the entry id
-        entry_id = entry.series_animedb_id.get_text() if entry_type == "anime" \
-                                                      else entry.series_mangadb_id.get_text()
+        entry_id = entry.series_id
+
+        # make sure any changes to the entry reach MAL before it is deleted
+        queue = writequeue.get_queue()
+        if queue.pending_count():
+            ui.threaded_action(queue.flush, "Saving changes", writequeue.FLUSH_TIMEOUT)
 
-        # prepare the url
-        url = "https://myanimelist.net/api/{}list/delete/{}.xml".format(entry_type, entry_id)
+        # send the delete request to the server, keeping it to be sent later if MAL can't be reached
+        r = journal.send_change(session, journal.Action.DELETE, entry_type, entry_id, {}, entry.title, "Deleting")
 
-        # send the async delete request to the server
-        r = ui.threaded_action(network.make_request, msg="Deleting", request=requests.delete, url=url,
-                               auth=credentials)
+        # MAL couldn't be reached, so remove the entry from the stored copy of the list until it can be
+        if r is None:
+            session.store.delete_entry(session.username, entry_type, entry_id)
+            agent.print_msg("I couldn't reach MAL, so I will delete \"{}\" from your {} list as soon as I can."
+                            .format(entry.title, entry_type))
+            return
+
+        # check if there was an error with the user's internet connection
+        if isinstance(r, network.StatusCode):
+            agent.print_network_error_msg(r)
+            return
 
         # inform the user of the result
         if r.status_code == 200:
+            # remove the entry from the stored copy of the list too
+            session.store.delete_entry(session.username, entry_type, entry_id)
+
             agent.print_msg("I have successfully deleted \"{}\" from your {} list."
-                            .format(entry.series_title.get_text(), entry_type))
+                            .format(entry.title, entry_type))
         else:
             agent.print_msg("I'm sorry there was an error deleting \"{}\". {}"
-                            .format(entry.series_title.get_text(), r.text()))
+                            .format(entry.title, r.text))
     else:
         agent.print_msg("The delete operation was cancelled. Nothing was removed from your {} list.".format(entry_type))
@@ -1,6 +1,7 @@
 import click
 
 import constants
+import ui
 
 
 def get_status_choice_from_user(media_type, skip_option=True):
@@ -13,6 +14,10 @@ def get_status_choice_from_user(media_type, skip_option=True):
     if media_type not in ["anime", "manga"]:
         raise ValueError("Invalid argument for {}, must be either {} or {}.".format(media_type, "anime", "manga"))
 
+    # without a user to ask, skip the status if possible or else choose the first one (watching or reading)
+    if not ui.is_interactive():
+        return None if skip_option else 1
+
     # select the appropriate map
     status_map = constants.ANIME_STATUS_MAP if media_type == "anime" else constants.MANGA_STATUS_MAP
 
@@ -49,6 +54,10 @@ def get_score_choice_from_user():
 
     :return: An integer, the new score or None if the user cancelled
     """
+    # without a user to ask, leave the score unset
+    if not ui.is_interactive():
+        return
+
     while True:
         score = click.prompt("Enter the new score (leave blank to skip)", default=-1, show_default=False)
 
@@ -72,6 +81,10 @@ def get_new_count_from_user(field_type, limit=0):
     if limit < 0:
         raise ValueError("Limit must be greater than or equal to 0")
 
+    # without a user to ask, leave the count unset
+    if not ui.is_interactive():
+        return
+
     while True:
         count = click.prompt("Enter the new {} count (leave blank to skip)".format(field_type), default=-1,
                              show_default=False)
@@ -88,3 +101,15 @@ def get_new_count_from_user(field_type, limit=0):
             click.echo("You must enter a value between 0 and {}.".format(limit))
         else:
             click.echo("You must enter a value greater than or equal to 0.")
+
+
+def entry_xml(fields):
+    """Form the XML document sent to the list add and update endpoints
+
+    :param fields: A dictionary (ordered) mapping field names, e.g. "episode" or "status", to their new values
+    :return: A string, the XML document
+    """
+    xml_tag_format = "<{0}>{1}</{0}>"
+    xml_field_tags = "".join(xml_tag_format.format(name, value) for name, value in fields.items())
+
+    return '<?xml version="1.0" encoding="UTF-8"?><entry>{}</entry>'.format(xml_field_tags)
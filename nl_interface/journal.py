@@ -0,0 +1,499 @@
+from collections import OrderedDict
+from enum import Enum
+import json
+import os
+import threading
+
+import agent
+import client
+from constants import DATA_DIR
+import helpers
+import network
+import records
+import ui
+
+# the name of the journal file in the data directory
+JOURNAL_FILENAME = "journal.jsonl"
+
+# the number of finished changes after which the journal file is rewritten without them
+COMPACT_AFTER = 50
+
+# the results of sending a change which mean MAL couldn't be reached, so the change is kept to be sent again later
+OFFLINE_STATUSES = {network.StatusCode.CONNECTION_ERROR, network.StatusCode.TIMEOUT, network.StatusCode.CIRCUIT_OPEN}
+
+
+class Action(Enum):
+    """An Enum representing the changes that can be made to a list"""
+    ADD = "add"
+    UPDATE = "update"
+    DELETE = "delete"
+
+
+def is_offline(result):
+    """Check whether the result of sending a change means that MAL couldn't be reached
+
+    :param result: A requests.Response or a network.StatusCode
+    :return: A boolean, True for network failures and server errors
+    """
+    if isinstance(result, network.StatusCode):
+        return result in OFFLINE_STATUSES
+
+    return result.status_code >= 500
+
+
+class Record:
+    """A change to a list entry that has been made locally but not yet accepted by MAL"""
+
+    def __init__(self, seq, username, media_type, action, entry_id, fields, title="", entry=None):
+        """
+        :param seq: An int, the position of the change in the journal
+        :param username: A string, the username of the account whose list was changed
+        :param media_type: A string, must be either "anime" or "manga"
+        :param action: An Action enum value
+        :param entry_id: A string, the MAL database id of the entry
+        :param fields: An OrderedDict, the fields sent to MAL, in the order they should appear in the XML
+        :param title: A string, the title of the entry, used to tell the user about the change
+        :param entry: A dictionary or None, the fields of the new records.ListEntry for an add
+        """
+        self.seq = seq
+        self.username = username
+        self.media_type = media_type
+        self.action = action
+        self.entry_id = entry_id
+        self.fields = fields
+        self.title = title
+        self.entry = entry
+
+    def __repr__(self):
+        return "Record({}, {!r}, {!r}, {}, {!r}, {})".format(self.seq, self.username, self.media_type,
+                                                            self.action.name, self.entry_id, dict(self.fields))
+
+    @property
+    def key(self):
+        """A tuple (username, media type, entry id) identifying the entry"""
+        return self.username, self.media_type, self.entry_id
+
+    @property
+    def xml(self):
+        """The XML document to send to the add or update endpoint"""
+        return helpers.entry_xml(self.fields)
+
+    def to_json(self):
+        """Get the record as a dictionary that can be encoded as JSON
+
+        :return: A dictionary
+        """
+        return {"seq": self.seq, "username": self.username, "media_type": self.media_type,
+                "action": self.action.value, "entry_id": self.entry_id, "fields": list(self.fields.items()),
+                "title": self.title, "entry": self.entry}
+
+    @classmethod
+    def from_json(cls, data):
+        """Create a record from a dictionary made by to_json
+
+        :param data: A dictionary
+        :return: A Record
+        """
+        return cls(data["seq"], data["username"], data["media_type"], Action(data["action"]), data["entry_id"],
+                   OrderedDict(data["fields"]), data.get("title", ""), data.get("entry"))
+
+
+def compact_records(journal_records, in_flight=()):
+    """Collapse the changes to each entry that supersede one another
+
+    Later updates are merged into an earlier update or add, an update followed by a delete becomes just the delete and
+    an add followed by a delete is dropped altogether. Changes that are being sent are left alone, as are any changes
+    to the same entry that come before them.
+
+    :param journal_records: A list of Record in the order they were made
+    :param in_flight: A collection of ints, the seqs of the changes that are being sent right now
+    :return: A list of Record
+    """
+    compacted = []
+
+    # the last change kept for each entry that can still be merged with
+    last = {}
+
+    for record in journal_records:
+        previous = last.pop(record.key, None)
+
+        if record.seq in in_flight:
+            compacted.append(record)
+        elif previous is not None and record.action == Action.UPDATE and previous.action != Action.DELETE:
+            previous.fields.update(record.fields)
+            last[record.key] = previous
+        elif previous is not None and record.action == Action.DELETE and previous.action == Action.UPDATE:
+            compacted.remove(previous)
+            compacted.append(record)
+            last[record.key] = record
+        elif previous is not None and record.action == Action.DELETE and previous.action == Action.ADD:
+            # the entry was never on MAL's copy of the list
+            compacted.remove(previous)
+        else:
+            compacted.append(record)
+            last[record.key] = record
+
+    return compacted
+
+
+class Journal:
+    """A write-ahead log of the changes made to users' lists, saved as JSON lines so it survives restarts
+
+    Every change is written to the journal before it is sent to MAL and marked as done once MAL has answered. Changes
+    that couldn't be sent because MAL was unreachable stay in the journal, parked, until they are replayed.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: A string, the path of the journal file, or None for a journal that isn't saved
+        """
+        self.path = path
+
+        self._lock = threading.RLock()
+
+        # the changes that haven't been accepted by MAL yet, keyed by seq
+        self._records = OrderedDict()
+
+        # the seqs of the changes that are being sent right now, every other change is parked
+        self._in_flight = set()
+
+        # the number of changes marked as done since the file was last rewritten
+        self._finished = 0
+
+        self._next_seq = 1
+
+        if path is not None and os.path.exists(path):
+            self._read()
+
+            # start each run with a short file
+            self.compact()
+
+    def _read(self):
+        """Read the changes that haven't been marked as done from the journal file"""
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    data = json.loads(line)
+                # the last line may be incomplete if the program was killed while writing it
+                except ValueError:
+                    continue
+
+                if "done" in data:
+                    self._records.pop(data["done"], None)
+                else:
+                    record = Record.from_json(data)
+                    self._records[record.seq] = record
+                    self._next_seq = max(self._next_seq, record.seq + 1)
+
+    def _write(self, *lines):
+        """Append lines to the journal file and make sure they reach the disk (must hold the lock)
+
+        :param lines: Dictionaries, each written as a line of JSON
+        """
+        if self.path is None:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(line) + "\n" for line in lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, username, media_type, action, entry_id, fields, title="", entry=None, in_flight=True):
+        """Write a change to the journal
+
+        :param username: A string, the username of the account whose list was changed
+        :param media_type: A string, must be either "anime" or "manga"
+        :param action: An Action enum value
+        :param entry_id: A string or int, the MAL database id of the entry
+        :param fields: A dictionary, the fields to send to MAL
+        :param title: A string, the title of the entry
+        :param entry: A records.ListEntry or None, the new entry for an add
+        :param in_flight: A boolean, whether the change is about to be sent or should be parked straight away
+        :return: A Record
+        """
+        with self._lock:
+            record = Record(self._next_seq, username, media_type, action, str(entry_id), OrderedDict(fields), title,
+                            entry.to_fields() if entry is not None else None)
+            self._next_seq += 1
+
+            self._write(record.to_json())
+
+            self._records[record.seq] = record
+            if in_flight:
+                self._in_flight.add(record.seq)
+
+            return record
+
+    def finish(self, *seqs):
+        """Mark changes as done, because MAL either accepted or rejected them
+
+        :param seqs: Ints, the seqs of the changes
+        """
+        with self._lock:
+            self._write(*({"done": seq} for seq in seqs))
+
+            for seq in seqs:
+                self._records.pop(seq, None)
+                self._in_flight.discard(seq)
+
+            self._finished += len(seqs)
+
+            if self._finished >= COMPACT_AFTER:
+                self.compact()
+
+    def claim(self, seq):
+        """Mark a parked change as being sent
+
+        :param seq: An int, the seq of the change
+        :return: A boolean, False if the change is already being sent or is no longer in the journal
+        """
+        with self._lock:
+            if seq not in self._records or seq in self._in_flight:
+                return False
+
+            self._in_flight.add(seq)
+            return True
+
+    def park(self, *seqs):
+        """Keep changes that couldn't be sent to be replayed later
+
+        :param seqs: Ints, the seqs of the changes
+        """
+        with self._lock:
+            self._in_flight.difference_update(seqs)
+
+    def has_parked(self, username, media_type=None, entry_id=None):
+        """Check whether any changes to a user's list are waiting to be replayed
+
+        :param username: A string, the username of a MAL user
+        :param media_type: A string or None, only check changes to this list
+        :param entry_id: A string, int or None, only check changes to this entry
+        :return: A boolean
+        """
+        return bool(self.parked(username, media_type, entry_id))
+
+    def parked(self, username, media_type=None, entry_id=None):
+        """Get the changes to a user's list that are waiting to be replayed
+
+        :param username: A string, the username of a MAL user
+        :param media_type: A string or None, only get changes to this list
+        :param entry_id: A string, int or None, only get changes to this entry
+        :return: A list of Record in the order they were made
+        """
+        with self._lock:
+            return [record for record in self._records.values()
+                    if record.seq not in self._in_flight and record.username == username
+                    and media_type in (None, record.media_type)
+                    and (entry_id is None or record.entry_id == str(entry_id))]
+
+    def pending(self, username, media_type, entry_id=None):
+        """Get every change to a user's list that MAL hasn't accepted yet, whether it is being sent or parked
+
+        :param username: A string, the username of a MAL user
+        :param media_type: A string, must be either "anime" or "manga"
+        :param entry_id: A string, int or None, only get changes to this entry
+        :return: A list of Record in the order they were made
+        """
+        with self._lock:
+            return [record for record in self._records.values()
+                    if record.username == username and record.media_type == media_type
+                    and (entry_id is None or record.entry_id == str(entry_id))]
+
+    def compact(self):
+        """Collapse superseded parked changes and rewrite the journal file with only the changes that are left"""
+        with self._lock:
+            compacted = compact_records(list(self._records.values()), self._in_flight)
+            self._records = OrderedDict((record.seq, record) for record in compacted)
+            self._finished = 0
+
+            if self.path is None:
+                return
+
+            # write the new file alongside the old one so a crash can't lose the journal
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(record.to_json()) + "\n" for record in compacted)
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(temp_path, self.path)
+
+    def apply_pending(self, store, username, media_type):
+        """Make the changes that MAL hasn't accepted yet to a freshly downloaded copy of a user's list
+
+        :param store: A liststore.ListStore
+        :param username: A string, the username of a MAL user
+        :param media_type: A string, must be either "anime" or "manga"
+        """
+        for record in self.pending(username, media_type):
+            if record.action == Action.ADD:
+                if record.entry is not None:
+                    store.put_entry(username, media_type, records.list_entry(media_type, record.entry))
+                store.update_entry(username, media_type, record.entry_id, record.fields)
+            elif record.action == Action.UPDATE:
+                store.update_entry(username, media_type, record.entry_id, record.fields)
+            else:
+                store.delete_entry(username, media_type, record.entry_id)
+
+
+# the journal shared by the whole program, created on first use
+_journal = None
+_journal_lock = threading.Lock()
+
+# the usernames whose parked changes are being replayed
+_replaying = set()
+_replaying_lock = threading.Lock()
+
+
+def get_journal():
+    """Get the shared journal, reading it from the data directory on first use
+
+    :return: A Journal
+    """
+    global _journal
+
+    with _journal_lock:
+        if _journal is None:
+            _journal = Journal(os.path.join(DATA_DIR, JOURNAL_FILENAME))
+        return _journal
+
+
+def set_journal(journal):
+    """Replace the shared journal, e.g. with one that isn't saved
+
+    :param journal: A Journal
+    """
+    global _journal
+
+    with _journal_lock:
+        _journal = journal
+
+
+def send(session, record):
+    """Send a change in the journal to MAL
+
+    :param session: A session.Session, the account whose list was changed
+    :param record: A Record
+    :return: A requests.Response or a network.StatusCode if the request failed
+    """
+    if record.action == Action.ADD:
+        request = client.add_entry(session.credentials, record.media_type, record.entry_id, record.xml)
+    elif record.action == Action.UPDATE:
+        request = client.update_entry(session.credentials, record.media_type, record.entry_id, record.xml)
+    else:
+        request = client.delete_entry(session.credentials, record.media_type, record.entry_id)
+
+    return client.run(request)
+
+
+def send_change(session, action, media_type, entry_id, fields, title, action_msg, entry=None):
+    """Journal a change and send it to MAL, parking it to be replayed later if MAL can't be reached
+
+    Changes to an entry that already has changes waiting to reach MAL are parked behind them, so that they reach MAL
+    in order.
+
+    :param session: A session.Session, the account whose list was changed
+    :param action: An Action enum value
+    :param media_type: A string, must be either "anime" or "manga"
+    :param entry_id: A string or int, the MAL database id of the entry
+    :param fields: A dictionary, the fields to send to MAL
+    :param title: A string, the title of the entry
+    :param action_msg: A string, the message to show while the change is being sent
+    :param entry: A records.ListEntry or None, the new entry for an add
+    :return: A requests.Response, a network.StatusCode if MAL wouldn't accept the credentials, or None if the change
+             was parked
+    """
+    journal = get_journal()
+
+    if journal.pending(session.username, media_type, entry_id):
+        journal.append(session.username, media_type, action, entry_id, fields, title, entry, in_flight=False)
+        replay_in_background(session)
+        return
+
+    record = journal.append(session.username, media_type, action, entry_id, fields, title, entry)
+
+    try:
+        r = ui.threaded_action(send, action_msg, session, record)
+    except BaseException:
+        # keep the change to be replayed later rather than leaving it marked as being sent
+        journal.park(record.seq)
+        raise
+
+    if is_offline(r):
+        journal.park(record.seq)
+        return
+
+    journal.finish(record.seq)
+    return r
+
+
+def replay(session):
+    """Send a user's parked changes to MAL in the order they were made, stopping if MAL still can't be reached
+
+    :param session: A session.Session, the account whose changes to send
+    :return: A boolean, True if every parked change was sent
+    """
+    journal = get_journal()
+    journal.compact()
+
+    for record in journal.parked(session.username):
+        # the change is already being sent by someone else
+        if not journal.claim(record.seq):
+            continue
+
+        try:
+            r = send(session, record)
+        except BaseException:
+            journal.park(record.seq)
+            raise
+
+        if is_offline(r):
+            journal.park(record.seq)
+            return False
+
+        journal.finish(record.seq)
+
+        if isinstance(r, network.StatusCode) or r.status_code not in [200, 201]:
+            agent.print_msg('MAL wouldn\'t accept the change to "{}" that I saved while it couldn\'t be reached, so I '
+                            'have undone it.'.format(record.title))
+
+            # put the list back the way MAL has it (imported here as the list store imports the journal)
+            import liststore
+
+            liststore.refresh_in_background(session.username, record.media_type)
+
+        if not isinstance(r, network.StatusCode):
+            r.close()
+
+    return True
+
+
+def replay_in_background(session):
+    """Start replaying a user's parked changes on a background thread, unless they are already being replayed
+
+    :param session: A session.Session, the account whose changes to send
+    :return: The threading.Thread doing the replay or None if there was nothing to replay or one was already running
+    """
+    if not get_journal().has_parked(session.username):
+        return
+
+    with _replaying_lock:
+        if session.username in _replaying:
+            return
+        _replaying.add(session.username)
+
+    def background_replay():
+        """Replay the changes and then mark them as no longer replaying"""
+        try:
+            with network.priority(network.Priority.BACKGROUND):
+                replay(session)
+        finally:
+            with _replaying_lock:
+                _replaying.discard(session.username)
+
+    thread = threading.Thread(target=background_replay, daemon=True)
+    thread.start()
+
+    return thread
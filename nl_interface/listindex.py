@@ -0,0 +1,245 @@
+import re
+
+# words so common in titles that on their own they match a large part of any list, e.g. "no" in "Shingeki no Kyojin"
+STOPWORDS = frozenset(["a", "an", "and", "the", "of", "to", "in", "on", "no", "wa", "ga", "wo", "ni", "na", "de"])
+
+# the pattern matching a single token of a title or query
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenise(text):
+    """Split a title or query into normalised tokens
+
+    :param text: A string
+    :return: A list of lowercase strings in the order they appear in text
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class ListIndex:
+    """An inverted index from the tokens of the titles and synonyms on a user's list to the entries they appear in
+
+    The index is built once when a list is loaded and answers queries by intersecting the posting lists of the query's
+    tokens, so a search doesn't have to scan and lowercase every entry on the list.
+    """
+
+    def __init__(self, entries):
+        """
+        :param entries: A list of records.ListEntry, the entries on the list
+        """
+        self.entries = list(entries)
+
+        # maps each token to the sorted positions of the entries it appears in
+        self.postings = {}
+
+        # the lowercase title and synonyms of each entry, used for substring matching
+        self.texts = []
+
+        # ranks entries by how closely their title or one of their synonyms matches a query
+        self.trigrams = TrigramIndex([entry_names(entry.title, entry.synonyms)
+                                      for entry in self.entries])
+
+        for position, entry in enumerate(self.entries):
+            text = "{}\n{}".format(entry.title, entry.synonyms).lower()
+            self.texts.append(text)
+
+            for token in set(tokenise(text)):
+                self.postings.setdefault(token, []).append(position)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _positions_for_token(self, token):
+        """Get the positions of the entries containing a token, falling back to tokens that contain it
+
+        :param token: A string, a normalised query token
+        :return: A set of ints
+        """
+        if token in self.postings:
+            return set(self.postings[token])
+
+        # the token may only be part of a word (e.g. "fullmeta"), so look for it in the vocabulary instead of the list
+        positions = set()
+        for indexed_token, token_positions in self.postings.items():
+            if token in indexed_token:
+                positions.update(token_positions)
+
+        return positions
+
+    def _match_positions(self, search_string):
+        """Find the positions of the entries matching a query using the token index
+
+        :param search_string: A string, the query
+        :return: A set of ints
+        """
+        tokens = tokenise(search_string)
+
+        if not tokens:
+            return set()
+
+        significant_tokens = [token for token in tokens if token not in STOPWORDS] or tokens
+
+        # intersect the posting lists of the significant tokens, smallest first
+        token_positions = sorted((self._positions_for_token(token) for token in significant_tokens), key=len)
+        positions = set.intersection(*token_positions)
+
+        # fall back to substring matching on the whole query, then to entries matching any significant token
+        if not positions:
+            query = search_string.lower()
+            positions = {position for position, text in enumerate(self.texts) if query in text}
+        if not positions:
+            positions = set.union(*token_positions)
+
+        return positions
+
+    def search(self, search_string):
+        """Find the entries matching a query
+
+        Entries containing every significant token of the query are returned if there are any. Otherwise entries
+        containing the whole query or any one of its tokens are returned, as the original linear search did.
+        Stopwords are only used when the query consists entirely of stopwords.
+
+        :param search_string: A string, the query
+        :return: A list of the matching entries in list order
+        """
+        return [self.entries[position] for position in sorted(self._match_positions(search_string))]
+
+    def rank(self, search_string, limit=None, min_score=0.0):
+        """Find the entries matching a query, best match first
+
+        The entries found by search are ranked by trigram similarity. If search finds nothing (e.g. because of a
+        typo) the entries most similar to the query are returned instead, as long as they score at least min_score.
+
+        :param search_string: A string, the query
+        :param limit: An int or None, the maximum number of entries to return
+        :param min_score: A float, the lowest similarity a fuzzy match must have to be returned
+        :return: A list of (entry, score) tuples
+        """
+        positions = self._match_positions(search_string)
+
+        if positions:
+            ranked = self.trigrams.rank(search_string, limit, positions=positions)
+        else:
+            ranked = self.trigrams.rank(search_string, limit, min_score)
+
+        return [(self.entries[position], score) for position, score in ranked]
+
+
+def trigrams(text):
+    """Get the set of character trigrams of a string, with each word padded so that word boundaries count
+
+    :param text: A string
+    :return: A set of three character strings
+    """
+    grams = set()
+
+    for token in tokenise(text):
+        padded = "  {} ".format(token)
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+
+    return grams
+
+
+def similarity(query_trigrams, name_trigrams):
+    """Get the similarity of two sets of trigrams (the Dice coefficient)
+
+    :param query_trigrams: A set of strings
+    :param name_trigrams: A set of strings
+    :return: A float between 0 and 1, where 1 means the sets are identical
+    """
+    if not query_trigrams or not name_trigrams:
+        return 0.0
+
+    return 2 * len(query_trigrams & name_trigrams) / (len(query_trigrams) + len(name_trigrams))
+
+
+class TrigramIndex:
+    """An index from character trigrams to the names of items, for ranking items by how closely they match a query
+
+    Each item may have several names (e.g. a title and its synonyms), and scores as well as its closest name does.
+    Matching on trigrams rather than whole words means that typos still find the item they were meant for.
+    """
+
+    def __init__(self, item_names):
+        """
+        :param item_names: A list of lists of strings, the names of each item
+        """
+        self.size = len(item_names)
+
+        # the trigrams of every name along with the position of the item it belongs to
+        self.names = []
+
+        # maps each trigram to the indices in self.names of the names it appears in
+        self.postings = {}
+
+        # maps the position of each item to the trigrams of its names, for scoring a few candidates directly
+        self.item_trigrams = {}
+
+        for position, names in enumerate(item_names):
+            for name in names:
+                name_trigrams = trigrams(name)
+
+                if not name_trigrams:
+                    continue
+
+                for gram in name_trigrams:
+                    self.postings.setdefault(gram, []).append(len(self.names))
+
+                self.names.append((position, name_trigrams))
+                self.item_trigrams.setdefault(position, []).append(name_trigrams)
+
+    def rank(self, query, limit=None, min_score=0.0, positions=None):
+        """Rank the items by their similarity to a query
+
+        :param query: A string
+        :param limit: An int or None, the maximum number of results to return
+        :param min_score: A float, the lowest similarity an item must have to be returned
+        :param positions: An iterable of ints or None, the only items to consider, defaults to any item sharing a
+                          trigram with the query
+        :return: A list of (position, score) tuples, best first and in item order for equal scores
+        """
+        query_trigrams = trigrams(query)
+        scores = {}
+
+        if positions is not None:
+            for position in set(positions):
+                scores[position] = max([similarity(query_trigrams, name_trigrams)
+                                        for name_trigrams in self.item_trigrams.get(position, [])], default=0.0)
+        else:
+            # count the trigrams each name shares with the query by walking the query's posting lists
+            shared = {}
+            for gram in query_trigrams:
+                for name_index in self.postings.get(gram, []):
+                    shared[name_index] = shared.get(name_index, 0) + 1
+
+            for name_index, count in shared.items():
+                position, name_trigrams = self.names[name_index]
+                score = 2 * count / (len(query_trigrams) + len(name_trigrams))
+                scores[position] = max(scores.get(position, 0.0), score)
+
+        ranked = sorted(((position, score) for position, score in scores.items() if score >= min_score),
+                        key=lambda result: (-result[1], result[0]))
+
+        return ranked[:limit] if limit is not None else ranked
+
+
+def entry_names(*fields):
+    """Collect the names an entry is known by from its title, english title and synonyms fields
+
+    :param fields: Strings, where synonyms may be several names separated by semicolons
+    :return: A list of strings
+    """
+    return [name.strip() for field in fields for name in field.split(";") if name.strip()]
+
+
+def should_auto_select(ranked, threshold):
+    """Check whether the best of a ranked list of matches is good enough to pick without asking the user
+
+    :param ranked: A list of (item, score) tuples, best first
+    :param threshold: A float, the score the best match must reach
+    :return: True if the best match reaches the threshold and is strictly better than the runner up
+    """
+    if not ranked or ranked[0][1] < threshold:
+        return False
+
+    return len(ranked) == 1 or ranked[1][1] < ranked[0][1]
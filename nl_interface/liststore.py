@@ -0,0 +1,610 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from lxml import etree
+import requests
+
+import client
+import journal
+import listindex
+from constants import ANIME_TYPE_MAP, DATA_DIR, MANGA_TYPE_MAP
+import network
+import records
+import xmlstream
+
+# the number of seconds after which a stored list is refreshed from MAL in the background
+STALE_AFTER = 10 * 60
+
+# the name of the database file in the data directory
+STORE_FILENAME = "lists.sqlite3"
+
+# the most bytes of a downloaded list that are held in memory, larger lists are spooled to a temporary file
+SPOOL_SIZE = 1024 * 1024
+
+
+def new_list_entry(search_entry, fields):
+    """Create a list entry for an entry from the MAL database that has just been added to a user's list
+
+    :param search_entry: A records.SearchEntry, the entry as returned by a database search
+    :param fields: A dictionary, the fields that were sent to the add endpoint, e.g. {"status": 1, "episode": 3}
+    :return: A records.ListEntry
+    """
+    type_map = ANIME_TYPE_MAP if search_entry.media_type == "anime" else MANGA_TYPE_MAP
+    type_codes = {name: code for code, name in type_map.items()}
+
+    entry = records.list_entry(search_entry.media_type, {
+        "series_{}db_id".format(search_entry.media_type): str(search_entry.id),
+        "series_title": search_entry.title,
+        "series_synonyms": search_entry.synonyms,
+        "series_type": type_codes.get(search_entry.type, "1"),
+        "series_episodes": str(getattr(search_entry, "episodes", 0)),
+        "series_chapters": str(getattr(search_entry, "chapters", 0)),
+        "series_volumes": str(getattr(search_entry, "volumes", 0)),
+        "my_status": "6"
+    })
+    entry.apply_fields(fields)
+
+    return entry
+
+
+class ListVersion:
+    """The version of a user's list that the store has a copy of, used to tell whether MAL's copy has changed since"""
+
+    def __init__(self, etag="", last_modified="", digest=""):
+        """
+        :param etag: A string, the ETag header the list was sent with, empty if there wasn't one
+        :param last_modified: A string, the Last-Modified header the list was sent with, empty if there wasn't one
+        :param digest: A string, the SHA-1 hex digest of the downloaded document
+        """
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+
+    def __eq__(self, other):
+        return isinstance(other, ListVersion) and vars(self) == vars(other)
+
+    def __repr__(self):
+        return "ListVersion({!r}, {!r}, {!r})".format(self.etag, self.last_modified, self.digest)
+
+    def request_headers(self):
+        """Get the headers that ask the server to only send the list if it has changed since this version
+
+        :return: A dictionary, empty if the server didn't send anything to compare against
+        """
+        headers = {}
+
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+
+        return headers
+
+
+class ListStore:
+    """A persistent local copy of users' anime and manga lists, saved in an SQLite database
+
+    Lists are kept in memory once loaded so that lookups don't have to touch the disk.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: A string, the path of the database file, or ":memory:" for a store that isn't saved
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS lists (
+                username TEXT NOT NULL,
+                media_type TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (username, media_type)
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                username TEXT NOT NULL,
+                media_type TEXT NOT NULL,
+                entry_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (username, media_type, entry_id)
+            );
+            CREATE TABLE IF NOT EXISTS list_versions (
+                username TEXT NOT NULL,
+                media_type TEXT NOT NULL,
+                etag TEXT NOT NULL,
+                last_modified TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                PRIMARY KEY (username, media_type)
+            );
+        """)
+
+        # lists that have been read from the database, keyed by (username, media type)
+        self._loaded = {}
+
+        # counts the local changes to each list, so a refresh started before a change doesn't overwrite it
+        self._generations = {}
+
+        # search indexes of the loaded lists, built on first use and dropped whenever entries are added or removed
+        self._indexes = {}
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._connection.close()
+
+    def has_list(self, username, media_type):
+        """Check whether a user's list has ever been fetched
+
+        :param username: A string, the username of a MAL user
+        :param media_type: A string, must be either "anime" or "manga"
+        :return: True if the list is in the store, False otherwise
+        """
+        return self.fetched_at(username, media_type) is not None
+
+    def fetched_at(self, username, media_type):
+        """Get the time that a user's list was last fetched from MAL
+
+        :param username: A string, the username of a MAL user
+        :param media_type: A string, must be either "anime" or "manga"
+        :return: A float, the time in seconds since the epoch, or None if the list has never been fetched
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT fetched_at FROM lists WHERE username = ? AND media_type = ?",
+                                           (username, media_type)).fetchone()
+            return row[0] if row else None
+
+    def is_stale(self, username, media_type, max_age=STALE_AFTER):
+        """Check whether a user's list is due to be refreshed
+
+        :param username: A string, the username of a MAL user
+        :param media_type: A string, must be either "anime" or "manga"
+        :param max_age: A number, the age in seconds after which the list is stale
+        :return: True if the list is missing or older than max_age, False otherwise
+        """
+        fetched_at = self.fetched_at(username, media_type)
+        return fetched_at is None or time.time() - fetched_at > max_age
+
+    def get_version(self, username, media_type):
+        """Get the version of MAL's copy of a user's list that the store holds
+
+        :param username: A string, the username of a MAL user
+        :param media_type: A string, must be either "anime" or "manga"
+        :return: A ListVersion, or None if the list has been changed locally since it was fetched
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT etag, last_modified, digest FROM list_versions "
+                                           "WHERE username = ? AND media_type = ?", (username, media_type)).fetchone()
+            return ListVersion(*row) if row else None
+
+    def generation(self, username, media_type):
+        """Get the number of local changes that have been made to a user's list
+
+        :param username: A string, the username of a MAL user
+        :param media_type: A string, must be either "anime" or "manga"
+        :return: An int
+        """
+        with self._lock:
+            return self._generations.get((username, media_type), 0)
+
+    def _load(self, username, media_type):
+        """Get a user's list from memory, reading it from the database first if needed (must hold the lock)
+
+        :param username: A string, the username of a MAL user
+        :param media_type: A string, must be either "anime" or "manga"
+        :return: An OrderedDict mapping entry ids to entries
+        """
+        key = (username, media_type)
+
+        if key not in self._loaded:
+            rows = self._connection.execute("SELECT entry_id, data FROM entries WHERE username = ? AND media_type = ? "
+                                            "ORDER BY position", key)
+            self._loaded[key] = OrderedDict((row[0], records.list_entry(media_type, json.loads(row[1])))
+                                            for row in rows)
+
+        return self._loaded[key]
+
+    def get_entries(self, username, media_type):
+        """Get the entries on a user's list
+
+        :param username: A string, the username of a MAL user
+        :param media_type: A string, must be either "anime" or "manga"
+        :return: A list of records.ListEntry in the order MAL returned them, empty if the list has never been fetched
+        """
+        with self._lock:
+            return list(self._load(username, media_type).values())
+
+    def get_entry(self, username, media_type, entry_id):
+        """Get a single entry on a user's list
+
+        :param username: A string, the username of a MAL user
+        :param media_type: A string, must be either "anime" or "manga"
+        :param entry_id: A string or int, the MAL database id of the entry
+        :return: A records.ListEntry or None if the entry isn't on the list
+        """
+        with self._lock:
+            return self._load(username, media_type).get(str(entry_id))
+
+    def get_index(self, username, media_type):
+        """Get the search index of a user's list, building it if the list has changed since it was last built
+
+        :param username: A string, the username of a MAL user
+        :param media_type: A string, must be either "anime" or "manga"
+        :return: A listindex.ListIndex
+        """
+        key = (username, media_type)
+
+        with self._lock:
+            if key not in self._indexes:
+                self._indexes[key] = listindex.ListIndex(self._load(username, media_type).values())
+            return self._indexes[key]
+
+    def replace_list(self, username, media_type, entries, fetched_at=None, version=None):
+        """Replace the whole of a user's list with a freshly fetched copy
+
+        :param username: A string, the username of a MAL user
+        :param media_type: A string, must be either "anime" or "manga"
+        :param entries: A list of records.ListEntry, the list entries
+        :param fetched_at: A float, the time the list was fetched, defaults to now
+        :param version: A ListVersion or None, the version of the list that was fetched
+        """
+        key = (username, media_type)
+        fetched_at = time.time() if fetched_at is None else fetched_at
+
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM entries WHERE username = ? AND media_type = ?", key)
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                ((username, media_type, str(entry.series_id), position, json.dumps(entry.to_fields()))
+                 for position, entry in enumerate(entries)))
+            self._connection.execute("INSERT OR REPLACE INTO lists VALUES (?, ?, ?)", key + (fetched_at,))
+            self._set_version(key, version)
+
+            self._loaded[key] = OrderedDict((str(entry.series_id), entry) for entry in entries)
+            self._indexes.pop(key, None)
+
+    def mark_unchanged(self, username, media_type, version, fetched_at=None):
+        """Record that a user's list was fetched again and MAL's copy hadn't changed
+
+        :param username: A string, the username of a MAL user
+        :param media_type: A string, must be either "anime" or "manga"
+        :param version: A ListVersion, the version of the list that was fetched
+        :param fetched_at: A float, the time the list was fetched, defaults to now
+        """
+        key = (username, media_type)
+        fetched_at = time.time() if fetched_at is None else fetched_at
+
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE lists SET fetched_at = ? WHERE username = ? AND media_type = ?",
+                                     (fetched_at,) + key)
+            self._set_version(key, version)
+
+    def _set_version(self, key, version):
+        """Save the version of MAL's copy of a list that the store holds (must hold the lock)
+
+        :param key: A tuple (username, media type)
+        :param version: A ListVersion, or None if the store's copy no longer matches any version on MAL
+        """
+        if version is None:
+            self._connection.execute("DELETE FROM list_versions WHERE username = ? AND media_type = ?", key)
+        else:
+            self._connection.execute("INSERT OR REPLACE INTO list_versions VALUES (?, ?, ?, ?, ?)",
+                                     key + (version.etag, version.last_modified, version.digest))
+
+    def put_entry(self, username, media_type, entry):
+        """Add an entry to the end of a user's list, replacing it if it is already there
+
+        :param username: A string, the username of a MAL user
+        :param media_type: A string, must be either "anime" or "manga"
+        :param entry: A records.ListEntry, the list entry
+        """
+        key = (username, media_type)
+        new_id = str(entry.series_id)
+
+        with self._lock, self._connection:
+            position = self._connection.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM entries "
+                                                "WHERE username = ? AND media_type = ?", key).fetchone()[0]
+            self._connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                                     key + (new_id, position, json.dumps(entry.to_fields())))
+
+            self._load(username, media_type)[new_id] = entry
+            self._indexes.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._set_version(key, None)
+
+    def update_entry(self, username, media_type, entry_id, fields):
+        """Apply the fields of a successful update to an entry on a user's list
+
+        :param username: A string, the username of a MAL user
+        :param media_type: A string, must be either "anime" or "manga"
+        :param entry_id: A string or int, the MAL database id of the entry
+        :param fields: A dictionary, the fields sent to MAL, e.g. {"episode": 3}
+        :return: The updated records.ListEntry or None if the entry isn't on the list
+        """
+        key = (username, media_type)
+        entry_id = str(entry_id)
+
+        with self._lock, self._connection:
+            entry = self._load(username, media_type).get(entry_id)
+
+            if entry is None:
+                return
+
+            entry.apply_fields(fields)
+
+            self._connection.execute("UPDATE entries SET data = ? WHERE username = ? AND media_type = ? "
+                                     "AND entry_id = ?", (json.dumps(entry.to_fields()),) + key + (entry_id,))
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._set_version(key, None)
+
+            return entry
+
+    def delete_entry(self, username, media_type, entry_id):
+        """Remove an entry from a user's list
+
+        :param username: A string, the username of a MAL user
+        :param media_type: A string, must be either "anime" or "manga"
+        :param entry_id: A string or int, the MAL database id of the entry
+        """
+        key = (username, media_type)
+        entry_id = str(entry_id)
+
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM entries WHERE username = ? AND media_type = ? AND entry_id = ?",
+                                     key + (entry_id,))
+
+            self._load(username, media_type).pop(entry_id, None)
+            self._indexes.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._set_version(key, None)
+
+
+# the store shared by the whole program, created on first use
+_store = None
+_store_lock = threading.Lock()
+
+# the lists currently being refreshed in the background
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def get_store():
+    """Get the shared list store, opening it in the data directory on first use
+
+    :return: A ListStore
+    """
+    global _store
+
+    with _store_lock:
+        if _store is None:
+            _store = ListStore(os.path.join(DATA_DIR, STORE_FILENAME))
+        return _store
+
+
+def set_store(store):
+    """Replace the shared list store, e.g. with one in a temporary location
+
+    :param store: A ListStore
+    """
+    global _store
+
+    with _store_lock:
+        _store = store
+
+
+def download_list(username, media_type, version=None):
+    """Download and parse a user's list from malappinfo.php, unless it hasn't changed
+
+    If the last download was sent with an ETag or Last-Modified header the request is conditional, so an unchanged
+    list isn't sent again. Otherwise the document is hashed as it is downloaded and only parsed if it differs from the
+    last one.
+
+    :param username: A string, the username of a MAL user
+    :param media_type: A string, must be either "anime" or "manga"
+    :param version: A ListVersion or None, the version of the list that the store already has
+    :return: A tuple (list of records.ListEntry or None if the list hasn't changed, ListVersion of the download), or
+             a network.StatusCode if the download failed, including partway through the body
+    """
+    headers = version.request_headers() if version is not None else None
+    r = client.run(client.fetch_list(username, media_type, headers))
+
+    if isinstance(r, network.StatusCode):
+        return r
+
+    with r, tempfile.SpooledTemporaryFile(SPOOL_SIZE) as document:
+        if r.status_code == 304 and version is not None:
+            return None, version
+        elif r.status_code != 200:
+            return network.StatusCode.OTHER_ERROR
+
+        digest = hashlib.sha1()
+
+        # the body is only read here, so the connection can still fail
+        try:
+            for chunk in r.iter_content(xmlstream.CHUNK_SIZE):
+                digest.update(chunk)
+                document.write(chunk)
+        except requests.exceptions.RequestException:
+            return network.StatusCode.CONNECTION_ERROR
+
+        new_version = ListVersion(r.headers.get("ETag", ""), r.headers.get("Last-Modified", ""), digest.hexdigest())
+
+        if version is not None and new_version.digest == version.digest:
+            return None, new_version
+
+        document.seek(0)
+
+        try:
+            entries = [records.list_entry(media_type, fields)
+                       for fields in xmlstream.iter_entries(document, media_type)]
+        except etree.XMLSyntaxError:
+            return network.StatusCode.OTHER_ERROR
+
+    return entries, new_version
+
+
+def _refresh(username, media_type):
+    """Download a user's list and save it in the store, see refresh
+
+    :param username: A string, the username of a MAL user
+    :param media_type: A string, must be either "anime" or "manga"
+    :return: A network.StatusCode, SUCCESS if the store is up to date
+    """
+    store = get_store()
+    generation = store.generation(username, media_type)
+
+    result = download_list(username, media_type, store.get_version(username, media_type))
+
+    if isinstance(result, network.StatusCode):
+        return result
+
+    entries, version = result
+
+    with store._lock:
+        if store.generation(username, media_type) == generation:
+            if entries is None:
+                # the store already has this copy, so there is nothing to parse or re-index
+                store.mark_unchanged(username, media_type, version)
+            else:
+                store.replace_list(username, media_type, entries, version=version)
+                journal.get_journal().apply_pending(store, username, media_type)
+
+    return network.StatusCode.SUCCESS
+
+
+def refresh(username, media_type):
+    """Download a user's list and save it in the store
+
+    The downloaded copy is thrown away if the list was changed locally while it was being downloaded. Changes that
+    haven't reached MAL yet are made to the new copy, so they aren't lost. Callers that ask for a list while it is
+    already being refreshed wait for that refresh rather than downloading it again.
+
+    :param username: A string, the username of a MAL user
+    :param media_type: A string, must be either "anime" or "manga"
+    :return: A network.StatusCode, SUCCESS if the store is up to date
+    """
+    return network.flights.do(("list", username, media_type), _refresh, username, media_type)
+
+
+def refresh_in_background(username, media_type):
+    """Start refreshing a user's list on a background thread, unless it is already being refreshed
+
+    :param username: A string, the username of a MAL user
+    :param media_type: A string, must be either "anime" or "manga"
+    :return: The threading.Thread doing the refresh or None if one was already running
+    """
+    key = (username, media_type)
+
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def background_refresh():
+        """Refresh the list and then mark it as no longer refreshing"""
+        try:
+            # nobody is waiting for the refresh, so let requests from the prompt go first
+            with network.priority(network.Priority.BACKGROUND):
+                refresh(username, media_type)
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    thread = threading.Thread(target=background_refresh, daemon=True)
+    thread.start()
+
+    return thread
+
+
+class Prefetch:
+    """Get a user's lists ready in the background so that the first command that needs one doesn't have to wait
+
+    Each list is refreshed if it is missing or stale and then loaded into memory and indexed, all on background
+    threads at background priority so commands typed in the meantime go first. Asking for a list while it is being
+    downloaded waits for that download rather than starting another (see refresh).
+    """
+
+    def __init__(self, username, media_types=("anime", "manga")):
+        """
+        :param username: A string, the username of a MAL user
+        :param media_types: An iterable of strings, each either "anime" or "manga"
+        """
+        self.username = username
+        self._cancelled = threading.Event()
+
+        self.threads = [threading.Thread(target=self._prefetch, args=(media_type,), daemon=True)
+                        for media_type in media_types]
+        for thread in self.threads:
+            thread.start()
+
+    @property
+    def cancelled(self):
+        """Whether the prefetch has been cancelled"""
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Stop prefetching, a download that has already been sent is still saved but nothing else is started"""
+        self._cancelled.set()
+
+    def join(self, timeout=None):
+        """Wait for the prefetch to finish
+
+        :param timeout: A number or None, the most seconds to wait for each list
+        :return: A boolean, True if every list has finished, False if the timeout ran out first
+        """
+        for thread in self.threads:
+            thread.join(timeout)
+
+        return not any(thread.is_alive() for thread in self.threads)
+
+    def _prefetch(self, media_type):
+        """Refresh a list if needed and build its index, unless the prefetch is cancelled first
+
+        :param media_type: A string, must be either "anime" or "manga"
+        """
+        store = get_store()
+
+        try:
+            with network.priority(network.Priority.BACKGROUND):
+                if not self.cancelled and store.is_stale(self.username, media_type):
+                    if refresh(self.username, media_type) != network.StatusCode.SUCCESS:
+                        return
+        except RuntimeError:
+            # the request executor shuts down when the program quits, which is only expected once cancelled
+            if not self.cancelled:
+                raise
+            return
+
+        if not self.cancelled:
+            store.get_index(self.username, media_type)
+
+
+def get_list(username, media_type):
+    """Get the entries on a user's list from the store
+
+    A list that has never been fetched is downloaded first. A stale list is returned straight away and refreshed in
+    the background, so that the next command sees the changes.
+
+    :param username: A string, the username of a MAL user
+    :param media_type: A string, must be either "anime" or "manga"
+    :return: A list of records.ListEntry or a network.StatusCode if the list had to be downloaded and that failed
+    """
+    store = get_store()
+
+    if not store.has_list(username, media_type):
+        result = refresh(username, media_type)
+
+        if result != network.StatusCode.SUCCESS:
+            return result
+    elif store.is_stale(username, media_type):
+        refresh_in_background(username, media_type)
+
+    return store.get_entries(username, media_type)
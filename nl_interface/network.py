@@ -1,7 +1,40 @@
+from concurrent.futures import Future
+from contextlib import contextmanager
 from enum import Enum
+import heapq
+import itertools
+import random
+import threading
+import time
 
+import requests
+import requests.adapters
 import requests.exceptions
 
+import constants
+
+# the number of per-host connection pools to keep around (we only really talk to MAL)
+POOL_CONNECTIONS = 4
+
+# the maximum number of keep-alive connections to hold open to a single host
+POOL_MAXSIZE = 10
+
+# the number of extra attempts made for idempotent requests that fail or time out
+MAX_RETRIES = 2
+
+# the base and cap, in seconds, of the exponential backoff between retries
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 4
+
+# the (connect, read) timeout in seconds for requests that aren't tied to a particular endpoint
+DEFAULT_TIMEOUT = (3.05, 15)
+
+# the number of consecutive failed requests after which we stop contacting MAL for a while
+BREAKER_FAILURE_THRESHOLD = 5
+
+# the number of seconds the circuit breaker stays open before letting a trial request through
+BREAKER_RESET_TIMEOUT = 30
+
 
 class StatusCode(Enum):
     """An Enum represented the status codes of the result of network connection attempts"""
@@ -9,17 +42,500 @@ class StatusCode(Enum):
     CONNECTION_ERROR = 1
     UNAUTHORISED = 2
     OTHER_ERROR = 3
+    TIMEOUT = 4
+    CIRCUIT_OPEN = 5
+
+
+class Endpoint(Enum):
+    """An Enum representing the classes of MAL endpoint, each of which has its own timeout and retry policy"""
+    AUTH = 0        # api/account/verify_credentials.xml
+    SEARCH = 1      # api/{type}/search.xml
+    LIST_READ = 2   # malappinfo.php
+    LIST_WRITE = 3  # api/{type}list/add|update|delete/{id}.xml
+
+
+# the (connect, read) timeouts in seconds for each endpoint, list downloads can be large so get longer to read
+TIMEOUTS = {
+    Endpoint.AUTH: (3.05, 10),
+    Endpoint.SEARCH: (3.05, 15),
+    Endpoint.LIST_READ: (3.05, 30),
+    Endpoint.LIST_WRITE: (3.05, 15)
+}
+
+# the endpoints that are safe to retry, list writes also go over GET but must never be sent twice
+IDEMPOTENT_ENDPOINTS = {Endpoint.AUTH, Endpoint.SEARCH, Endpoint.LIST_READ}
+
+# the (requests per second, burst size) allowed to each endpoint, so that MAL doesn't throttle us, the rates can be
+# overridden with SAMMY_RATE_LIMITS, e.g. "search=1,list_read=0.5"
+RATE_LIMITS = {
+    Endpoint.AUTH: (2, 10),
+    Endpoint.SEARCH: (2, 10),
+    Endpoint.LIST_READ: (1, 10),
+    Endpoint.LIST_WRITE: (5, 20)
+}
+
+
+class Priority(Enum):
+    """An Enum representing how urgently a request is needed, requests with lower values are let through first"""
+    INTERACTIVE = 0  # a user is waiting for the answer at the prompt
+    BACKGROUND = 1   # list refreshes, queued writes and batch jobs
+
+
+class CircuitBreaker:
+    """Stop sending requests for a while after a run of consecutive failures
+
+    The breaker starts closed. Once failure_threshold failures happen in a row it opens and rejects every request
+    until reset_timeout seconds have passed, at which point a single trial request is let through. The breaker closes
+    again if that trial succeeds and reopens if it fails.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        """
+        :param failure_threshold: An int, the number of consecutive failures that opens the breaker
+        :param reset_timeout: A number, the seconds to wait before letting a trial request through
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+
+    @property
+    def is_open(self):
+        """True if the breaker is currently rejecting requests"""
+        with self._lock:
+            return self._opened_at is not None
+
+    def allow_request(self):
+        """Check whether a request may be sent now
+
+        :return: True if the request may go ahead, False if it should fail fast
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+
+            # let exactly one request through once the reset timeout has elapsed
+            if not self._trial_in_progress and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._trial_in_progress = True
+                return True
+
+            return False
+
+    def record_success(self):
+        """Close the breaker and reset the failure count"""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        """Count a failure, opening the breaker if there have been too many in a row"""
+        with self._lock:
+            self._failures += 1
+            self._trial_in_progress = False
+
+            if self._failures >= self.failure_threshold or self._opened_at is not None:
+                self._opened_at = time.monotonic()
+
+    def reset(self):
+        """Return the breaker to its initial closed state"""
+        self.record_success()
+
+
+# the breaker guarding every request made to MAL
+breaker = CircuitBreaker()
+
+
+class RateLimiter:
+    """A token bucket limiting how often requests can be sent to a class of endpoint
+
+    The bucket holds up to burst tokens and is refilled at rate tokens a second, each request takes a token and waits
+    for one if the bucket is empty. Waiting requests are let through in order of priority and then in the order they
+    arrived, so interactive commands jump ahead of background work.
+    """
+
+    def __init__(self, rate, burst):
+        """
+        :param rate: A number, the requests per second allowed on average
+        :param burst: An int, the number of requests that can be sent at once after a quiet spell
+        """
+        self.rate = rate
+        self.burst = burst
+
+        self._condition = threading.Condition()
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+
+        # a heap of tuples (priority value, arrival number) for the requests waiting for a token
+        self._waiting = []
+        self._arrivals = itertools.count()
+
+        # the number of requests let through, how many of them had to wait and the total time they waited
+        self._requests = 0
+        self._waits = 0
+        self._wait_time = 0.0
+
+    def _refill(self):
+        """Add the tokens that have built up since the bucket was last refilled (must hold the lock)"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self, priority=Priority.INTERACTIVE):
+        """Wait until a request may be sent
+
+        :param priority: A Priority enum value, how urgently the request is needed
+        :return: A float, the number of seconds spent waiting
+        """
+        started_at = time.monotonic()
+
+        with self._condition:
+            ticket = (priority.value, next(self._arrivals))
+            heapq.heappush(self._waiting, ticket)
+
+            while True:
+                self._refill()
+
+                if self._waiting[0] == ticket:
+                    if self._tokens >= 1:
+                        break
+
+                    # the first in line sleeps until the next token is due, everyone else until they are first
+                    self._condition.wait((1 - self._tokens) / self.rate)
+                else:
+                    self._condition.wait()
+
+            heapq.heappop(self._waiting)
+            self._tokens -= 1
+
+            # let the next in line work out how long it has to wait
+            self._condition.notify_all()
+
+            waited = time.monotonic() - started_at
+            self._requests += 1
+            self._wait_time += waited
+
+            # don't count the time taken to get the lock as waiting
+            if waited > 0.001:
+                self._waits += 1
+
+        return waited
+
+    def stats(self):
+        """Get figures for tuning the limiter
+
+        :return: A dictionary with the rate, burst, the number of requests waiting right now (queue_depth), the
+                 number let through so far (requests), how many of those had to wait (waits) and the total and
+                 average seconds they waited (total_wait and average_wait)
+        """
+        with self._condition:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "queue_depth": len(self._waiting),
+                "requests": self._requests,
+                "waits": self._waits,
+                "total_wait": round(self._wait_time, 3),
+                "average_wait": round(self._wait_time / self._requests, 3) if self._requests else 0.0
+            }
+
+
+def parse_rate_limits(spec):
+    """Parse overrides for the rates of the endpoint limiters
+
+    :param spec: A string of comma separated endpoint=rate pairs, e.g. "search=1,list_read=0.5"
+    :return: A dictionary mapping Endpoint enum values to floats, the requests allowed per second
+    """
+    rates = {}
+
+    for pair in spec.split(","):
+        if not pair.strip():
+            continue
+
+        name, _, rate = pair.partition("=")
+
+        try:
+            rates[Endpoint[name.strip().upper()]] = float(rate)
+        except (KeyError, ValueError):
+            raise ValueError("Invalid rate limit {!r}, must be in the form endpoint=requests per second with an "
+                             "endpoint out of {}.".format(pair, ", ".join(e.name.lower() for e in Endpoint)))
+
+    return rates
+
+
+def configure_rate_limits(rates=None):
+    """Replace the limiter of each endpoint
+
+    :param rates: A dictionary mapping Endpoint enum values to the requests per second to allow, or None to use the
+                  defaults in RATE_LIMITS (with any overrides from SAMMY_RATE_LIMITS), endpoints with a rate of None
+                  or 0 aren't limited
+    """
+    if rates is None:
+        rates = parse_rate_limits(constants.RATE_LIMITS)
+
+    for endpoint, (rate, burst) in RATE_LIMITS.items():
+        rate = rates.get(endpoint, rate)
+        limiters[endpoint] = RateLimiter(rate, burst) if rate else None
+
+
+def limiter_stats():
+    """Get the figures for tuning the limiter of each endpoint
+
+    :return: A dictionary mapping the name of each limited endpoint, e.g. "SEARCH", to the result of RateLimiter.stats
+    """
+    return {endpoint.name: limiter.stats() for endpoint, limiter in limiters.items() if limiter is not None}
+
+
+# the limiter of each endpoint, or None if requests to it aren't limited
+limiters = {}
+configure_rate_limits()
+
+# the priority of the requests made by each thread
+_context = threading.local()
 
 
-def make_request(request, *args, **kwargs):
+def current_priority():
+    """Get the priority of the requests made by the current thread
+
+    :return: A Priority enum value, INTERACTIVE unless the thread has said otherwise with the priority context manager
+    """
+    return getattr(_context, "priority", Priority.INTERACTIVE)
+
+
+@contextmanager
+def priority(value):
+    """Give the requests made by the current thread a priority for the duration of a with block
+
+    :param value: A Priority enum value
+    """
+    previous = current_priority()
+    _context.priority = value
+    try:
+        yield
+    finally:
+        _context.priority = previous
+
+
+class SingleFlight:
+    """Share the result of a fetch between every caller that asks for it while it is still in progress
+
+    The first caller for a key does the work and anyone else who asks for the same key before it has finished waits
+    for that result instead of sending the same request again. Once it has finished the next call starts a new fetch,
+    so results are never kept around.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        # the futures of the fetches in progress, keyed by what they are fetching
+        self._in_flight = {}
+
+        # the number of calls that were given the result of another call rather than doing the work themselves
+        self.shared = 0
+
+    def do(self, key, function, *args, **kwargs):
+        """Call a function, or wait for the result of a call with the same key that is already in progress
+
+        :param key: A hashable value identifying the fetch, e.g. ("search", "anime", "naruto")
+        :param function: The function doing the fetch, its result must be safe to give to several callers
+        :param args: Args to pass to function
+        :param kwargs: Keyword args to pass to function
+        :return: The result of the function, if it raises then every caller waiting on it gets the exception
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+
+            if is_leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self.shared += 1
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            result = function(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+
+# the fetches in progress, shared by every part of the program that reads from MAL
+flights = SingleFlight()
+
+
+# the process-wide session shared by every request, created lazily by get_session
+_session = None
+_session_lock = threading.Lock()
+
+
+def _build_session(pool_connections, pool_maxsize, pool_block):
+    """Create a requests session with a keep-alive connection pool mounted for http and https
+
+    :param pool_connections: An int, the number of per-host connection pools to cache
+    :param pool_maxsize: An int, the maximum number of connections to keep open to a single host
+    :param pool_block: A boolean, whether to block rather than open extra connections once pool_maxsize is reached
+    :return: A requests.Session
+    """
+    session = requests.Session()
+
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                            pool_block=pool_block)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+
+def configure_session(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, pool_block=False):
+    """Replace the shared session with one using the given connection pool settings
+
+    Any previously created session is closed, dropping its pooled connections.
+
+    :param pool_connections: An int, the number of per-host connection pools to cache
+    :param pool_maxsize: An int, the maximum number of connections to keep open to a single host
+    :param pool_block: A boolean, whether to block rather than open extra connections once pool_maxsize is reached
+    :return: The new requests.Session
+    """
+    global _session
+
+    session = _build_session(pool_connections, pool_maxsize, pool_block)
+
+    with _session_lock:
+        old_session, _session = _session, session
+
+    if old_session is not None:
+        old_session.close()
+
+    return session
+
+
+def get_session():
+    """Get the shared session, creating it with the default pool settings on first use
+
+    :return: A requests.Session
+    """
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            _session = _build_session(POOL_CONNECTIONS, POOL_MAXSIZE, False)
+        return _session
+
+
+def close_session():
+    """Close the shared session and release all of its pooled connections"""
+    global _session
+
+    with _session_lock:
+        old_session, _session = _session, None
+
+    if old_session is not None:
+        old_session.close()
+
+
+def warm_up():
+    """Open a connection to MAL ahead of the first real request, so that it doesn't have to wait for DNS, TCP and TLS
+
+    The connection is left in the shared session's pool for the next request to reuse. The request doesn't ask for
+    anything (a HEAD without credentials), so it isn't rate limited and doesn't count towards the circuit breaker.
+
+    :return: A boolean, True if MAL answered
+    """
+    url = "{}/api/account/verify_credentials.xml".format(constants.BASE_URL)
+
+    try:
+        get_session().head(url, timeout=TIMEOUTS[Endpoint.AUTH]).close()
+    except requests.exceptions.RequestException:
+        return False
+
+    return True
+
+
+def backoff_delay(attempt):
+    """Get a randomised delay to wait before retrying a request ("full jitter" exponential backoff)
+
+    :param attempt: An int, the number of attempts that have already failed (starting from 1)
+    :return: A float, the number of seconds to wait
+    """
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+def make_request(request, *args, endpoint=None, priority=None, **kwargs):
     """Wrapper for requests functions to order to handle errors
-    
-    :param request: A function from the requests library, e.g. requests.get, requests.delete, etc.
+
+    Requests are given the timeouts of their endpoint, wait for its rate limiter and idempotent requests are retried
+    with a jittered backoff if they fail. While the circuit breaker is open requests fail straight away without
+    touching the network.
+
+    :param request: A string, the HTTP method to send through the shared session, e.g. "get", "delete", etc.
+                    A function from the requests library, e.g. requests.get, is also accepted and called directly
     :param args: Args to pass to request
+    :param endpoint: An Endpoint enum value or None, the class of MAL endpoint the request is for
+    :param priority: A Priority enum value or None to use the priority of the current thread
     :param kwargs: Keyword args to pass to request
-    :return The result of the request or StatusCode.CONNECTION_ERROR if the request failed 
+    :return The result of the request, or StatusCode.CONNECTION_ERROR, StatusCode.TIMEOUT, StatusCode.OTHER_ERROR
+            or StatusCode.CIRCUIT_OPEN if the request failed
     """
-    try:
-        return request(*args, **kwargs)
-    except requests.exceptions.ConnectionError:
-        return StatusCode.CONNECTION_ERROR
+    kwargs.setdefault("timeout", TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT))
+
+    # only retry requests that are safe to send more than once
+    is_get = request.lower() == "get" if isinstance(request, str) else request is requests.get
+    max_attempts = 1 + MAX_RETRIES if endpoint in IDEMPOTENT_ENDPOINTS and is_get else 1
+
+    priority = current_priority() if priority is None else priority
+    limiter = limiters.get(endpoint)
+
+    attempt = 0
+    while True:
+        if not breaker.allow_request():
+            return StatusCode.CIRCUIT_OPEN
+
+        if limiter is not None:
+            limiter.acquire(priority)
+
+        attempt += 1
+
+        try:
+            if isinstance(request, str):
+                result = get_session().request(request.upper(), *args, **kwargs)
+            else:
+                result = request(*args, **kwargs)
+        # check for timeouts first as a connect timeout is also a connection error
+        except requests.exceptions.Timeout:
+            result = StatusCode.TIMEOUT
+        except requests.exceptions.ConnectionError:
+            result = StatusCode.CONNECTION_ERROR
+        # e.g. a broken chunked response or too many redirects
+        except requests.exceptions.RequestException:
+            result = StatusCode.OTHER_ERROR
+        except Exception:
+            # never leave the breaker waiting on a trial request that won't report back
+            breaker.record_failure()
+            raise
+
+        # server errors count against the breaker just like network failures do
+        if isinstance(result, StatusCode) or result.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+            return result
+
+        if attempt >= max_attempts:
+            return result
+
+        # release the connection of a failed response before trying again
+        if not isinstance(result, StatusCode):
+            result.close()
+
+        time.sleep(backoff_delay(attempt))
@@ -3,6 +3,7 @@ import re
 import string
 
 import synonyms
+import termmatcher
 
 
 class OperationType(Enum):
@@ -102,6 +103,10 @@ def strip_type(term):
     return term, None
 
 
+# finds the action terms in a query, synonyms of information can be used as an alias for search
+ACTION_MATCHER = termmatcher.TermMatcher(dict(synonyms.actions, information=synonyms.terms["information"]))
+
+
 def determine_action(query):
     """Determine the intended action of the user
      
@@ -111,32 +116,7 @@ def determine_action(query):
     :return: An OperationType enum, the action to perform
     """
     # a list of tuples with action terms found in the query in the form (action, index of action term)
-    action_term_orders = []
-
-    def match_syns(syns, ac):
-        """Loop over a list of synonyms and append the index and action to a term orders list if in the query
-        
-        :param syns: The list of synonyms
-        :param ac: A string, the name of the action
-        """
-        pos_syn = -1
-        for syn in syns:
-            if syn in query:
-                ato_index = query.index(syn)
-                if pos_syn == -1:
-                    action_term_orders.append((ac, ato_index))
-                    pos_syn = len(action_term_orders) - 1
-                else:
-                    if action_term_orders[pos_syn][1] > ato_index:
-                        action_term_orders[pos_syn] = (ac, ato_index)
-
-    # loop over all of the action categories
-    for action in synonyms.actions:
-        # loop over all of the synonyms for that action until we find a match
-        match_syns(synonyms.actions[action], action)
-
-    # loop over the synonyms of information (as can be used as an alias for search)
-    match_syns(synonyms.terms["information"], "information")
+    action_term_orders = list(ACTION_MATCHER.earliest(query).items())
 
     if action_term_orders:
 
@@ -184,6 +164,106 @@ def determine_action(query):
         return string_to_operation_map[action_term_orders[0][0]]
 
 
+def _alternation(*synonym_lists):
+    """Join lists of synonyms into the body of a regex alternation
+
+    :param synonym_lists: Lists of strings, e.g. synonyms.actions["search"]
+    :return: A string, the synonyms separated by | chars
+    """
+    return "|".join(syn for synonym_list in synonym_lists for syn in synonym_list)
+
+
+# the media types that may be named in a query
+_MEDIA_TYPES = "anime|manga"
+
+# the names of the fields that count updates may apply to
+_COUNT_FIELDS = "episode|ep|chapter|chap|volume|vol"
+
+# the statuses that an entry may be updated to
+_STATUSES = "watch(?:ing)?|read(?:ing)?|(?:on-?)? ?hold|completed?|finish(?:ed)?|drop(?:ped)?|" \
+            "plan(?:ning)?(?: to (?:watch|read)?)?"
+
+# whole-query rules for the extras, matched from the start of the query
+GREETING_RULE = re.compile("(?:{})$".format(_alternation(synonyms.terms["hello"])))
+THANKS_RULE = re.compile("(?:{})$".format(_alternation(synonyms.terms["thank you"])))
+
+# the rules for each kind of request, compiled once on import, each list is in order of precedence
+RULES = {
+    "search": [
+        re.compile("(?:{}) (?:(?:me|us) )?(?:some )?(?:(?:for|on|of|about) (?:the )?)?(?:{}) "
+                   "(?:(?:for|on|of|about) (?:the )?)?(.+)"
+                   .format(_alternation(synonyms.actions["search"]), _alternation(synonyms.terms["information"]))),
+        re.compile("(?:{}) (?:(?:me|us) )?(?:some )?(?:(?:for|on|of|about) )?(?:the )?(.+)"
+                   .format(_alternation(synonyms.actions["search"], synonyms.terms["information"]))),
+        re.compile("(?:{}) (.+)".format(_alternation(synonyms.actions["search"])))
+    ],
+    "add": [
+        re.compile("(?:{}) (?:the )?(.+?)(?: (?:(?:onto|to|on) )?(?:my )?(anime|manga))"
+                   .format(_alternation(synonyms.actions["add"]))),
+        re.compile("(?:{}) (?:the )?(.+?)(?: (?:(?:onto|to|on) )?(?:my )?(anime|manga)? ?list)"
+                   .format(_alternation(synonyms.actions["add"]))),
+        re.compile("(?:{}) (.+)".format(_alternation(synonyms.actions["add"])))
+    ],
+    "delete": [
+        re.compile("(?:{}) (?:the )?(.+?)(?: (?:off )?(?:(?:from|of) )?(?:my )?(anime|manga))"
+                   .format(_alternation(synonyms.actions["delete"]))),
+        re.compile("(?:{}) (?:the )?(.+?)(?: (?:off )?(?:(?:from|of) )?(?:my )?(anime|manga)? ?list)"
+                   .format(_alternation(synonyms.actions["delete"]))),
+        re.compile("(?:{}) (.+)".format(_alternation(synonyms.actions["delete"])))
+    ],
+    "increment": [
+        re.compile("(?:{}) (?:the )?(?:count )?(?:(?:for|on) )?(?:the )?(.+ ?) (anime|manga)"
+                   .format(_alternation(synonyms.actions["increment"]))),
+        re.compile("(?:{}) (?:the )?(?:({})s? )?(?:count )?(?:(?:for|on) )?(.+)"
+                   .format(_alternation(synonyms.actions["increment"]), _COUNT_FIELDS))
+    ],
+    "count": [
+        re.compile("(?:{0}) (?:(?:the|my) )?(?:({1})s? )?(?:count )?(?:(?:by|to|of) )?(?:(\\d+) )(?:(?:for|on) )(.+)"
+                   .format(_alternation(synonyms.actions["update"], synonyms.actions["increment"]), _COUNT_FIELDS)),
+        re.compile("(?:{0}) (?:(?:the|my) )?(?:({1})s? )?(?:count )?(?:(?:of|for) )?(.+?) (?:(?:by|to) )?(?:(?:a|an) )?"
+                   "(?:({1})s? )?(?:count )?(?:(?:to|by|of) )?(\\d+)"
+                   .format(_alternation(synonyms.actions["update"], synonyms.actions["increment"]), _COUNT_FIELDS))
+    ],
+    "score": [
+        re.compile("(?:{0}) (?:(?:the|my) )?(?:(?:{1}) )(?:(?:on|of) )?(?:the )?(?:({2}) )?(.+?) "
+                   "(?:to )?(?:a )?(?:({2}) )?(?:(?:to|of) )?(-?\\d\\d?)"
+                   .format(_alternation(synonyms.actions["update"]), _alternation(synonyms.terms["score"]),
+                           _MEDIA_TYPES)),
+        re.compile("(?:{0}) (?:(?:the|my) )?(?:({2}) )?(.+?) (?:({2}) )?(?:with )?(?:a )?(?:(?:{1}) )"
+                   "(?:(?:to|of) )?(-?\\d\\d?)"
+                   .format(_alternation(synonyms.actions["update"]), _alternation(synonyms.terms["score"]),
+                           _MEDIA_TYPES)),
+        re.compile("(?:rate|score) (?:({0}) )?(.+?) (?:({0}) )?(-?\\d\\d?)".format(_MEDIA_TYPES))
+    ],
+    "status": [
+        re.compile("(?:{0}) (?:(?:the|my) )?(?:({1}) )?(?:(?:on|of) )?(?:({2}) )?(.+?) (?:({2}) )?(?:with )?"
+                   "(?:a )?(?:({1}) )?(?:(?:to|of|as) )?(?:(?:be|my) )?({3})"
+                   .format(_alternation(synonyms.actions["update"]), _alternation(synonyms.terms["status"]),
+                           _MEDIA_TYPES, _STATUSES))
+    ],
+    "view_list": [
+        re.compile("(?:{}) (?:(?:me|us) )?(?:my )?(?:(anime|manga) )?(?:list)"
+                   .format(_alternation(synonyms.actions["view_list"])))
+    ]
+}
+
+
+def match_rules(rule_type, query):
+    """Find the first of the rules for a kind of request that matches the query
+
+    :param rule_type: A string, a key of RULES, e.g. "search"
+    :param query: A string, the normalised user query
+    :return: A tuple (int, match object), the index of the rule in RULES[rule_type] and its match, or (None, None)
+             if none of the rules matched
+    """
+    for i, rule in enumerate(RULES[rule_type]):
+        match = rule.search(query)
+        if match:
+            return i, match
+
+    return None, None
+
+
 def process(query):
     """Process the user query and return a dictionary with the result
 
@@ -208,9 +288,9 @@ def process(query):
     }
 
     # the user said hello or thank you
-    if re.match("(?:{})$".format("|".join(synonyms.terms["hello"])), query):
+    if GREETING_RULE.match(query):
         result["extra"] = Extras.GREETING
-    elif re.match("(?:{})$".format("|".join(synonyms.terms["thank you"])), query):
+    elif THANKS_RULE.match(query):
         result["extra"] = Extras.THANKS
 
     # determine the likely type of action the user intended
@@ -220,26 +300,16 @@ def process(query):
         if action == OperationType.SEARCH:
             # evaluate query using rules for search requests
 
-            # convert list of search and info syns to a string separated by | chars
-            search_syns = "|".join(synonyms.actions["search"])
-            info_syns = "|".join(synonyms.terms["information"])
-
-            sm1 = re.search("(?:{}) (?:(?:me|us) )?(?:some )?(?:(?:for|on|of|about) (?:the )?)?(?:{}) "
-                            "(?:(?:for|on|of|about) (?:the )?)?(.+)".format(search_syns, info_syns), query)
-            sm2 = re.search("(?:{}) (?:(?:me|us) )?(?:some )?(?:(?:for|on|of|about) )?(?:the )?(.+)"
-                            .format(search_syns + "|" + info_syns), query)
-            sm3 = re.search("(?:{}) (.+)".format(search_syns), query)
+            rule, sm = match_rules("search", query)
 
             # if one of the rules matched
-            if sm1 or sm2 or sm3:
+            if sm:
                 result["operation"] = OperationType.SEARCH
 
-                if sm1:
-                    search_term = sm1.group(1)
-                elif sm2:
-                    search_term = strip_info(sm2.group(1))
+                if rule == 0:
+                    search_term = sm.group(1)
                 else:
-                    search_term = strip_info(sm3.group(1))
+                    search_term = strip_info(sm.group(1))
 
                 # remove quotes or spaces from the term and get the media type
                 search_terms_stripped_tuple = strip_type(search_term.strip(" '\""))
@@ -253,111 +323,71 @@ def process(query):
         elif action == OperationType.ADD:
             # evaluate query using rules for add requests
 
-            # convert list of add syns to a string separated by | chars
-            add_syns = "|".join(synonyms.actions["add"])
-
-            am1 = re.search("(?:{}) (?:the )?(.+?)(?: (?:(?:onto|to|on) )?(?:my )?(anime|manga))".format(add_syns),
-                            query)
-            am2 = re.search("(?:{}) (?:the )?(.+?)(?: (?:(?:onto|to|on) )?(?:my )?(anime|manga)? ?list)"
-                            .format(add_syns), query)
-            am3 = re.search("(?:{}) (.+)".format(add_syns), query)
+            rule, am = match_rules("add", query)
 
             # if one of the rules matched
-            if am1 or am2 or am3:
+            if am:
                 result["operation"] = OperationType.ADD
 
-                if am1:
-                    add_term = am1.group(1)
-                    result["type"] = MediaType.MANGA if am1.group(2) == "manga" else MediaType.ANIME
-                elif am2:
-                    add_term = am2.group(1)
-                    result["type"] = MediaType.MANGA if am2.group(2) == "manga" else MediaType.ANIME
-                else:
-                    add_term = am3.group(1)
+                # the last rule doesn't have a media type
+                if rule != 2:
+                    result["type"] = MediaType.MANGA if am.group(2) == "manga" else MediaType.ANIME
 
-                result["term"] = add_term.strip(" '\"")
+                result["term"] = am.group(1).strip(" '\"")
 
         elif action == OperationType.DELETE:
             # evaluate query using rules for delete requests
 
-            # convert list of add syns to a string separated by | chars
-            delete_syns = "|".join(synonyms.actions["delete"])
-
-            dm1 = re.search("(?:{}) (?:the )?(.+?)(?: (?:off )?(?:(?:from|of) )?(?:my )?(anime|manga))"
-                            .format(delete_syns), query)
-            dm2 = re.search("(?:{}) (?:the )?(.+?)(?: (?:off )?(?:(?:from|of) )?(?:my )?(anime|manga)? ?list)"
-                            .format(delete_syns), query)
-            dm3 = re.search("(?:{}) (.+)".format(delete_syns), query)
+            rule, dm = match_rules("delete", query)
 
             # if one of the rules matched
-            if dm1 or dm2 or dm3:
+            if dm:
                 result["operation"] = OperationType.DELETE
 
-                def assign_delete_vals(type_group, term_group):
-                    """Assign the type and term of the match groups to result"""
-                    result["type"] = MediaType.MANGA if type_group == "manga" else MediaType.ANIME
-                    result["term"] = term_group.strip(" '\"")
+                # the last rule doesn't have a media type so default to anime
+                type_group = dm.group(2) if rule != 2 else "anime"
 
-                if dm1:
-                    assign_delete_vals(dm1.group(2), dm1.group(1))
-                elif dm2:
-                    assign_delete_vals(dm2.group(2), dm2.group(1))
-                else:
-                    assign_delete_vals("anime", dm3.group(1))
+                result["type"] = MediaType.MANGA if type_group == "manga" else MediaType.ANIME
+                result["term"] = dm.group(1).strip(" '\"")
 
         elif action == OperationType.UPDATE:
             # evaluate query using rules for update requests
 
-            # convert list of update syns to a string separated by | chars
-            update_syns = "|".join(synonyms.actions["update"])
-
             # increment updates
 
-            # convert list of increment syns to a string separated by | chars
-            increment_syns = "|".join(synonyms.actions["increment"])
-
-            inc1 = re.search("(?:{}) (?:the )?(?:count )?(?:(?:for|on) )?(?:the )?(.+ ?) (anime|manga)"
-                             .format(increment_syns), query)
-            inc2 = re.search("(?:{}) (?:the )?(?:(episode|ep|chapter|chap|volume|vol)s? )?(?:count )?(?:(?:for|on) )?"
-                             "(.+)".format(increment_syns), query)
+            rule, inc = match_rules("increment", query)
 
             # if one of the rules matched
-            if inc1 or inc2:
+            if inc:
                 result["operation"] = OperationType.UPDATE_INCREMENT
 
-                if inc1:
-                    if inc1.group(2) == "manga":
+                if rule == 0:
+                    if inc.group(2) == "manga":
                         result["modifier"] = UpdateModifier.CHAPTER
                         result["type"] = MediaType.MANGA
                     else:
                         result["modifier"] = UpdateModifier.EPISODE
 
-                    result["term"] = inc1.group(1).strip(" '\"")
+                    result["term"] = inc.group(1).strip(" '\"")
 
-                elif inc2:
-                    if inc2.group(1) in synonyms.terms["chapter"]:
+                else:
+                    if inc.group(1) in synonyms.terms["chapter"]:
                         result["modifier"] = UpdateModifier.CHAPTER
                         result["type"] = MediaType.MANGA
-                    elif inc2.group(1) in synonyms.terms["volume"]:
+                    elif inc.group(1) in synonyms.terms["volume"]:
                         result["modifier"] = UpdateModifier.VOLUME
                         result["type"] = MediaType.MANGA
                     else:
                         result["modifier"] = UpdateModifier.EPISODE
 
-                    result["term"] = inc2.group(2).strip(" '\"")
+                    result["term"] = inc.group(2).strip(" '\"")
 
             # count updates
 
-            cnt1 = re.search("(?:{}) (?:(?:the|my) )?(?:(episode|ep|chapter|chap|volume|vol)s? )?(?:count )?"
-                             "(?:(?:by|to|of) )?(?:(\d+) )(?:(?:for|on) )(.+)"
-                             .format(update_syns + "|" + increment_syns), query)
-            cnt2 = re.search("(?:{}) (?:(?:the|my) )?(?:(episode|ep|chapter|chap|volume|vol)s? )?(?:count )?"
-                             "(?:(?:of|for) )?(.+?) (?:(?:by|to) )?(?:(?:a|an) )?"
-                             "(?:(episode|ep|chapter|chap|volume|vol)s? )?(?:count )?(?:(?:to|by|of) )?(\d+)"
-                             .format(update_syns + "|" + increment_syns), query)
+            rule, cnt = match_rules("count", query)
 
             # if one of the rules matched
-            if cnt1 or cnt2:
+            if cnt:
                 result["operation"] = OperationType.UPDATE
 
                 def assign_count_vals(modifier_group, term_group, value_group):
@@ -374,29 +404,21 @@ def process(query):
                     result["term"] = term_group.strip(" '\"")
                     result["value"] = int(value_group)
 
-                if cnt1:
-                    assign_count_vals(cnt1.group(1), cnt1.group(3), cnt1.group(2))
+                if rule == 0:
+                    assign_count_vals(cnt.group(1), cnt.group(3), cnt.group(2))
 
                 else:
-                    if cnt2.group(1) is not None:
-                        assign_count_vals(cnt2.group(1), cnt2.group(2), cnt2.group(4))
-                    elif cnt2.group(3) is not None:
-                        assign_count_vals(cnt2.group(3), cnt2.group(2), cnt2.group(4))
+                    if cnt.group(1) is not None:
+                        assign_count_vals(cnt.group(1), cnt.group(2), cnt.group(4))
+                    elif cnt.group(3) is not None:
+                        assign_count_vals(cnt.group(3), cnt.group(2), cnt.group(4))
 
             # score updates
 
-            # convert list of score syns to a string separated by | chars
-            score_syns = "|".join(synonyms.terms["score"])
-
-            scu1 = re.search("(?:{0}) (?:(?:the|my) )?(?:(?:{1}) )(?:(?:on|of) )?(?:the )?(?:({2}) )?(.+?) "
-                             "(?:to )?(?:a )?(?:({2}) )?(?:(?:to|of) )?(-?\d\d?)"
-                             .format(update_syns, score_syns, "anime|manga"), query)
-            scu2 = re.search("(?:{0}) (?:(?:the|my) )?(?:({2}) )?(.+?) (?:({2}) )?(?:with )?(?:a )?(?:(?:{1}) )"
-                             "(?:(?:to|of) )?(-?\d\d?)".format(update_syns, score_syns, "anime|manga"), query)
-            scu3 = re.search("(?:rate|score) (?:({0}) )?(.+?) (?:({0}) )?(-?\d\d?)".format("anime|manga"), query)
+            rule, scu = match_rules("score", query)
 
             # if one of the rules matched
-            if scu1 or scu2 or scu3:
+            if scu:
                 result["operation"] = OperationType.UPDATE
                 result["modifier"] = UpdateModifier.SCORE
 
@@ -409,35 +431,25 @@ def process(query):
                     result["term"] = term_group.strip(" '\"")
                     result["value"] = int(value_group)
 
-                if scu1:
-                    assign_score_vals((scu1.group(1), scu1.group(3)), scu1.group(2), scu1.group(4))
-                elif scu2:
-                    assign_score_vals((scu2.group(1), scu2.group(3)), scu2.group(2), scu2.group(4))
-                else:
-                    assign_score_vals((scu3.group(1), scu3.group(3)), scu3.group(2), scu3.group(4))
+                # all the score rules have the same groups
+                assign_score_vals((scu.group(1), scu.group(3)), scu.group(2), scu.group(4))
 
             # status updates
 
-            # convert list of status syns to a string separated by | chars
-            status_syns = "|".join(synonyms.terms["status"])
-
-            sts1 = re.search("(?:{0}) (?:(?:the|my) )?(?:({1}) )?(?:(?:on|of) )?(?:({2}) )?(.+?) (?:({2}) )?(?:with )?"
-                             "(?:a )?(?:({1}) )?(?:(?:to|of|as) )?(?:(?:be|my) )?(watch(?:ing)?|read(?:ing)?|(?:on-?)?"
-                             " ?hold|completed?|finish(?:ed)?|drop(?:ped)?|plan(?:ning)?(?: to (?:watch|read)?)?)"
-                             .format(update_syns, status_syns, "anime|manga"), query)
+            rule, sts = match_rules("status", query)
 
             # if one of the rules matched
-            if sts1:
+            if sts:
                 result["operation"] = OperationType.UPDATE
                 result["modifier"] = UpdateModifier.STATUS
-                result["term"] = sts1.group(3).strip(" '\"")
+                result["term"] = sts.group(3).strip(" '\"")
 
-                if sts1.group(2) == "manga" or sts1.group(4) == "manga":
+                if sts.group(2) == "manga" or sts.group(4) == "manga":
                     result["type"] = MediaType.MANGA
                 else:
                     result["type"] = MediaType.ANIME
 
-                status = sts1.group(6)
+                status = sts.group(6)
 
                 if status in synonyms.terms["watching"]:
                     result["value"] = StatusType.WATCHING
@@ -468,13 +480,10 @@ def process(query):
 
             result["operation"] = OperationType.VIEW_LIST
 
-            # convert list of view list syns to a string separated by | chars
-            viewlist_syns = "|".join(synonyms.actions["view_list"])
-
-            vl1 = re.search("(?:{}) (?:(?:me|us) )?(?:my )?(?:(anime|manga) )?(?:list)".format(viewlist_syns), query)
+            rule, vl = match_rules("view_list", query)
 
-            if vl1:
-                if vl1.group(1) == "manga":
+            if vl:
+                if vl.group(1) == "manga":
                     result["type"] = MediaType.MANGA
             elif query.split()[-1] == "manga":
                 result["type"] = MediaType.MANGA
@@ -2,12 +2,18 @@ import html
 from enum import Enum
 
 import click
+from lxml import etree
 import requests
-from bs4 import BeautifulSoup
 
 import agent
+import client
+import constants
+import listindex
 import network
+import records
+import searchcache
 import ui
+import xmlstream
 
 
 class StatusCode(Enum):
@@ -19,65 +25,111 @@ class StatusCode(Enum):
 def display_entry_details(entry):
     """Display all the details of a given entry
 
-    :param entry: an anime or manga entry as a Beautiful Soup Tag object
+    :param entry: An anime or manga entry as a records.SearchEntry
     """
-    for detail in entry.children:
-        # ignore newlines in children
-        if detail != "\n":
-            # replace in tag name the underscores with spaces and convert to title case
-            detail_name = detail.name.replace("_", " ").title()
+    for name, value in entry.to_fields().items():
+        # replace in the field name the underscores with spaces and convert to title case
+        detail_name = name.replace("_", " ").title()
 
-            # set the string to be the detail.string by default
-            detail_string = detail.string
+        # unescape html entities and remove break tags
+        detail_string = html.unescape(value).replace("<br />", "")
+        detail_string = detail_string.replace("[i]", "").replace("[/i]", "")
 
-            # check that the string contains something
-            if detail_string is not None:
-                # unescape html entities and remove break tags
-                detail_string = html.unescape(detail_string).replace("<br />", "")
-                detail_string = detail_string.replace("[i]", "").replace("[/i]", "")
+        click.echo("{}: {}".format(detail_name, detail_string))
 
-            click.echo("{}: {}".format(detail_name, detail_string))
 
+def _download_results(credentials, search_type, search_string):
+    """Search the MAL database and parse the results as they are streamed in
 
-def search(credentials, search_type, search_string, display_details=True):
+    :param credentials: A tuple containing valid MAL account details in the format (username, password)
+    :param search_type: A string, must be either "anime" or "manga"
+    :param search_string: A string, the anime or manga to search for
+    :return: A list of records.SearchEntry or a network.StatusCode if the search failed
+    """
+    r = client.run(client.search(credentials, search_type, search_string))
+
+    if isinstance(r, network.StatusCode):
+        return r
+
+    with r:
+        # MAL answers with no content when nothing matches
+        if r.status_code == 204:
+            return []
+        elif r.status_code != 200:
+            return network.StatusCode.OTHER_ERROR
+
+        # the body is only read while it is being parsed, so the connection can still fail here
+        try:
+            return [records.search_entry(search_type, fields)
+                    for fields in xmlstream.iter_response_entries(r, "entry")]
+        except requests.exceptions.RequestException:
+            return network.StatusCode.CONNECTION_ERROR
+        except etree.XMLSyntaxError:
+            return network.StatusCode.OTHER_ERROR
+
+
+def fetch_results(session, search_type, search_string):
+    """Search the MAL database for an anime or manga
+
+    The results of recent searches are reused from the search cache, and a search for the same thing that is already
+    in progress (e.g. from another command in a batch) is waited for rather than sent again.
+
+    :param session: A session.Session, the account to search with
+    :param search_type: A string, must be either "anime" or "manga"
+    :param search_string: A string, the anime or manga to search for
+    :return: A list of records.SearchEntry, empty if nothing matched, or a network.StatusCode if the search failed
+    """
+    cache = searchcache.get_cache()
+    entries = cache.get(search_type, search_string)
+
+    if entries is None:
+        entries = network.flights.do(("search", search_type, searchcache.normalise_query(search_string)),
+                                     _download_results, session.credentials, search_type, search_string)
+
+        if not isinstance(entries, network.StatusCode):
+            cache.put(search_type, search_string, entries)
+
+    return entries
+
+
+def search(session, search_type, search_string, display_details=True):
     """Search for an anime or manga entry
 
-    :param credentials: A tuple containing valid MAL account details in the format (username, password)
+    :param session: A session.Session, the account to search with
     :param search_type: A string denoting the media type to search for, should be either "anime" or "manga"
     :param search_string: A string, the anime or manga to search for
     :param display_details: A boolean, whether to print the details of the found entry or whether to just return it
-    :return: A beautiful soup tag, or a network status code if there was an error or the user quit
+    :return: A records.SearchEntry, or a network status code if there was an error or the user quit
     """
     if search_type not in ["anime", "manga"]:
         raise ValueError("Invalid argument for {}, must be either {} or {}.".format(search_type, "anime", "manga"))
 
-    url = "https://myanimelist.net/api/{}/search.xml?q={}".format(search_type, search_string.replace(" ", "+"))
-
     # send the async search request to the server
-    r = ui.threaded_action(network.make_request, "Searching for \"{}\"".format(search_string), request=requests.get,
-                           url=url, auth=credentials, stream=True)
+    entries = ui.threaded_action(fetch_results, "Searching for \"{}\"".format(search_string), session, search_type,
+                                 search_string)
 
     # check if there was an error with the user's internet connection
-    if r == network.StatusCode.CONNECTION_ERROR:
-        agent.print_connection_error_msg()
-        return r
+    if entries == network.StatusCode.OTHER_ERROR:
+        agent.print_msg("There was an error getting the entry on your list. Please try again.")
+        return entries
+    elif isinstance(entries, network.StatusCode):
+        agent.print_network_error_msg(entries)
+        return entries
 
-    if r.status_code == 204:
+    if not entries:
         agent.print_msg("I'm sorry I could not find any results for \"{}\".".format(search_string))
         return StatusCode.NO_RESULTS
-
-    elif r.status_code == 200:
-        # decode the raw content so beautiful soup can read it as xml not a string
-        r.raw.decode_content = True
-        soup = BeautifulSoup(r.raw, "xml")
-
-        # get all entries
-        matches = soup.find_all("entry")
+    else:
+        # order the results by how closely their titles match what the user asked for
+        index = listindex.TrigramIndex([listindex.entry_names(entry.title, entry.english,
+                                                              entry.synonyms) for entry in entries])
+        ranked = index.rank(search_string, constants.MAX_SUGGESTIONS, positions=range(len(entries)))
+        matches = [entries[position] for position, score in ranked]
 
         # store the length of all_matched list since needed multiple times
         num_results = len(matches)
 
-        if num_results == 1:
+        if num_results == 1 or listindex.should_auto_select(ranked, constants.AUTO_SELECT_THRESHOLD):
             if display_details:
                 display_entry_details(matches[0])
             else:
@@ -88,18 +140,13 @@ def search(credentials, search_type, search_string, display_details=True):
             # iterate over the matches and print them out
             for i in range(num_results):
                 # use a different layout for entries that don't have any synonyms
-                title_format = "{}> {} ({})" if matches[i].synonyms.get_text() != "" else "{}> {}"
-                click.echo(title_format.format(i + 1, matches[i].title.get_text(), matches[i].synonyms.get_text()))
+                title_format = "{}> {} ({})" if matches[i].synonyms != "" else "{}> {}"
+                click.echo(title_format.format(i + 1, matches[i].title, matches[i].synonyms))
 
             click.echo("{}> [None of these]".format(num_results + 1))
 
             # get a valid choice from the user
-            while True:
-                option = click.prompt("Please choose an option", type=int)
-                if 1 <= option <= num_results + 1:
-                    break
-                else:
-                    click.echo("You must enter a value between {} and {}".format(1, num_results + 1))
+            option = ui.choose_option(num_results)
 
             click.echo()
 
@@ -111,6 +158,3 @@ def search(credentials, search_type, search_string, display_details=True):
                     return matches[option - 1]
             else:
                 return StatusCode.USER_CANCELLED
-    else:
-        agent.print_msg("There was an error getting the entry on your list. Please try again.")
-        return network.StatusCode.OTHER_ERROR
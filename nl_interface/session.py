@@ -0,0 +1,71 @@
+class Session:
+    """A MAL account that queries are carried out for
+
+    Sessions share the list store (which keeps each user's lists apart) and the pool of connections to MAL (which sends
+    the credentials with each request), so one process can carry out queries for many accounts at the same time.
+
+    The list store (and with it requests, asyncio and lxml) is only imported once it is first used, so that a session
+    can be created for a remembered login before the rest of the program has loaded.
+    """
+
+    def __init__(self, credentials):
+        """
+        :param credentials: A tuple containing valid MAL account details in the format (username, password)
+        """
+        self.credentials = credentials
+
+        # the liststore.Prefetch getting the account's lists ready, if one has been started
+        self.prefetch = None
+
+        # a concurrent.futures.Future of the check of a remembered login, None once MAL has accepted the credentials
+        self.login_check = None
+
+    def __repr__(self):
+        # never show the password
+        return "Session({!r})".format(self.username)
+
+    @property
+    def username(self):
+        """The username of the account"""
+        return self.credentials[0]
+
+    @property
+    def store(self):
+        """The liststore.ListStore holding the account's lists"""
+        import liststore
+
+        return liststore.get_store()
+
+    def has_list(self, media_type):
+        """Check whether the account's anime or manga list has been fetched before
+
+        :param media_type: A string, must be either "anime" or "manga"
+        :return: A boolean
+        """
+        return self.store.has_list(self.username, media_type)
+
+    def get_list(self, media_type):
+        """Get the entries on the account's anime or manga list, see liststore.get_list
+
+        :param media_type: A string, must be either "anime" or "manga"
+        :return: A list of records.ListEntry or a network.StatusCode if the list had to be downloaded and that failed
+        """
+        import liststore
+
+        return liststore.get_list(self.username, media_type)
+
+    def prefetch_lists(self):
+        """Start getting the account's anime and manga lists ready in the background, see liststore.Prefetch
+
+        :return: A liststore.Prefetch
+        """
+        import liststore
+
+        self.cancel_prefetch()
+        self.prefetch = liststore.Prefetch(self.username)
+        return self.prefetch
+
+    def cancel_prefetch(self):
+        """Stop getting the account's lists ready, if that is still going on"""
+        if self.prefetch is not None:
+            self.prefetch.cancel()
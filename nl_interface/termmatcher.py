@@ -0,0 +1,111 @@
+from collections import deque
+
+
+def is_word_boundary(text, start, end):
+    """Check whether a slice of a string is a whole word (or words) rather than part of a longer word
+
+    :param text: A string
+    :param start: An int, the index of the first character of the slice
+    :param end: An int, the index after the last character of the slice
+    :return: A boolean, True if the characters either side of the slice aren't letters or digits
+    """
+    return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+
+class TermMatcher:
+    """An Aho-Corasick automaton that finds every occurrence of a set of terms in a string in a single pass
+
+    Each term belongs to one or more categories, e.g. the actions in synonyms.actions, and only occurrences that are
+    whole words are counted, so "ta" isn't found inside "tales".
+    """
+
+    def __init__(self, categories):
+        """
+        :param categories: A dictionary mapping the name of each category to a list of its terms
+        """
+        # the trie of terms, each state is a dictionary of the transitions from it by character
+        self._transitions = [{}]
+
+        # the state to fall back to when there's no transition for a character
+        self._fail = [0]
+
+        # for each state, a list of tuples (category, length of term) for the terms that end there
+        self._outputs = [[]]
+
+        for category, terms in categories.items():
+            for term in terms:
+                self._add(term, category)
+
+        self._link()
+
+    def _add(self, term, category):
+        """Add a term to the trie
+
+        :param term: A string, the term to match
+        :param category: A string, the name of the category the term belongs to
+        """
+        state = 0
+
+        for c in term:
+            if c not in self._transitions[state]:
+                self._transitions.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+                self._transitions[state][c] = len(self._transitions) - 1
+
+            state = self._transitions[state][c]
+
+        self._outputs[state].append((category, len(term)))
+
+    def _link(self):
+        """Set the failure link of every state, breadth first so that shorter prefixes are linked first"""
+        queue = deque(self._transitions[0].values())
+
+        while queue:
+            state = queue.popleft()
+
+            for c, next_state in self._transitions[state].items():
+                queue.append(next_state)
+
+                # follow the failure links of the parent until one can continue with the same character
+                fail = self._fail[state]
+                while fail and c not in self._transitions[fail]:
+                    fail = self._fail[fail]
+
+                self._fail[next_state] = self._transitions[fail].get(c, 0)
+
+                # a state also matches every term that ends at the state it falls back to
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+
+    def find_all(self, text):
+        """Find every whole-word occurrence of the terms in a string
+
+        :param text: A string to search
+        :return: A generator of tuples (category, start index, end index), in order of end index
+        """
+        state = 0
+
+        for i, c in enumerate(text):
+            while state and c not in self._transitions[state]:
+                state = self._fail[state]
+
+            state = self._transitions[state].get(c, 0)
+
+            for category, length in self._outputs[state]:
+                start = i + 1 - length
+                if is_word_boundary(text, start, i + 1):
+                    yield category, start, i + 1
+
+    def earliest(self, text):
+        """Find where each category first occurs in a string
+
+        :param text: A string to search
+        :return: A dictionary mapping the name of each category found to the lowest index one of its terms starts at
+        """
+        positions = {}
+
+        for category, start, end in self.find_all(text):
+            if start < positions.get(category, len(text)):
+                positions[category] = start
+
+        return positions
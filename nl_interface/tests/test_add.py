@@ -1,17 +1,20 @@
 import unittest
 
 from nl_interface import add
+from nl_interface import session
+
+user_session = session.Session(("username", "password"))
 
 
 class TestAddEntry(unittest.TestCase):
     def test_invalid_entry_type(self):
-        self.assertRaises(ValueError, add.add_entry, ("username", "password"), "badentrytype", "", "")
+        self.assertRaises(ValueError, add.add_entry, user_session, "badentrytype", "", "")
 
     def test_none_for_both_optional_args(self):
-        self.assertRaises(ValueError, add.add_entry, ("username", "password"), "anime")
-        self.assertRaises(ValueError, add.add_entry, ("username", "password"), "manga")
-        self.assertRaises(ValueError, add.add_entry, ("username", "password"), "anime", None, None)
-        self.assertRaises(ValueError, add.add_entry, ("username", "password"), "manga", None, None)
+        self.assertRaises(ValueError, add.add_entry, user_session, "anime")
+        self.assertRaises(ValueError, add.add_entry, user_session, "manga")
+        self.assertRaises(ValueError, add.add_entry, user_session, "anime", None, None)
+        self.assertRaises(ValueError, add.add_entry, user_session, "manga", None, None)
 
 
 if __name__ == '__main__':
@@ -1,12 +1,22 @@
+from concurrent.futures import Future
 import sys
+import threading
 import unittest
 from unittest import mock
 from io import StringIO
 
 from nl_interface import agent
+from nl_interface import auth
+from nl_interface import session
 from nl_interface import synonyms
 from nl_interface import query_processing
 
+# the modules that the agent imports when it first needs them
+credcache = auth.credcache
+network = auth.network
+
+user_session = session.Session(("username", "password"))
+
 
 class TestPrintMsg(unittest.TestCase):
     def test_normal_string(self):
@@ -30,13 +40,75 @@ class TestGetQuery(unittest.TestCase):
     def test_exit_query(self):
         for syn in synonyms.terms["exit"]:
             with mock.patch("click.prompt", side_effect=[syn]):
-                self.assertIsNone(agent.get_query())
+                self.assertIsNone(agent.get_query(user_session))
+
+
+class TestAuthoriseUser(unittest.TestCase):
+    def test_remembered_login_checked_in_background(self):
+        checking = threading.Event()
+
+        def check_credentials(credentials):
+            self.assertTrue(checking.wait(5))
+            return network.StatusCode.SUCCESS
+
+        with mock.patch("auth.check_credentials", side_effect=check_credentials), \
+                mock.patch("session.Session.prefetch_lists") as prefetch_lists:
+            user_session = agent.authorise_user(("user", "password"), remembered=True)
+
+            # the session is ready before MAL has answered
+            self.assertFalse(user_session.login_check.done())
+
+            checking.set()
+            self.assertEqual(user_session.login_check.result(5), network.StatusCode.SUCCESS)
+
+        prefetch_lists.assert_called_once_with()
+
+
+class TestConfirmLogin(unittest.TestCase):
+    def setUp(self):
+        self.cache = mock.Mock()
+        credcache.set_cache(self.cache)
+        self.addCleanup(credcache.set_cache, None)
+
+        self.session = session.Session(("user", "password"))
+        self.session.login_check = Future()
+
+    def test_accepted(self):
+        self.session.login_check.set_result(network.StatusCode.SUCCESS)
+
+        self.assertIs(agent.confirm_login(self.session), self.session)
+        self.assertIsNone(self.session.login_check)
+        self.cache.save.assert_called_once_with(("user", "password"))
+
+    def test_turned_down(self):
+        self.session.login_check.set_result(network.StatusCode.UNAUTHORISED)
+        new_session = session.Session(("user", "new password"))
+
+        with mock.patch.object(agent, "authorise_user", return_value=new_session), mock.patch("click.echo"):
+            self.assertIs(agent.confirm_login(self.session), new_session)
+
+        self.cache.forget.assert_called_once_with()
+
+    def test_offline(self):
+        self.session.login_check.set_result(network.StatusCode.CONNECTION_ERROR)
+
+        self.assertIs(agent.confirm_login(self.session), self.session)
+        self.cache.forget.assert_not_called()
+        self.cache.save.assert_not_called()
+
+    def test_check_failed(self):
+        self.session.login_check.set_exception(RuntimeError("database is locked"))
+
+        self.assertIs(agent.confirm_login(self.session), self.session)
+        self.assertIsNone(self.session.login_check)
+        self.cache.forget.assert_not_called()
+        self.cache.save.assert_not_called()
 
 
 class TestProcessQuery(unittest.TestCase):
     def test_exit_query(self):
         for syn in synonyms.terms["exit"]:
-            self.assertEqual(agent.process_query(syn).name, query_processing.Extras.EXIT.name)
+            self.assertEqual(agent.process_query(syn, user_session).name, query_processing.Extras.EXIT.name)
 
 
 if __name__ == '__main__':
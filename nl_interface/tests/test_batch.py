@@ -0,0 +1,124 @@
+import sys
+import threading
+import time
+import unittest
+from io import StringIO
+from unittest import mock
+
+from nl_interface import batch
+
+qp = batch.qp
+
+
+class TestReadCommands(unittest.TestCase):
+    def test_skips_blank_lines_and_comments(self):
+        lines = ["# weekly sync\n", "add naruto\n", "\n", "   \n", "  set episode count for bleach to 3  \n"]
+
+        self.assertEqual(list(batch.read_commands(lines)), ["add naruto", "set episode count for bleach to 3"])
+
+
+class TestCommandKey(unittest.TestCase):
+    def test_entry_operations(self):
+        self.assertEqual(batch.command_key(qp.process("add Naruto")), (qp.MediaType.ANIME, "naruto"))
+        self.assertEqual(batch.command_key(qp.process("set episode count for naruto to 3")),
+                         batch.command_key(qp.process("increment naruto")))
+        self.assertNotEqual(batch.command_key(qp.process("add naruto")),
+                            batch.command_key(qp.process("add naruto manga")))
+
+    def test_other_commands(self):
+        for query in ["view my anime list", "hello", "flibbertigibbet"]:
+            self.assertIsNone(batch.command_key(qp.process(query)), query)
+
+
+class TestListKey(unittest.TestCase):
+    def test_list_changes(self):
+        self.assertEqual(batch.list_key(qp.process("increment naruto")), qp.MediaType.ANIME)
+        self.assertEqual(batch.list_key(qp.process("increment Naruto Shippuden")),
+                         batch.list_key(qp.process("delete naruto")))
+        self.assertNotEqual(batch.list_key(qp.process("increment naruto")),
+                            batch.list_key(qp.process("increment naruto manga")))
+
+    def test_other_commands(self):
+        for query in ["add naruto", "search for naruto", "view my anime list", "hello"]:
+            self.assertIsNone(batch.list_key(qp.process(query)), query)
+
+
+class TestRunBatch(unittest.TestCase):
+    def setUp(self):
+        self.out = StringIO()
+        self.stdout = sys.stdout
+        sys.stdout = self.out
+
+        self.session = batch.session.Session(("user", "password"))
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+
+    def test_output_in_order(self):
+        def process_query(query, user_session):
+            # make the earlier commands finish last
+            time.sleep(0.05 if query.endswith("a") else 0)
+            print("done " + query)
+
+        with mock.patch.object(batch.agent, "process_query", side_effect=process_query):
+            not_understood = batch.run_batch(["add a", "add b", "add c"], self.session)
+
+        self.assertEqual(not_understood, 0)
+        self.assertEqual([line for line in self.out.getvalue().splitlines() if line.startswith("done")],
+                         ["done add a", "done add b", "done add c"])
+
+    def test_concurrent_entries(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        # would time out if the commands for different entries weren't carried out at the same time
+        with mock.patch.object(batch.agent, "process_query", side_effect=lambda query, user_session: barrier.wait()):
+            batch.run_batch(["add a", "add b", "add c"], self.session)
+
+    def test_same_entry_in_order(self):
+        running = []
+        overlapped = []
+
+        def process_query(query, user_session):
+            overlapped.append(bool(running))
+            running.append(query)
+            time.sleep(0.02)
+            running.remove(query)
+
+        with mock.patch.object(batch.agent, "process_query", side_effect=process_query):
+            batch.run_batch(["increment naruto", "set episode count for naruto to 5", "increment naruto"],
+                            self.session)
+
+        self.assertEqual(overlapped, [False, False, False])
+
+    def test_same_list_changes_in_order(self):
+        running = []
+        overlapped = []
+
+        def process_query(query, user_session):
+            overlapped.append(bool(running))
+            running.append(query)
+            time.sleep(0.02)
+            running.remove(query)
+
+        # both names may pick out the same entry, so the increments mustn't overwrite each other
+        with mock.patch.object(batch.agent, "process_query", side_effect=process_query):
+            batch.run_batch(["increment naruto", "increment Naruto Shippuden", "delete naruto"], self.session)
+
+        self.assertEqual(overlapped, [False, False, False])
+
+    def test_exit_and_not_understood(self):
+        with mock.patch.object(batch.agent, "process_query") as process_query:
+            not_understood = batch.run_batch(["flibbertigibbet", "hello", "exit", "add naruto"], self.session)
+
+        self.assertEqual(not_understood, 1)
+        self.assertEqual([c[0][0] for c in process_query.call_args_list], ["flibbertigibbet", "hello"])
+
+    def test_stdout_restored(self):
+        with mock.patch.object(batch.agent, "process_query"):
+            batch.run_batch(["add naruto"], self.session)
+
+        self.assertIs(sys.stdout, self.out)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import threading
+import unittest
+from unittest import mock
+
+from nl_interface import bootstrap
+
+
+class TestBootstrap(unittest.TestCase):
+    def test_loads_while_user_types(self):
+        typing = threading.Event()
+        modules = {"agent": mock.Mock(), "network": mock.Mock()}
+
+        def import_module(name):
+            # finish loading only once the user has started typing, to show that it doesn't hold them up
+            self.assertTrue(typing.wait(5))
+            return modules[name]
+
+        with mock.patch.object(bootstrap.importlib, "import_module", side_effect=import_module):
+            startup = bootstrap.Bootstrap()
+            startup.ask(typing.set)
+
+            self.assertIs(startup.wait(), modules["agent"])
+
+        modules["agent"].preload.assert_called_once_with()
+        modules["network"].warm_up.assert_called_once_with()
+        self.assertEqual(sorted(startup.timings), ["connect", "load", "preload"])
+
+    def test_agent_not_held_up_by_preload(self):
+        preloading = threading.Event()
+        agent = mock.Mock()
+        agent.preload.side_effect = lambda: self.assertTrue(preloading.wait(5))
+
+        with mock.patch.object(bootstrap.importlib, "import_module", return_value=agent):
+            startup = bootstrap.Bootstrap()
+
+            self.assertIs(startup.wait(connected=False), agent)
+            self.assertNotIn("preload", startup.timings)
+
+            preloading.set()
+            self.assertIs(startup.wait(), agent)
+
+        self.assertIn("preload", startup.timings)
+
+    def test_error_raised_by_wait(self):
+        with mock.patch.object(bootstrap.importlib, "import_module", side_effect=ImportError("no lxml")):
+            startup = bootstrap.Bootstrap()
+
+            with self.assertRaises(ImportError):
+                startup.wait()
+
+    def test_report(self):
+        with mock.patch.object(bootstrap.importlib, "import_module"):
+            startup = bootstrap.Bootstrap(started_at=0)
+            startup.wait()
+
+        startup.timings = {"load": 0.3, "connect": 0.5, "ready": 4.0}
+        startup.user_time = 3.5
+
+        self.assertEqual(startup.report(), "Started in 0.50s (3.50s more was spent logging in): program loaded after "
+                                           "0.30s, connected to MAL after 0.50s, ready after 4.00s")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from nl_interface import client
+from nl_interface import constants
+from stubserver import server
+
+
+class TestRequests(unittest.TestCase):
+    def test_invalid_media_type(self):
+        self.assertRaises(ValueError, client.run, client.search(("username", "password"), "badtype", "test"))
+        self.assertRaises(ValueError, client.run, client.fetch_list("username", "badtype"))
+        self.assertRaises(ValueError, client.run, client.delete_entry(("username", "password"), "badtype", 1))
+
+    def test_search(self):
+        with mock.patch.object(client.network, "make_request", return_value="response") as make_request:
+            result = client.run(client.search(("username", "password"), "anime", "cowboy bebop"))
+
+        self.assertEqual(result, "response")
+        make_request.assert_called_once_with("get", url=constants.BASE_URL + "/api/anime/search.xml?q=cowboy+bebop",
+                                             endpoint=client.network.Endpoint.SEARCH, auth=("username", "password"),
+                                             stream=True)
+
+    def test_update_entry(self):
+        with mock.patch.object(client.network, "make_request") as make_request:
+            client.run(client.update_entry(("username", "password"), "manga", 2, "<entry></entry>"))
+
+        make_request.assert_called_once_with("get", url=constants.BASE_URL + "/api/mangalist/update/2.xml",
+                                             endpoint=client.network.Endpoint.LIST_WRITE, params={"data": "<entry></entry>"},
+                                             auth=("username", "password"))
+
+    def test_delete_entry(self):
+        with mock.patch.object(client.network, "make_request") as make_request:
+            client.run(client.delete_entry(("username", "password"), "anime", 1))
+
+        make_request.assert_called_once_with("delete", url=constants.BASE_URL + "/api/animelist/delete/1.xml",
+                                             endpoint=client.network.Endpoint.LIST_WRITE, auth=("username", "password"))
+
+
+class TestConcurrency(unittest.TestCase):
+    def test_fetch_lists(self):
+        def fake_request(method, url, endpoint, params, stream):
+            return params["type"]
+
+        with mock.patch.object(client.network, "make_request", side_effect=fake_request):
+            self.assertEqual(client.run(client.fetch_lists("username")), {"anime": "anime", "manga": "manga"})
+
+    def test_requests_are_bounded(self):
+        lock = threading.Lock()
+        in_flight = [0]
+        peak = [0]
+
+        def slow_request(*args, **kwargs):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+
+        async def many_deletes():
+            await client.asyncio.gather(*[client.delete_entry(("username", "password"), "anime", i)
+                                          for i in range(client.MAX_CONCURRENT_REQUESTS * 3)])
+
+        with mock.patch.object(client.network, "make_request", side_effect=slow_request):
+            client.run(many_deletes())
+
+        self.assertGreater(peak[0], 1)
+        self.assertLessEqual(peak[0], client.MAX_CONCURRENT_REQUESTS)
+
+    def test_semaphore_per_loop(self):
+        async def get_semaphores():
+            return client._get_semaphore(), client._get_semaphore()
+
+        first, again = client.run(get_semaphores())
+        other, _ = client.run(get_semaphores())
+
+        self.assertIs(first, again)
+        self.assertIsNot(first, other)
+
+    def test_semaphore_outside_loop(self):
+        self.assertRaises(RuntimeError, client._get_semaphore)
+
+
+class TestAgainstStubServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = server.start_in_thread(server.StubConfig(list_size=20, users={"user": "password"}))
+
+        patcher = mock.patch.object(client.constants, "BASE_URL", cls.server.base_url)
+        patcher.start()
+        cls.addClassCleanup(patcher.stop)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        # earlier failures to reach the real MAL may have opened the breaker
+        client.network.breaker.reset()
+
+    def test_verify_credentials(self):
+        self.assertEqual(client.run(client.verify_credentials(("user", "password"))).status_code, 200)
+        self.assertEqual(client.run(client.verify_credentials(("user", "wrong"))).status_code, 401)
+
+    def test_fetch_lists(self):
+        results = client.run(client.fetch_lists("user"))
+
+        self.assertEqual(results["anime"].status_code, 200)
+        self.assertIn(b"<series_animedb_id>", results["anime"].content)
+        self.assertIn(b"<series_mangadb_id>", results["manga"].content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+from nl_interface import auth
+
+credcache = auth.credcache
+
+
+class FakeKeyring:
+    """Stands in for the keyring package, keeping passwords in a dictionary"""
+
+    class errors:
+        class KeyringError(Exception):
+            pass
+
+    def __init__(self, fail=False):
+        self.passwords = {}
+        self.fail = fail
+
+    def set_password(self, service, username, password):
+        if self.fail:
+            raise self.errors.KeyringError("no backend")
+        self.passwords[(service, username)] = password
+
+    def get_password(self, service, username):
+        return self.passwords.get((service, username))
+
+    def delete_password(self, service, username):
+        self.passwords.pop((service, username))
+
+
+class TestCredentialCache(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        self.path = os.path.join(directory.name, "sammy", credcache.LOGIN_FILENAME)
+
+    def test_saved_to_private_file(self):
+        cache = credcache.CredentialCache(self.path, use_keyring=False)
+        cache.save(("user", "password"))
+
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+        self.assertEqual(credcache.CredentialCache(self.path, use_keyring=False).load(), ("user", "password"))
+
+    def test_expired(self):
+        cache = credcache.CredentialCache(self.path, valid_for=60, use_keyring=False)
+
+        with mock.patch.object(credcache.time, "time", return_value=1000):
+            cache.save(("user", "password"))
+
+        with mock.patch.object(credcache.time, "time", return_value=1061):
+            self.assertIsNone(cache.load())
+
+    def test_forget(self):
+        cache = credcache.CredentialCache(self.path, use_keyring=False)
+        cache.save(("user", "password"))
+        cache.forget()
+
+        self.assertFalse(os.path.exists(self.path))
+        self.assertIsNone(cache.load())
+
+    def test_corrupt_file_ignored(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w") as f:
+            f.write('{"username": ')
+
+        self.assertIsNone(credcache.CredentialCache(self.path, use_keyring=False).load())
+
+    def test_keyring(self):
+        keyring = FakeKeyring()
+
+        with mock.patch.object(credcache, "keyring", keyring):
+            cache = credcache.CredentialCache(self.path)
+            cache.save(("user", "password"))
+
+            # the password is only in the keyring
+            with open(self.path) as f:
+                self.assertNotIn("password", f.read())
+            self.assertEqual(cache.load(), ("user", "password"))
+
+            cache.forget()
+            self.assertEqual(keyring.passwords, {})
+
+    def test_keyring_failure_falls_back_to_file(self):
+        with mock.patch.object(credcache, "keyring", FakeKeyring(fail=True)):
+            cache = credcache.CredentialCache(self.path)
+            cache.save(("user", "password"))
+
+            self.assertEqual(cache.load(), ("user", "password"))
+
+    def test_off_by_default(self):
+        with mock.patch.object(credcache, "REMEMBER_LOGIN", False):
+            self.assertIsNone(credcache.get_cache())
+
+            # nothing is remembered when it is off
+            auth.remember_credentials(("user", "password"))
+            self.assertIsNone(credcache.get_cache())
+
+
+if __name__ == '__main__':
+    unittest.main()
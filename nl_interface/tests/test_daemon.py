@@ -0,0 +1,117 @@
+import json
+import sys
+import threading
+import unittest
+from unittest import mock
+from urllib.request import urlopen
+
+from nl_interface import daemon
+from nl_interface import daemonclient
+from stubserver import server
+
+
+class TestResultToJson(unittest.TestCase):
+    def test_enums_replaced_by_names(self):
+        result = daemon.result_to_json(daemon.qp.process("set the episode count of naruto to 5"))
+
+        self.assertEqual(result, {"operation": "UPDATE", "type": "ANIME", "term": "naruto", "modifier": "EPISODE",
+                                  "value": 5, "extra": None})
+        json.dumps(result)
+
+    def test_exit(self):
+        self.assertEqual(daemon.result_to_json(daemon.qp.process("exit")), {"extra": "EXIT"})
+
+
+class TestDaemonServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = server.start_in_thread(server.StubConfig(list_size=20, users={"user": "password",
+                                                                                 "other": "secret"}))
+
+        patcher = mock.patch.object(daemon.auth.client.constants, "BASE_URL", cls.stub.base_url)
+        patcher.start()
+        cls.addClassCleanup(patcher.stop)
+
+        # answer questions like the daemon does
+        daemon.ui.set_answer_policy(daemon.ui.AnswerPolicy.BEST)
+
+        cls.server = daemon.DaemonServer(("127.0.0.1", 0))
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.stub.shutdown()
+        cls.stub.server_close()
+
+        daemon.ui.set_answer_policy(None)
+
+    def setUp(self):
+        # earlier failures to reach the real MAL may have opened the breaker
+        daemon.auth.client.network.breaker.reset()
+
+        # collect the output of each query like the daemon does
+        self.stdout = sys.stdout
+        sys.stdout = daemon.ui.ThreadOutput(sys.stdout)
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+
+    def test_status(self):
+        with urlopen(self.server.base_url + "/status") as response:
+            body = json.loads(response.read().decode("utf-8"))
+
+        self.assertEqual(body["status"], "ok")
+        self.assertEqual(body["rate_limits"]["SEARCH"]["queue_depth"], 0)
+
+    def test_query(self):
+        status, body = daemonclient.send_query(self.server.base_url, ("user", "password"), "hello")
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body["result"]["extra"], "GREETING")
+        self.assertIn("user!", body["output"])
+
+    def test_credentials_per_query(self):
+        results = {}
+
+        def send(credentials):
+            results[credentials[0]] = daemonclient.send_query(self.server.base_url, credentials, "hello")
+
+        threads = [threading.Thread(target=send, args=(credentials,))
+                   for credentials in [("user", "password"), ("other", "secret")] * 5]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIn("user!", results["user"][1]["output"])
+        self.assertIn("other!", results["other"][1]["output"])
+
+    def test_unauthorised(self):
+        status, body = daemonclient.send_query(self.server.base_url, ("user", "wrong"), "hello")
+
+        self.assertEqual(status, 401)
+        self.assertEqual(body["error"], "UNAUTHORISED")
+
+    def test_credentials_verified_once(self):
+        daemonclient.send_query(self.server.base_url, ("user", "password"), "hello")
+
+        with mock.patch.object(daemon.auth, "validate_credentials") as validate_credentials:
+            status, body = daemonclient.send_query(self.server.base_url, ("user", "password"), "hello")
+
+        self.assertEqual(status, 200)
+        validate_credentials.assert_not_called()
+
+    def test_invalid_request(self):
+        status, body = daemonclient.send_query(self.server.base_url, ("user", None), "hello")
+
+        self.assertEqual(status, 400)
+
+    def test_not_found(self):
+        self.assertEqual(daemonclient.send_query(self.server.base_url + "/missing", ("user", "password"), "hi")[0],
+                         404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,31 @@
 import unittest
+from unittest import mock
 
 from nl_interface import delete
+from nl_interface import session
 from nl_interface.tests.constants_for_tests import credentials
 
+records = delete.writequeue.liststore.records
+
 
 class TestDeleteEntry(unittest.TestCase):
     def test_invalid_entry_type(self):
-        self.assertRaises(ValueError, delete.delete_entry, credentials, "badentrytype", "")
+        self.assertRaises(ValueError, delete.delete_entry, session.Session(credentials), "badentrytype", "")
+
+    def test_rejected(self):
+        entry = records.list_entry("anime", {"series_animedb_id": "20", "series_title": "Naruto"})
+        user_session = mock.Mock()
+        response = mock.Mock(status_code=400, text="Invalid ID")
+
+        with mock.patch.object(delete.update, "search_list", return_value=entry), \
+                mock.patch.object(delete.ui, "confirm", return_value=True), \
+                mock.patch.object(delete.writequeue, "get_queue"), \
+                mock.patch.object(delete.journal, "send_change", return_value=response), \
+                mock.patch.object(delete.agent, "print_msg") as print_msg:
+            delete.delete_entry(user_session, "anime", "naruto")
+
+        print_msg.assert_called_once_with("I'm sorry there was an error deleting \"Naruto\". Invalid ID")
+        user_session.store.delete_entry.assert_not_called()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,249 @@
+from collections import OrderedDict
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from nl_interface import journal, session, writequeue
+from stubserver import server
+
+Action = journal.Action
+liststore = writequeue.liststore
+network = journal.network
+
+
+def make_record(seq, action, entry_id="1", **fields):
+    return journal.Record(seq, "user", "anime", action, entry_id, OrderedDict(sorted(fields.items())))
+
+
+def summarise(journal_records):
+    return [(record.action, record.entry_id, dict(record.fields)) for record in journal_records]
+
+
+class TestCompactRecords(unittest.TestCase):
+    def test_updates_merged(self):
+        compacted = journal.compact_records([make_record(1, Action.UPDATE, episode=1),
+                                             make_record(2, Action.UPDATE, "2", score=7),
+                                             make_record(3, Action.UPDATE, episode=2, status=1)])
+
+        self.assertEqual(summarise(compacted), [(Action.UPDATE, "1", {"episode": 2, "status": 1}),
+                                                (Action.UPDATE, "2", {"score": 7})])
+
+    def test_update_merged_into_add(self):
+        compacted = journal.compact_records([make_record(1, Action.ADD, status=6),
+                                             make_record(2, Action.UPDATE, status=1)])
+
+        self.assertEqual(summarise(compacted), [(Action.ADD, "1", {"status": 1})])
+
+    def test_delete_replaces_update(self):
+        compacted = journal.compact_records([make_record(1, Action.UPDATE, episode=1), make_record(2, Action.DELETE)])
+
+        self.assertEqual(summarise(compacted), [(Action.DELETE, "1", {})])
+
+    def test_add_then_delete_dropped(self):
+        compacted = journal.compact_records([make_record(1, Action.ADD, status=6),
+                                             make_record(2, Action.UPDATE, score=3),
+                                             make_record(3, Action.DELETE)])
+
+        self.assertEqual(compacted, [])
+
+    def test_delete_then_add_kept(self):
+        compacted = journal.compact_records([make_record(1, Action.DELETE), make_record(2, Action.ADD, status=6)])
+
+        self.assertEqual(summarise(compacted), [(Action.DELETE, "1", {}), (Action.ADD, "1", {"status": 6})])
+
+    def test_in_flight_left_alone(self):
+        compacted = journal.compact_records([make_record(1, Action.UPDATE, episode=1),
+                                             make_record(2, Action.UPDATE, episode=2),
+                                             make_record(3, Action.UPDATE, episode=3),
+                                             make_record(4, Action.UPDATE, episode=4)], in_flight={2})
+
+        self.assertEqual([record.seq for record in compacted], [1, 2, 3])
+        self.assertEqual(compacted[2].fields, {"episode": 4})
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+        self.path = os.path.join(self.directory.name, "journal.jsonl")
+        self.journal = journal.Journal(self.path)
+
+    def test_in_flight_and_parked(self):
+        first = self.journal.append("user", "anime", Action.UPDATE, 1, {"episode": 1})
+        second = self.journal.append("user", "anime", Action.DELETE, 2, {}, in_flight=False)
+
+        self.assertEqual(self.journal.parked("user"), [second])
+        self.assertEqual(self.journal.pending("user", "anime"), [first, second])
+        self.assertEqual(self.journal.pending("user", "anime", 1), [first])
+        self.assertFalse(self.journal.has_parked("other"))
+        self.assertFalse(self.journal.has_parked("user", "anime", 1))
+
+        self.journal.park(first.seq)
+        self.assertTrue(self.journal.has_parked("user", "anime", 1))
+
+        self.assertTrue(self.journal.claim(first.seq))
+        self.assertFalse(self.journal.claim(first.seq))
+
+    def test_survives_restart(self):
+        first = self.journal.append("user", "anime", Action.UPDATE, 1, OrderedDict([("status", 1), ("episode", 3)]),
+                                    "Naruto")
+        second = self.journal.append("user", "manga", Action.DELETE, 2, {}, "Berserk")
+        self.journal.finish(second.seq)
+
+        reopened = journal.Journal(self.path)
+
+        self.assertEqual(summarise(reopened.parked("user")), summarise([first]))
+        self.assertEqual(list(reopened.parked("user")[0].fields), ["status", "episode"])
+        self.assertEqual(reopened.parked("user")[0].title, "Naruto")
+
+        # new changes carry on from the last seq
+        self.assertGreater(reopened.append("user", "anime", Action.UPDATE, 1, {"score": 5}).seq, first.seq)
+
+    def test_incomplete_line_ignored(self):
+        self.journal.append("user", "anime", Action.UPDATE, 1, {"episode": 1})
+
+        with open(self.path, "a") as f:
+            f.write('{"seq": 2, "username": "us')
+
+        reopened = journal.Journal(self.path)
+        reopened.append("user", "anime", Action.UPDATE, 2, {"episode": 2})
+
+        self.assertEqual(summarise(journal.Journal(self.path).parked("user")),
+                         [(Action.UPDATE, "1", {"episode": 1}), (Action.UPDATE, "2", {"episode": 2})])
+
+    def test_compacted_file(self):
+        for episode in range(1, journal.COMPACT_AFTER + 1):
+            record = self.journal.append("user", "anime", Action.UPDATE, 1, {"episode": episode})
+            self.journal.finish(record.seq)
+
+        self.journal.append("user", "anime", Action.UPDATE, 1, {"episode": 100}, in_flight=False)
+
+        with open(self.path) as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+    def test_apply_pending(self):
+        store = liststore.ListStore(":memory:")
+        entry = liststore.records.list_entry("anime", {"series_animedb_id": "1", "series_title": "Naruto",
+                                                       "my_watched_episodes": "1"})
+        store.replace_list("user", "anime", [entry, liststore.records.list_entry("anime", {"series_animedb_id": "2"})])
+
+        new_entry = liststore.records.list_entry("anime", {"series_animedb_id": "3", "series_title": "Bleach"})
+        self.journal.append("user", "anime", Action.UPDATE, 1, {"episode": 5})
+        self.journal.append("user", "anime", Action.DELETE, 2, {})
+        self.journal.append("user", "anime", Action.ADD, 3, {"status": 1}, entry=new_entry)
+
+        self.journal.apply_pending(store, "user", "anime")
+
+        self.assertEqual([entry.series_id for entry in store.get_entries("user", "anime")], [1, 3])
+        self.assertEqual(store.get_entry("user", "anime", 1).watched_episodes, 5)
+        self.assertEqual(store.get_entry("user", "anime", 3).status, "1")
+
+
+class TestAgainstStubServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = server.start_in_thread(server.StubConfig(list_size=5, users={"user": "password"}))
+
+        patcher = mock.patch.object(journal.client.constants, "BASE_URL", cls.server.base_url)
+        patcher.start()
+        cls.addClassCleanup(patcher.stop)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        # earlier failures to reach the real MAL may have opened the breaker
+        network.breaker.reset()
+
+        liststore.set_store(liststore.ListStore(":memory:"))
+        self.addCleanup(liststore.set_store, None)
+
+        self.journal = journal.Journal(None)
+        journal.set_journal(self.journal)
+        self.addCleanup(journal.set_journal, None)
+
+        self.session = session.Session(("user", "password"))
+        self.entries = self.server.mal.list_entries("user", "anime")
+
+    def test_replay_in_order(self):
+        first, second = [entry["series_animedb_id"] for entry in self.entries[:2]]
+
+        self.journal.append("user", "anime", Action.UPDATE, first, {"episode": 1}, in_flight=False)
+        self.journal.append("user", "anime", Action.UPDATE, first, {"episode": 2}, in_flight=False)
+        self.journal.append("user", "anime", Action.DELETE, second, {}, in_flight=False)
+
+        with mock.patch.object(journal, "send", wraps=journal.send) as send:
+            self.assertTrue(journal.replay(self.session))
+
+        # the two updates were collapsed into one
+        self.assertEqual(send.call_count, 2)
+        self.assertFalse(self.journal.has_parked("user"))
+
+        entries = {entry["series_animedb_id"]: entry for entry in self.server.mal.list_entries("user", "anime")}
+        self.assertEqual(entries[first]["my_watched_episodes"], "2")
+        self.assertNotIn(second, entries)
+
+    def test_replay_stops_while_offline(self):
+        first = self.entries[0]["series_animedb_id"]
+        self.journal.append("user", "anime", Action.UPDATE, first, {"episode": 1}, in_flight=False)
+        self.journal.append("user", "anime", Action.UPDATE, "2", {"episode": 1}, in_flight=False)
+
+        with mock.patch.object(journal, "send", return_value=network.StatusCode.CONNECTION_ERROR) as send:
+            self.assertFalse(journal.replay(self.session))
+
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual(len(self.journal.parked("user")), 2)
+
+    def test_replay_error_parks(self):
+        first = self.entries[0]["series_animedb_id"]
+        record = self.journal.append("user", "anime", Action.UPDATE, first, {"episode": 1}, in_flight=False)
+
+        with mock.patch.object(journal, "send", side_effect=RuntimeError("cannot schedule new futures")):
+            with self.assertRaises(RuntimeError):
+                journal.replay(self.session)
+
+        # the change can still be sent by a later replay
+        self.assertEqual(self.journal.parked("user"), [record])
+        self.assertTrue(self.journal.claim(record.seq))
+
+    def test_send_change_error_parks(self):
+        first = self.entries[0]["series_animedb_id"]
+
+        with mock.patch.object(journal, "send", side_effect=RuntimeError("cannot schedule new futures")):
+            with self.assertRaises(RuntimeError):
+                journal.send_change(self.session, Action.DELETE, "anime", first, {}, "Title", "Deleting")
+
+        record, = self.journal.parked("user")
+        self.assertTrue(self.journal.claim(record.seq))
+
+    def test_send_change_parks_while_offline(self):
+        first = self.entries[0]["series_animedb_id"]
+
+        with mock.patch.object(journal, "send", return_value=network.StatusCode.CONNECTION_ERROR):
+            self.assertIsNone(journal.send_change(self.session, Action.DELETE, "anime", first, {}, "Title", "Deleting"))
+
+        self.assertEqual(summarise(self.journal.parked("user")), [(Action.DELETE, first, {})])
+
+        # later changes to the entry wait behind the parked one
+        with mock.patch.object(journal, "replay_in_background") as replay_in_background:
+            self.assertIsNone(journal.send_change(self.session, Action.ADD, "anime", first, {"status": 6}, "Title",
+                                                  "Adding"))
+            replay_in_background.assert_called_once_with(self.session)
+
+        self.assertEqual(len(self.journal.parked("user")), 2)
+
+    def test_send_change(self):
+        first = self.entries[0]["series_animedb_id"]
+
+        r = journal.send_change(self.session, Action.UPDATE, "anime", first, {"score": 9}, "Title", "Updating")
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(self.journal.pending("user", "anime"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+
+from nl_interface import listindex
+from nl_interface import records
+
+
+def make_entries(*titles):
+    return [records.list_entry("anime", {"series_animedb_id": str(i), "series_title": title,
+                                         "series_synonyms": synonyms}) for i, (title, synonyms) in enumerate(titles, 1)]
+
+
+class TestTokenise(unittest.TestCase):
+    def test_tokenise(self):
+        self.assertEqual(listindex.tokenise("Steins;Gate 0"), ["steins", "gate", "0"])
+        self.assertEqual(listindex.tokenise("  "), [])
+
+
+class TestListIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = listindex.ListIndex(make_entries(
+            ("Shingeki no Kyojin", "; Attack on Titan"),
+            ("Fullmetal Alchemist", "; Hagane no Renkinjutsushi"),
+            ("Fullmetal Alchemist: Brotherhood", ""),
+            ("Naruto", ""),
+            ("Naruto: Shippuuden", "")))
+
+    def titles(self, search_string):
+        return [entry.title for entry in self.index.search(search_string)]
+
+    def test_every_token_must_match(self):
+        self.assertEqual(self.titles("fullmetal brotherhood"), ["Fullmetal Alchemist: Brotherhood"])
+        self.assertEqual(self.titles("naruto"), ["Naruto", "Naruto: Shippuuden"])
+
+    def test_synonyms(self):
+        self.assertEqual(self.titles("attack on titan"), ["Shingeki no Kyojin"])
+
+    def test_stopwords(self):
+        # stopwords are ignored unless the query is made up of nothing else
+        self.assertEqual(self.titles("the naruto shippuuden"), ["Naruto: Shippuuden"])
+        self.assertEqual(self.titles("no"), ["Shingeki no Kyojin", "Fullmetal Alchemist"])
+
+    def test_partial_words(self):
+        self.assertEqual(self.titles("alchem"), ["Fullmetal Alchemist", "Fullmetal Alchemist: Brotherhood"])
+
+    def test_any_token_fallback(self):
+        self.assertEqual(self.titles("naruto kyojin"), ["Shingeki no Kyojin", "Naruto", "Naruto: Shippuuden"])
+
+    def test_no_results(self):
+        self.assertEqual(self.titles("longstringthatshouldnotreturnaresult"), [])
+        self.assertEqual(self.titles(""), [])
+
+    def test_rank(self):
+        ranked = self.index.rank("fullmetal alchemist")
+
+        self.assertEqual([entry.title for entry, score in ranked],
+                         ["Fullmetal Alchemist", "Fullmetal Alchemist: Brotherhood"])
+        self.assertEqual(ranked[0][1], 1.0)
+        self.assertTrue(listindex.should_auto_select(ranked, 0.85))
+
+    def test_rank_typos(self):
+        ranked = self.index.rank("shingeki no kyojn", min_score=0.3)
+        self.assertEqual(ranked[0][0].title, "Shingeki no Kyojin")
+
+        ranked = self.index.rank("atack on titan", min_score=0.3)
+        self.assertEqual([entry.title for entry, score in ranked], ["Shingeki no Kyojin"])
+
+        self.assertEqual(self.index.rank("zzzzzz", min_score=0.3), [])
+
+    def test_rank_limit(self):
+        self.assertEqual(len(self.index.rank("naruto", limit=1)), 1)
+
+
+class TestTrigramIndex(unittest.TestCase):
+    def test_trigrams(self):
+        self.assertEqual(listindex.trigrams("No"), {"  n", " no", "no "})
+        self.assertEqual(listindex.trigrams(""), set())
+
+    def test_rank(self):
+        index = listindex.TrigramIndex([["Cowboy Bebop"], ["Cowboy Bebop: The Movie", "Tengoku no Tobira"], []])
+
+        self.assertEqual([position for position, score in index.rank("cowboy bebop")], [0, 1])
+        self.assertEqual([position for position, score in index.rank("tengoku no tobira")], [1])
+        self.assertEqual([position for position, score in index.rank("zzz", positions=[2, 0])], [0, 2])
+
+    def test_rank_candidates(self):
+        index = listindex.TrigramIndex([["Naruto"], ["Naruto Shippuden", "Naruto: Shippuuden"], ["Bleach"]])
+
+        # candidates are scored by their closest name just as they are when every item is ranked
+        self.assertEqual(index.rank("naruto shipuden", positions=[1, 2]),
+                         [result for result in index.rank("naruto shipuden") if result[0] in [1, 2]] + [(2, 0.0)])
+
+    def test_entry_names(self):
+        self.assertEqual(listindex.entry_names("Naruto", "", "; Naruto Shippuden; NS"),
+                         ["Naruto", "Naruto Shippuden", "NS"])
+
+    def test_should_auto_select(self):
+        self.assertFalse(listindex.should_auto_select([], 0.5))
+        self.assertFalse(listindex.should_auto_select([("a", 0.4)], 0.5))
+        self.assertFalse(listindex.should_auto_select([("a", 0.9), ("b", 0.9)], 0.5))
+        self.assertTrue(listindex.should_auto_select([("a", 0.9), ("b", 0.8)], 0.5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,328 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import requests
+import urllib3
+
+from nl_interface import liststore
+from stubserver import server
+
+# the records module used by the list store
+records = liststore.records
+
+
+class BrokenStream:
+    """The raw stream of a response whose connection drops after the first chunk"""
+
+    def stream(self, chunk_size, decode_content=True):
+        yield b"<?xml version=\"1.0\"?><myanimelist><anime><series_animedb_id>1</series"
+        raise urllib3.exceptions.ProtocolError("Connection broken")
+
+    def close(self):
+        pass
+
+
+def broken_response():
+    """Create a response that fails partway through its body, like one cut off by a connection reset
+
+    :return: A requests.Response
+    """
+    response = requests.Response()
+    response.status_code = 200
+    response.raw = BrokenStream()
+
+    return response
+
+
+def make_entry(entry_id, title, episodes="0"):
+    return records.list_entry("anime", {"series_animedb_id": entry_id, "series_title": title, "series_episodes": "12",
+                                        "my_watched_episodes": episodes, "my_status": "1"})
+
+
+class TestListStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "lists.sqlite3")
+        self.store = liststore.ListStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_missing_list(self):
+        self.assertFalse(self.store.has_list("user", "anime"))
+        self.assertTrue(self.store.is_stale("user", "anime"))
+        self.assertEqual(self.store.get_entries("user", "anime"), [])
+
+    def test_replace_list(self):
+        self.store.replace_list("user", "anime", [make_entry("2", "Bleach"), make_entry("1", "Naruto")])
+
+        self.assertTrue(self.store.has_list("user", "anime"))
+        self.assertFalse(self.store.is_stale("user", "anime"))
+        self.assertEqual([entry.title for entry in self.store.get_entries("user", "anime")],
+                         ["Bleach", "Naruto"])
+
+        self.store.replace_list("user", "anime", [make_entry("3", "Monster")], fetched_at=0)
+
+        self.assertTrue(self.store.is_stale("user", "anime"))
+        self.assertEqual([entry.title for entry in self.store.get_entries("user", "anime")], ["Monster"])
+
+    def test_changes_are_saved(self):
+        self.store.replace_list("user", "anime", [make_entry("1", "Naruto"), make_entry("2", "Bleach")])
+        self.store.update_entry("user", "anime", "1", {"episode": 5, "status": 2})
+        self.store.delete_entry("user", "anime", "2")
+        self.store.put_entry("user", "anime", make_entry("3", "Monster"))
+        self.store.close()
+
+        self.store = liststore.ListStore(self.path)
+        entries = self.store.get_entries("user", "anime")
+
+        self.assertEqual([entry.title for entry in entries], ["Naruto", "Monster"])
+        self.assertEqual(entries[0].watched_episodes, 5)
+        self.assertEqual(entries[0].status, "2")
+        self.assertEqual(self.store.generation("user", "anime"), 0)
+
+    def test_version(self):
+        version = liststore.ListVersion('"abc"', "Sun, 18 Oct 2026 10:00:00 GMT", "digest")
+        self.store.replace_list("user", "anime", [make_entry("1", "Naruto")], fetched_at=0, version=version)
+
+        self.assertEqual(self.store.get_version("user", "anime"), version)
+        self.assertEqual(version.request_headers(), {"If-None-Match": '"abc"',
+                                                     "If-Modified-Since": "Sun, 18 Oct 2026 10:00:00 GMT"})
+
+        self.store.mark_unchanged("user", "anime", version)
+        self.assertFalse(self.store.is_stale("user", "anime"))
+
+        # the stored copy no longer matches MAL's once it has been changed locally
+        self.store.update_entry("user", "anime", "1", {"episode": 5})
+        self.assertIsNone(self.store.get_version("user", "anime"))
+
+    def test_index_follows_changes(self):
+        self.store.replace_list("user", "anime", [make_entry("1", "Naruto")])
+        self.store.put_entry("user", "anime", make_entry("2", "Naruto Shippuuden"))
+
+        self.assertEqual(len(self.store.get_index("user", "anime").search("naruto")), 2)
+
+        self.store.delete_entry("user", "anime", "1")
+
+        self.assertEqual(len(self.store.get_index("user", "anime").search("naruto")), 1)
+
+    def test_update_missing_entry(self):
+        self.assertIsNone(self.store.update_entry("user", "anime", "1", {"episode": 5}))
+
+
+class TestNewListEntry(unittest.TestCase):
+    def test_anime(self):
+        search_entry = records.search_entry("anime", {"id": "7", "title": "Cowboy Bebop", "type": "Movie",
+                                                      "episodes": "1"})
+        entry = liststore.new_list_entry(search_entry, {"status": 2, "episode": "1", "score": 9})
+
+        self.assertIsInstance(entry, records.AnimeListEntry)
+        self.assertEqual(entry.series_id, 7)
+        self.assertEqual(entry.series_type, "3")
+        self.assertEqual(entry.watched_episodes, 1)
+        self.assertEqual(entry.status, "2")
+        self.assertEqual(entry.score, 9)
+
+    def test_manga(self):
+        search_entry = records.search_entry("manga", {"id": "9", "title": "Berserk", "type": "Manga", "chapters": "0",
+                                                      "volumes": "0"})
+        entry = liststore.new_list_entry(search_entry, {"status": 1, "chapter": 3})
+
+        self.assertIsInstance(entry, records.MangaListEntry)
+        self.assertEqual(entry.series_id, 9)
+        self.assertEqual(entry.read_chapters, 3)
+        self.assertEqual(entry.read_volumes, 0)
+
+
+class TestAgainstStubServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = server.start_in_thread(server.StubConfig(list_size=20, users={"user": "password"}))
+
+        patcher = mock.patch.object(liststore.client.constants, "BASE_URL", cls.server.base_url)
+        patcher.start()
+        cls.addClassCleanup(patcher.stop)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        # earlier failures to reach the real MAL may have opened the breaker
+        liststore.network.breaker.reset()
+
+        liststore.set_store(liststore.ListStore(":memory:"))
+        self.addCleanup(liststore.set_store, None)
+
+        liststore.journal.set_journal(liststore.journal.Journal(None))
+        self.addCleanup(liststore.journal.set_journal, None)
+
+    def test_get_list(self):
+        entries = liststore.get_list("user", "anime")
+
+        self.assertEqual(len(entries), 20)
+        self.assertIsInstance(entries[0], records.AnimeListEntry)
+        self.assertTrue(liststore.get_store().has_list("user", "anime"))
+
+    def test_large_list_spooled_to_disk(self):
+        with mock.patch.object(liststore, "SPOOL_SIZE", 16):
+            entries, version = liststore.download_list("user", "anime")
+
+        self.assertEqual(len(entries), 20)
+        self.assertEqual(len(version.digest), 40)
+
+    def test_stored_list_is_used(self):
+        liststore.get_list("user", "manga")
+
+        with mock.patch.object(liststore, "download_list") as download_list:
+            self.assertEqual(len(liststore.get_list("user", "manga")), 20)
+
+        download_list.assert_not_called()
+
+    def test_stale_list_is_refreshed_in_background(self):
+        store = liststore.get_store()
+        store.replace_list("user", "anime", [make_entry("1", "Naruto")], fetched_at=0)
+
+        threads = []
+        start_refresh = liststore.refresh_in_background
+
+        # the stale copy is returned straight away
+        with mock.patch.object(liststore, "refresh_in_background",
+                               side_effect=lambda *args: threads.append(start_refresh(*args))):
+            self.assertEqual(len(liststore.get_list("user", "anime")), 1)
+
+        self.assertEqual(len(threads), 1)
+        threads[0].join()
+
+        self.assertEqual(len(store.get_entries("user", "anime")), 20)
+
+    def test_refresh_keeps_local_changes(self):
+        store = liststore.get_store()
+        generation = store.generation("user", "anime")
+
+        def download_and_change(username, media_type, version):
+            store.put_entry(username, media_type, make_entry("1", "Naruto"))
+            return [make_entry("2", "Bleach")], liststore.ListVersion()
+
+        with mock.patch.object(liststore, "download_list", side_effect=download_and_change):
+            self.assertEqual(liststore.refresh("user", "anime"), liststore.network.StatusCode.SUCCESS)
+
+        # the download started before the local change so it must not overwrite it
+        self.assertGreater(store.generation("user", "anime"), generation)
+        self.assertEqual([entry.title for entry in store.get_entries("user", "anime")], ["Naruto"])
+
+    def test_refresh_keeps_unsent_changes(self):
+        store = liststore.get_store()
+        changes = liststore.journal.get_journal()
+        changes.append("user", "anime", liststore.journal.Action.UPDATE, "2", {"episode": 7})
+
+        downloaded = [make_entry("2", "Bleach", "1")], liststore.ListVersion()
+
+        with mock.patch.object(liststore, "download_list", return_value=downloaded):
+            self.assertEqual(liststore.refresh("user", "anime"), liststore.network.StatusCode.SUCCESS)
+
+        # MAL hasn't accepted the change yet, so its copy of the list doesn't have it
+        self.assertEqual(store.get_entry("user", "anime", "2").watched_episodes, 7)
+
+    def test_concurrent_downloads_shared(self):
+        results = []
+        real_download_list = liststore.download_list
+
+        def slow_download_list(*args):
+            # give every thread time to ask for the list while it is being downloaded
+            threading.Event().wait(0.2)
+            return real_download_list(*args)
+
+        with mock.patch.object(liststore, "download_list", side_effect=slow_download_list) as download_list:
+            threads = [threading.Thread(target=lambda: results.append(liststore.get_list("user", "manga")))
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual(download_list.call_count, 1)
+        self.assertEqual([len(entries) for entries in results], [20] * 4)
+
+    def test_unchanged_list_not_parsed(self):
+        liststore.get_list("user", "anime")
+        store = liststore.get_store()
+        store.replace_list("user", "anime", store.get_entries("user", "anime"), fetched_at=0,
+                           version=store.get_version("user", "anime"))
+
+        with mock.patch.object(liststore.xmlstream, "iter_entries") as iter_entries:
+            self.assertEqual(liststore.refresh("user", "anime"), liststore.network.StatusCode.SUCCESS)
+
+        iter_entries.assert_not_called()
+        self.assertFalse(store.is_stale("user", "anime"))
+
+    def test_connection_lost_while_reading(self):
+        with mock.patch.object(liststore.client, "fetch_list", mock.Mock()), \
+                mock.patch.object(liststore.client, "run", return_value=broken_response()):
+            self.assertEqual(liststore.download_list("user", "anime"), liststore.network.StatusCode.CONNECTION_ERROR)
+
+    def test_conditional_request(self):
+        self.server.mal.config.conditional_lists = True
+        self.addCleanup(setattr, self.server.mal.config, "conditional_lists", False)
+
+        liststore.get_list("user", "manga")
+        version = liststore.get_store().get_version("user", "manga")
+        self.assertTrue(version.etag)
+
+        self.assertEqual(liststore.download_list("user", "manga", version), (None, version))
+
+        # a list changed on MAL is downloaded again
+        entry = self.server.mal.list_entries("user", "manga")[0]
+        self.server.mal.update("user", "manga", entry["series_mangadb_id"], {"score": "3"})
+        self.assertEqual(liststore.refresh("user", "manga"), liststore.network.StatusCode.SUCCESS)
+
+        self.assertEqual(liststore.get_store().get_entry("user", "manga", entry["series_mangadb_id"]).score, 3)
+        self.assertNotEqual(liststore.get_store().get_version("user", "manga"), version)
+
+    def test_prefetch(self):
+        store = liststore.get_store()
+        store.replace_list("user", "manga", [make_entry("1", "Naruto")])
+
+        prefetch = liststore.Prefetch("user")
+        self.assertTrue(prefetch.join(5))
+
+        # the stale anime list was downloaded while the fresh manga list was left alone, and both were indexed
+        self.assertEqual(len(store.get_entries("user", "anime")), 20)
+        self.assertEqual(len(store.get_entries("user", "manga")), 1)
+        self.assertIn(("user", "anime"), store._indexes)
+        self.assertIn(("user", "manga"), store._indexes)
+
+    def test_prefetch_cancelled(self):
+        downloading = threading.Event()
+        release = threading.Event()
+        real_download_list = liststore.download_list
+
+        def blocked_download_list(*args):
+            downloading.set()
+            release.wait(5)
+            return real_download_list(*args)
+
+        with mock.patch.object(liststore, "download_list", side_effect=blocked_download_list) as download_list:
+            prefetch = liststore.Prefetch("user", ["anime"])
+            self.assertTrue(downloading.wait(5))
+
+            prefetch.cancel()
+            release.set()
+            self.assertTrue(prefetch.join(5))
+
+        # the download that had already been sent is kept, but the list isn't indexed
+        self.assertEqual(download_list.call_count, 1)
+        self.assertTrue(liststore.get_store().has_list("user", "anime"))
+        self.assertNotIn(("user", "anime"), liststore.get_store()._indexes)
+
+    def test_unknown_user(self):
+        self.assertEqual(liststore.get_list("nobody", "anime"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
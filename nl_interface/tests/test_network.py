@@ -1,8 +1,12 @@
+import threading
+import time
 import unittest
+from unittest import mock
 
 import requests
 
 from nl_interface import network
+from stubserver import server
 
 
 class TestMakeRequest(unittest.TestCase):
@@ -15,5 +19,335 @@ class TestMakeRequest(unittest.TestCase):
         self.assertEqual(mk_request_result.text, request_result.text)
 
 
+class TestSession(unittest.TestCase):
+    def tearDown(self):
+        network.close_session()
+
+    def test_shared_session(self):
+        self.assertIs(network.get_session(), network.get_session())
+
+    def test_configure_session(self):
+        old_session = network.get_session()
+        new_session = network.configure_session(pool_connections=2, pool_maxsize=3, pool_block=True)
+
+        self.assertIsNot(old_session, new_session)
+        self.assertIs(network.get_session(), new_session)
+
+        adapter = new_session.get_adapter("https://myanimelist.net")
+        self.assertEqual(adapter._pool_connections, 2)
+        self.assertEqual(adapter._pool_maxsize, 3)
+        self.assertTrue(adapter._pool_block)
+
+    def test_close_session(self):
+        old_session = network.get_session()
+        network.close_session()
+        self.assertIsNot(network.get_session(), old_session)
+
+    def test_warm_up(self):
+        stub = server.start_in_thread(server.StubConfig(list_size=1, users={"user": "password"}))
+        self.addCleanup(stub.server_close)
+        self.addCleanup(stub.shutdown)
+
+        # count the connections the server accepts
+        with mock.patch.object(network.constants, "BASE_URL", stub.base_url), \
+                mock.patch.object(stub, "verify_request", return_value=True) as verify_request:
+            self.assertTrue(network.warm_up())
+
+            url = stub.base_url + "/api/account/verify_credentials.xml"
+            self.assertEqual(network.make_request("get", url, endpoint=network.Endpoint.AUTH,
+                                                  auth=("user", "password")).status_code, 200)
+
+        # the request went over the connection that was opened by the warm up
+        self.assertEqual(verify_request.call_count, 1)
+
+    def test_warm_up_unreachable(self):
+        with mock.patch.object(network.constants, "BASE_URL", "http://127.0.0.1:9"):
+            self.assertFalse(network.warm_up())
+
+
+class TestRetries(unittest.TestCase):
+    def setUp(self):
+        network.breaker.reset()
+        patcher = mock.patch("time.sleep")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        network.breaker.reset()
+
+    def test_timeout(self):
+        with mock.patch.object(network, "get_session") as get_session:
+            get_session.return_value.request.side_effect = requests.exceptions.ReadTimeout
+            result = network.make_request("get", url="http://localhost/", endpoint=network.Endpoint.SEARCH)
+
+        self.assertEqual(result, network.StatusCode.TIMEOUT)
+        self.assertEqual(get_session.return_value.request.call_count, 1 + network.MAX_RETRIES)
+        self.assertEqual(get_session.return_value.request.call_args[1]["timeout"],
+                         network.TIMEOUTS[network.Endpoint.SEARCH])
+
+    def test_connection_error(self):
+        with mock.patch.object(network, "get_session") as get_session:
+            get_session.return_value.request.side_effect = requests.exceptions.ConnectionError
+            result = network.make_request("get", url="http://localhost/", endpoint=network.Endpoint.LIST_READ)
+
+        self.assertEqual(result, network.StatusCode.CONNECTION_ERROR)
+
+    def test_retry_then_success(self):
+        response = mock.Mock(status_code=200)
+
+        with mock.patch.object(network, "get_session") as get_session:
+            get_session.return_value.request.side_effect = [requests.exceptions.ConnectionError, response]
+            result = network.make_request("get", url="http://localhost/", endpoint=network.Endpoint.AUTH)
+
+        self.assertIs(result, response)
+
+    def test_no_retry_for_writes(self):
+        with mock.patch.object(network, "get_session") as get_session:
+            get_session.return_value.request.side_effect = requests.exceptions.ConnectionError
+            network.make_request("get", url="http://localhost/", endpoint=network.Endpoint.LIST_WRITE)
+            network.make_request("delete", url="http://localhost/", endpoint=network.Endpoint.LIST_WRITE)
+
+        self.assertEqual(get_session.return_value.request.call_count, 2)
+
+    def test_backoff_delay(self):
+        for attempt in range(1, 10):
+            delay = network.backoff_delay(attempt)
+            self.assertTrue(0 <= delay <= network.BACKOFF_MAX)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_threshold(self):
+        breaker = network.CircuitBreaker(failure_threshold=3, reset_timeout=60)
+
+        for _ in range(2):
+            breaker.record_failure()
+            self.assertTrue(breaker.allow_request())
+
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        self.assertFalse(breaker.allow_request())
+
+    def test_success_resets_count(self):
+        breaker = network.CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertFalse(breaker.is_open)
+
+    def test_half_open_trial(self):
+        breaker = network.CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+
+        # only a single trial request is let through
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow_request())
+
+    def test_make_request_fails_fast(self):
+        with mock.patch.object(network, "breaker", network.CircuitBreaker(failure_threshold=1, reset_timeout=60)):
+            network.breaker.record_failure()
+
+            with mock.patch.object(network, "get_session") as get_session:
+                result = network.make_request("get", url="http://localhost/", endpoint=network.Endpoint.SEARCH)
+
+            self.assertEqual(result, network.StatusCode.CIRCUIT_OPEN)
+            get_session.assert_not_called()
+
+    def test_trial_with_other_error(self):
+        with mock.patch.object(network, "breaker", network.CircuitBreaker(failure_threshold=1, reset_timeout=0)):
+            network.breaker.record_failure()
+
+            with mock.patch.object(network, "get_session") as get_session:
+                get_session.return_value.request.side_effect = requests.exceptions.ChunkedEncodingError
+                result = network.make_request("get", url="http://localhost/", endpoint=network.Endpoint.LIST_WRITE)
+
+                self.assertEqual(result, network.StatusCode.OTHER_ERROR)
+
+                # the failed trial reopened the breaker, which lets the next trial through
+                get_session.return_value.request.side_effect = None
+                get_session.return_value.request.return_value = mock.Mock(status_code=200)
+                self.assertEqual(network.make_request("get", url="http://localhost/",
+                                                      endpoint=network.Endpoint.LIST_WRITE).status_code, 200)
+
+            self.assertFalse(network.breaker.is_open)
+
+    def test_trial_with_unexpected_exception(self):
+        with mock.patch.object(network, "breaker", network.CircuitBreaker(failure_threshold=1, reset_timeout=0)):
+            network.breaker.record_failure()
+
+            with mock.patch.object(network, "get_session") as get_session:
+                get_session.return_value.request.side_effect = ValueError
+                self.assertRaises(ValueError, network.make_request, "get", url="http://localhost/",
+                                  endpoint=network.Endpoint.LIST_WRITE)
+
+            self.assertTrue(network.breaker.allow_request())
+
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_burst_then_rate(self):
+        limiter = network.RateLimiter(rate=20, burst=3)
+
+        started_at = time.monotonic()
+        for _ in range(3):
+            limiter.acquire()
+        self.assertLess(time.monotonic() - started_at, 0.04)
+
+        # the fourth request has to wait for a token
+        self.assertGreater(limiter.acquire(), 0.02)
+
+        stats = limiter.stats()
+        self.assertEqual(stats["requests"], 4)
+        self.assertEqual(stats["waits"], 1)
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertGreater(stats["total_wait"], 0.02)
+
+    def test_interactive_first(self):
+        limiter = network.RateLimiter(rate=20, burst=1)
+        limiter.acquire()
+
+        order = []
+
+        def acquire(name, priority):
+            limiter.acquire(priority)
+            order.append(name)
+
+        threads = []
+        for name, priority in [("batch 1", network.Priority.BACKGROUND), ("batch 2", network.Priority.BACKGROUND),
+                               ("prompt", network.Priority.INTERACTIVE)]:
+            threads.append(threading.Thread(target=acquire, args=(name, priority)))
+            threads[-1].start()
+
+            # make sure the threads queue up in order
+            while limiter.stats()["queue_depth"] < len(threads):
+                time.sleep(0.001)
+
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(order, ["prompt", "batch 1", "batch 2"])
+
+    def test_priority_context(self):
+        self.assertEqual(network.current_priority(), network.Priority.INTERACTIVE)
+
+        with network.priority(network.Priority.BACKGROUND):
+            self.assertEqual(network.current_priority(), network.Priority.BACKGROUND)
+
+            # other threads are unaffected
+            priorities = []
+            thread = threading.Thread(target=lambda: priorities.append(network.current_priority()))
+            thread.start()
+            thread.join()
+            self.assertEqual(priorities, [network.Priority.INTERACTIVE])
+
+        self.assertEqual(network.current_priority(), network.Priority.INTERACTIVE)
+
+    def test_make_request_waits_for_limiter(self):
+        limiter = mock.Mock()
+
+        with mock.patch.dict(network.limiters, {network.Endpoint.SEARCH: limiter}), \
+                mock.patch.object(network, "get_session") as get_session, \
+                network.priority(network.Priority.BACKGROUND):
+            get_session.return_value.request.return_value.status_code = 200
+            network.make_request("get", url="http://localhost/", endpoint=network.Endpoint.SEARCH)
+
+        limiter.acquire.assert_called_once_with(network.Priority.BACKGROUND)
+
+    def test_parse_rate_limits(self):
+        self.assertEqual(network.parse_rate_limits(" search=1, list_read=0.5,"),
+                         {network.Endpoint.SEARCH: 1, network.Endpoint.LIST_READ: 0.5})
+        self.assertEqual(network.parse_rate_limits(""), {})
+
+        with self.assertRaises(ValueError):
+            network.parse_rate_limits("searches=1")
+        with self.assertRaises(ValueError):
+            network.parse_rate_limits("search=fast")
+
+    def test_configure_rate_limits(self):
+        self.addCleanup(network.configure_rate_limits)
+
+        network.configure_rate_limits({network.Endpoint.SEARCH: 0, network.Endpoint.LIST_READ: 3})
+
+        self.assertIsNone(network.limiters[network.Endpoint.SEARCH])
+        self.assertEqual(network.limiters[network.Endpoint.LIST_READ].rate, 3)
+        self.assertNotIn("SEARCH", network.limiter_stats())
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.flights = network.SingleFlight()
+        self.release = threading.Event()
+        self.calls = []
+
+    def fetch(self, value):
+        self.calls.append(value)
+        self.release.wait(5)
+        return value * 2
+
+    def run_concurrently(self, keys):
+        results = [None] * len(keys)
+
+        def call(i):
+            try:
+                results[i] = self.flights.do(keys[i], self.fetch, keys[i][1])
+            except ValueError as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(len(keys))]
+        for thread in threads:
+            thread.start()
+
+        # wait until everyone is either fetching or waiting on a fetch before letting them finish
+        while len(self.calls) + self.flights.shared < len(keys):
+            threading.Event().wait(0.01)
+
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+
+        return results
+
+    def test_concurrent_calls_shared(self):
+        results = self.run_concurrently([("key", 1)] * 5)
+
+        self.assertEqual(results, [2] * 5)
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(self.flights.shared, 4)
+
+    def test_different_keys_not_shared(self):
+        results = self.run_concurrently([("key", 1), ("key", 2), ("key", 1)])
+
+        self.assertEqual(results, [2, 4, 2])
+        self.assertEqual(sorted(self.calls), [1, 2])
+
+    def test_later_calls_not_shared(self):
+        self.release.set()
+
+        self.assertEqual(self.flights.do("key", self.fetch, 1), 2)
+        self.assertEqual(self.flights.do("key", self.fetch, 1), 2)
+        self.assertEqual(self.calls, [1, 1])
+        self.assertEqual(self.flights.shared, 0)
+
+    def test_exception_shared(self):
+        def fail(value):
+            self.calls.append(value)
+            self.release.wait(5)
+            raise ValueError(value)
+
+        self.fetch = fail
+        results = self.run_concurrently([("key", 1)] * 3)
+
+        self.assertEqual(len(self.calls), 1)
+        for result in results:
+            self.assertIsInstance(result, ValueError)
+
+        # a failed fetch isn't remembered
+        self.assertEqual(self.flights.do("key", lambda: 3), 3)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -230,6 +230,35 @@ class TestDetermineAction(unittest.TestCase):
             for s in strings:
                 self.assertEqual(qp.determine_action(s), qp.OperationType.VIEW_LIST, "syn: {}, s: {}".format(syn, s))
 
+    def test_terms_inside_words(self):
+        # action terms that are only part of a longer word shouldn't count
+        self.assertEqual(qp.determine_action("target add naruto"), qp.OperationType.ADD)
+        self.assertEqual(qp.determine_action("forget to delete naruto"), qp.OperationType.DELETE)
+        self.assertIsNone(qp.determine_action("settlers of catan"))
+
+
+class TestMatchRules(unittest.TestCase):
+    def test_first_matching_rule(self):
+        rule, match = qp.match_rules("add", "add naruto to my manga list")
+
+        self.assertEqual(rule, 0)
+        self.assertEqual(match.groups(), ("naruto", "manga"))
+
+    def test_fallback_rule(self):
+        rule, match = qp.match_rules("add", "add naruto")
+
+        self.assertEqual(rule, 2)
+        self.assertEqual(match.group(1), "naruto")
+
+    def test_no_match(self):
+        self.assertEqual(qp.match_rules("view_list", "show me naruto"), (None, None))
+
+    def test_synonyms_in_rules(self):
+        # every synonym for an action should be usable with the rules for that action
+        for syn in synonyms.actions["delete"]:
+            rule, match = qp.match_rules("delete", "{} naruto".format(syn))
+            self.assertEqual(match.group(1), "naruto", "syn: {}".format(syn))
+
 
 if __name__ == '__main__':
     unittest.main()
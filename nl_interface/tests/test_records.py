@@ -0,0 +1,55 @@
+import unittest
+
+from nl_interface import records
+
+
+class TestListEntry(unittest.TestCase):
+    def test_fields_are_converted(self):
+        entry = records.list_entry("anime", {"series_animedb_id": "1", "series_title": "Cowboy Bebop",
+                                             "series_episodes": "26", "my_watched_episodes": "", "my_status": "1",
+                                             "my_tags": "ignored"})
+
+        self.assertEqual(entry.series_id, 1)
+        self.assertEqual(entry.series_episodes, 26)
+        self.assertEqual(entry.watched_episodes, 0)
+        self.assertEqual(entry.synonyms, "")
+        self.assertIs(entry.status, records.list_entry("anime", {"my_status": "".join(["1"])}).status)
+
+    def test_slots(self):
+        entry = records.list_entry("manga", {})
+
+        self.assertFalse(hasattr(entry, "__dict__"))
+        self.assertRaises(AttributeError, setattr, entry, "my_tags", "")
+
+    def test_round_trip(self):
+        entry = records.list_entry("manga", {"series_mangadb_id": "2", "series_title": "Berserk",
+                                             "series_chapters": "0", "my_read_volumes": "3", "my_status": "3"})
+        copy = records.list_entry("manga", entry.to_fields())
+
+        self.assertEqual(copy, entry)
+        self.assertEqual(copy.to_fields()["my_read_volumes"], "3")
+
+    def test_apply_fields(self):
+        entry = records.list_entry("anime", {"my_watched_episodes": "3", "my_status": "1"})
+        entry.apply_fields({"episode": 4, "status": "2", "tags": "ignored"})
+
+        self.assertEqual(entry.watched_episodes, 4)
+        self.assertEqual(entry.status, "2")
+
+    def test_invalid_media_type(self):
+        self.assertRaises(ValueError, records.list_entry, "badtype", {})
+        self.assertRaises(ValueError, records.search_entry, "badtype", {})
+
+
+class TestSearchEntry(unittest.TestCase):
+    def test_fields_are_converted(self):
+        entry = records.search_entry("manga", {"id": "5", "title": "Monster", "chapters": "162", "volumes": "18",
+                                               "type": "Manga"})
+
+        self.assertEqual(entry.media_type, "manga")
+        self.assertEqual((entry.id, entry.chapters, entry.volumes), (5, 162, 18))
+        self.assertEqual(list(entry.to_fields())[:3], ["id", "title", "english"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,29 +1,80 @@
+import io
 import unittest
 from unittest import mock
 
+import requests
+import urllib3
+
 from nl_interface import search
+from nl_interface import session
 from nl_interface.tests.constants_for_tests import credentials
 
+searchcache = search.searchcache
+user_session = session.Session(credentials)
+
+
+class BrokenStream:
+    """The raw stream of a response whose connection drops after the first chunk"""
+
+    def stream(self, chunk_size, decode_content=True):
+        yield b"<?xml version=\"1.0\"?><myanimelist><anime><series_animedb_id>1</series"
+        raise urllib3.exceptions.ProtocolError("Connection broken")
+
+    def close(self):
+        pass
+
+
+def broken_response():
+    """Create a response that fails partway through its body, like one cut off by a connection reset
+
+    :return: A requests.Response
+    """
+    response = requests.Response()
+    response.status_code = 200
+    response.raw = BrokenStream()
+
+    return response
+
 
 class TestSearch(unittest.TestCase):
+    def setUp(self):
+        searchcache.set_cache(searchcache.SearchCache())
+        self.addCleanup(searchcache.set_cache, None)
+
     def test_invalid_search_type(self):
-        self.assertRaises(ValueError, search.search, ("username", "password"), "badsearchtype", "")
+        self.assertRaises(ValueError, search.search, session.Session(("username", "password")), "badsearchtype", "")
 
     def test_no_results(self):
-        self.assertEqual(search.search(credentials, "anime", "longstringthatshouldnotreturnaresult", False),
+        self.assertEqual(search.search(user_session, "anime", "longstringthatshouldnotreturnaresult", False),
                          search.StatusCode.NO_RESULTS)
-        self.assertEqual(search.search(credentials, "manga", "longstringthatshouldnotreturnaresult", False),
+        self.assertEqual(search.search(user_session, "manga", "longstringthatshouldnotreturnaresult", False),
                          search.StatusCode.NO_RESULTS)
 
     def test_good_result(self):
         with mock.patch("click.prompt", side_effect=[1, 1]):
-            anime_search = search.search(credentials, "anime", "test", False)
-            self.assertEqual(anime_search.name, "entry")
-            self.assertEqual(anime_search.parent.name, "anime")
+            anime_search = search.search(user_session, "anime", "test", False)
+            self.assertEqual(anime_search.media_type, "anime")
+
+            manga_search = search.search(user_session, "manga", "test", False)
+            self.assertEqual(manga_search.media_type, "manga")
+
+
+class TestDownloadResults(unittest.TestCase):
+    def test_connection_lost_while_reading(self):
+        with mock.patch.object(search.client, "search", mock.Mock()), \
+                mock.patch.object(search.client, "run", return_value=broken_response()):
+            self.assertEqual(search._download_results(credentials, "anime", "naruto"),
+                             search.network.StatusCode.CONNECTION_ERROR)
+
+    def test_empty_body(self):
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(b"")
 
-            manga_search = search.search(credentials, "manga", "test", False)
-            self.assertEqual(manga_search.name, "entry")
-            self.assertEqual(manga_search.parent.name, "manga")
+        with mock.patch.object(search.client, "search", mock.Mock()), \
+                mock.patch.object(search.client, "run", return_value=response):
+            self.assertEqual(search._download_results(credentials, "anime", "naruto"),
+                             search.network.StatusCode.OTHER_ERROR)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from nl_interface import search, session
+
+searchcache = search.searchcache
+records = searchcache.records
+
+
+def make_entries(*titles):
+    return [records.search_entry("anime", {"id": str(i), "title": title}) for i, title in enumerate(titles, 1)]
+
+
+class TestSearchCache(unittest.TestCase):
+    def test_normalised(self):
+        cache = searchcache.SearchCache()
+        cache.put("anime", "Fullmetal  Alchemist ", make_entries("Fullmetal Alchemist"))
+
+        self.assertEqual(cache.get("anime", "fullmetal alchemist"), make_entries("Fullmetal Alchemist"))
+        self.assertIsNone(cache.get("manga", "fullmetal alchemist"))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_no_results_cached(self):
+        cache = searchcache.SearchCache()
+        cache.put("anime", "nothing", [])
+
+        self.assertEqual(cache.get("anime", "nothing"), [])
+
+    def test_least_recently_used_evicted(self):
+        cache = searchcache.SearchCache(max_entries=2)
+        cache.put("anime", "naruto", make_entries("Naruto"))
+        cache.put("anime", "bleach", make_entries("Bleach"))
+
+        cache.get("anime", "naruto")
+        cache.put("anime", "one piece", make_entries("One Piece"))
+
+        self.assertIsNone(cache.get("anime", "bleach"))
+        self.assertIsNotNone(cache.get("anime", "naruto"))
+        self.assertIsNotNone(cache.get("anime", "one piece"))
+
+    def test_expired(self):
+        cache = searchcache.SearchCache(ttl=60)
+
+        with mock.patch.object(searchcache.time, "time", return_value=1000):
+            cache.put("anime", "naruto", make_entries("Naruto"))
+
+        with mock.patch.object(searchcache.time, "time", return_value=1059):
+            self.assertIsNotNone(cache.get("anime", "naruto"))
+
+        with mock.patch.object(searchcache.time, "time", return_value=1061):
+            self.assertIsNone(cache.get("anime", "naruto"))
+
+    def test_off(self):
+        cache = searchcache.SearchCache(max_entries=0)
+        cache.put("anime", "naruto", make_entries("Naruto"))
+
+        self.assertIsNone(cache.get("anime", "naruto"))
+
+    def test_saved_between_runs(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, searchcache.CACHE_FILENAME)
+
+        cache = searchcache.SearchCache(path, max_entries=2)
+        cache.put("anime", "naruto", make_entries("Naruto", "Naruto Shippuden"))
+        cache.put("anime", "bleach", make_entries("Bleach"))
+        cache.put("anime", "one piece", make_entries("One Piece"))
+        cache.close()
+
+        reopened = searchcache.SearchCache(path, max_entries=2)
+        self.addCleanup(reopened.close)
+
+        self.assertIsNone(reopened.get("anime", "naruto"))
+        self.assertEqual(reopened.get("anime", "bleach"), make_entries("Bleach"))
+
+        reopened.clear()
+        self.assertIsNone(searchcache.SearchCache(path).get("anime", "one piece"))
+
+
+class TestFetchResults(unittest.TestCase):
+    def setUp(self):
+        self.cache = searchcache.SearchCache()
+        searchcache.set_cache(self.cache)
+        self.addCleanup(searchcache.set_cache, None)
+
+        self.session = session.Session(("user", "password"))
+
+    def test_repeated_search_not_sent(self):
+        with mock.patch.object(search, "_download_results", return_value=make_entries("Naruto")) as download:
+            self.assertEqual(search.fetch_results(self.session, "anime", "Naruto"), make_entries("Naruto"))
+            self.assertEqual(search.fetch_results(self.session, "anime", "naruto"), make_entries("Naruto"))
+
+        download.assert_called_once_with(("user", "password"), "anime", "Naruto")
+
+    def test_errors_not_cached(self):
+        with mock.patch.object(search, "_download_results",
+                               return_value=search.network.StatusCode.CONNECTION_ERROR) as download:
+            search.fetch_results(self.session, "anime", "naruto")
+            search.fetch_results(self.session, "anime", "naruto")
+
+        self.assertEqual(download.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
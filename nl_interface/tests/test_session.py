@@ -0,0 +1,53 @@
+import unittest
+from unittest import mock
+
+from nl_interface import session, writequeue
+
+# the list store that sessions use, which session only imports once it is needed
+liststore = writequeue.liststore
+
+
+class TestSession(unittest.TestCase):
+    def setUp(self):
+        liststore.set_store(liststore.ListStore(":memory:"))
+        self.addCleanup(liststore.set_store, None)
+
+        self.session = session.Session(("user", "password"))
+
+    def test_username(self):
+        self.assertEqual(self.session.username, "user")
+
+    def test_repr_hides_password(self):
+        self.assertNotIn("password", repr(self.session))
+
+    def test_store_shared(self):
+        self.assertIs(self.session.store, liststore.get_store())
+        self.assertIs(session.Session(("other", "secret")).store, self.session.store)
+
+    def test_lists_kept_apart(self):
+        entry = liststore.records.list_entry("anime", {"series_animedb_id": "1", "series_title": "Naruto"})
+        self.session.store.replace_list("user", "anime", [entry])
+
+        other = session.Session(("other", "secret"))
+        other.store.replace_list("other", "anime", [])
+
+        self.assertTrue(self.session.has_list("anime"))
+        self.assertFalse(self.session.has_list("manga"))
+        self.assertEqual(self.session.get_list("anime"), [entry])
+        self.assertEqual(other.get_list("anime"), [])
+
+    def test_prefetch_replaced(self):
+        with mock.patch.object(liststore, "Prefetch", side_effect=lambda username: mock.Mock()) as prefetch:
+            first = self.session.prefetch_lists()
+            second = self.session.prefetch_lists()
+
+        prefetch.assert_called_with("user")
+        first.cancel.assert_called_once_with()
+        self.assertIs(self.session.prefetch, second)
+
+        self.session.cancel_prefetch()
+        self.assertEqual(second.cancel.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
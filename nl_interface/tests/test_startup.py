@@ -0,0 +1,136 @@
+import ast
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# the directory holding the program's modules, which import each other by name
+PROGRAM_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the modules imported before the first prompt is shown, see __main__
+STARTUP_MODULES = ["bootstrap", "constants", "credcache", "ui", "agent"]
+
+# dependencies that must not be imported until a command needs them
+HEAVY_MODULES = ["requests", "lxml", "asyncio", "sqlite3"]
+
+# the modules that importing the heavy dependencies loads, timed on the same machine to compare the startup against
+BASELINE_MODULES = ["requests", "lxml.etree", "asyncio", "sqlite3"]
+
+# the most that importing the startup modules may take as a fraction of importing the baseline, it usually takes
+# around a quarter, while importing the command modules at the start again would take nearly the whole baseline
+IMPORT_RATIO = 0.5
+
+
+class TestStartup(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # cache the bytecode as it would be after the first run, somewhere other than the source tree
+        cls.pycache = tempfile.TemporaryDirectory()
+
+        cls.env = dict(os.environ, PYTHONPATH=PROGRAM_DIR, PYTHONPYCACHEPREFIX=cls.pycache.name)
+        cls.env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pycache.cleanup()
+
+    def run_python(self, *args):
+        """Run a new Python process in the program's directory
+
+        :param args: Strings, the args to pass to the interpreter
+        :return: A subprocess.CompletedProcess
+        """
+        result = subprocess.run([sys.executable] + list(args), cwd=PROGRAM_DIR, env=self.env, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, universal_newlines=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+        return result
+
+    def imported_modules(self, modules):
+        """Find every module that importing some of the program's modules loads
+
+        :param modules: A list of strings, the names of the modules to import
+        :return: A set of strings, the names of the modules loaded, apart from those Python loads on its own
+        """
+        script = "import json, sys\nbefore = set(sys.modules)\nimport {}\nprint(json.dumps(sorted(set(sys.modules) - " \
+                 "before)))".format(", ".join(modules))
+
+        return set(json.loads(self.run_python("-c", script).stdout))
+
+    def import_time(self, modules):
+        """Measure how long importing some of the program's modules takes with python -X importtime
+
+        :param modules: A list of strings, the names of the modules to import
+        :return: A float, the seconds spent importing them and everything they import
+        """
+        stderr = self.run_python("-X", "importtime", "-c", "import {}".format(", ".join(modules))).stderr
+
+        total = 0
+        for line in stderr.splitlines():
+            # e.g. "import time:       338 |      45107 | agent", nested imports have their name indented
+            if line.startswith("import time:") and "|" in line:
+                _, cumulative, name = line.split("|")
+                if name.strip() in modules and not name.startswith("  "):
+                    total += int(cumulative)
+
+        return total / 1e6
+
+    def test_heavy_modules_deferred(self):
+        imported = self.imported_modules(STARTUP_MODULES)
+
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, imported)
+
+    def test_query_processing_import_light(self):
+        imported = self.imported_modules(["query_processing", "synonyms"])
+
+        program_modules = {name[:-3] for name in os.listdir(PROGRAM_DIR) if name.endswith(".py")}
+        self.assertEqual(imported & program_modules, {"query_processing", "synonyms", "termmatcher"})
+        self.assertNotIn("click", imported)
+
+    def test_import_time(self):
+        # the first runs write the bytecode
+        self.import_time(STARTUP_MODULES)
+        self.import_time(BASELINE_MODULES)
+
+        startup = min(self.import_time(STARTUP_MODULES) for _ in range(3))
+        baseline = min(self.import_time(BASELINE_MODULES) for _ in range(3))
+        self.assertLess(startup, baseline * IMPORT_RATIO, "Importing {} took {:.3f}s, over {} of the {:.3f}s that "
+                        "importing {} took".format(", ".join(STARTUP_MODULES), startup, IMPORT_RATIO, baseline,
+                                                   ", ".join(BASELINE_MODULES)))
+
+    def test_no_import_cycles(self):
+        # modules are imported on background threads while the user is typing (see bootstrap), where a cycle of
+        # imports started from two threads at once can deadlock
+        program_modules = {name[:-3] for name in os.listdir(PROGRAM_DIR) if name.endswith(".py")}
+        program_modules.discard("__main__")
+
+        imports = {}
+        for module in program_modules:
+            with open(os.path.join(PROGRAM_DIR, module + ".py")) as f:
+                tree = ast.parse(f.read())
+
+            # only the imports at the top of the module, imports inside functions happen when they are called
+            names = set()
+            for node in tree.body:
+                if isinstance(node, ast.Import):
+                    names.update(alias.name for alias in node.names)
+                elif isinstance(node, ast.ImportFrom) and node.module is not None:
+                    names.add(node.module)
+
+            imports[module] = names & program_modules
+
+        def visit(module, path):
+            self.assertNotIn(module, path, "Import cycle: {}".format(" -> ".join(path + [module])))
+
+            for name in sorted(imports[module]):
+                visit(name, path + [module])
+
+        for module in sorted(program_modules):
+            visit(module, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+from nl_interface import termmatcher
+
+
+class TestIsWordBoundary(unittest.TestCase):
+    def test_whole_word(self):
+        self.assertTrue(termmatcher.is_word_boundary("add naruto", 0, 3))
+        self.assertTrue(termmatcher.is_word_boundary("please add", 7, 10))
+        self.assertTrue(termmatcher.is_word_boundary("what's on", 0, 6))
+
+    def test_part_of_word(self):
+        self.assertFalse(termmatcher.is_word_boundary("target", 3, 6))
+        self.assertFalse(termmatcher.is_word_boundary("getter", 0, 3))
+
+
+class TestTermMatcher(unittest.TestCase):
+    def setUp(self):
+        self.matcher = termmatcher.TermMatcher({
+            "search": ["get", "give me", "look"],
+            "delete": ["get rid of", "take"],
+            "view_list": ["get", "look at"]
+        })
+
+    def test_find_all(self):
+        self.assertEqual(list(self.matcher.find_all("look at it")), [("search", 0, 4), ("view_list", 0, 7)])
+
+    def test_shared_terms(self):
+        self.assertEqual(self.matcher.earliest("get rid of naruto"), {"search": 0, "view_list": 0, "delete": 0})
+
+    def test_earliest_position(self):
+        self.assertEqual(self.matcher.earliest("take it and take it"), {"delete": 0})
+        self.assertEqual(self.matcher.earliest("please look at my list"), {"search": 7, "view_list": 7})
+
+    def test_word_boundaries(self):
+        self.assertEqual(self.matcher.earliest("target"), {})
+        self.assertEqual(self.matcher.earliest("mistakes were made"), {})
+        self.assertEqual(self.matcher.earliest("forget it, get it"), {"search": 11, "view_list": 11})
+
+    def test_no_terms(self):
+        self.assertEqual(termmatcher.TermMatcher({}).earliest("anything"), {})
+        self.assertEqual(self.matcher.earliest(""), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
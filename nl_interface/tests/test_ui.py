@@ -1,4 +1,9 @@
+from io import StringIO
+import sys
+import threading
+import time
 import unittest
+from unittest import mock
 
 from nl_interface import ui
 
@@ -14,6 +19,90 @@ class TestThreadedAction(unittest.TestCase):
         for val in vals:
             self.assertEqual(ui.threaded_action(trivial, val=val), trivial(val), "Error on {}".format(val))
 
+    def test_returns_when_action_finishes(self):
+        start = time.monotonic()
+        ui.threaded_action(lambda: None)
+
+        # a quick action shouldn't have to wait for a full rotation of the animation
+        self.assertLess(time.monotonic() - start, len(ui.SPINNER_FRAMES) * ui.SPINNER_INTERVAL)
+
+    def test_exception_propagated(self):
+        def fail():
+            raise KeyError("fail")
+
+        with self.assertRaises(KeyError):
+            ui.threaded_action(fail)
+
+    def test_threads_reused(self):
+        thread_names = {ui.threaded_action(lambda: threading.current_thread().name) for _ in range(20)}
+
+        self.assertLessEqual(len(thread_names), ui.MAX_CONCURRENT_ACTIONS)
+
+
+class TestAnswerPolicy(unittest.TestCase):
+    def tearDown(self):
+        ui.set_answer_policy(None)
+
+    def test_best(self):
+        ui.set_answer_policy(ui.AnswerPolicy.BEST)
+
+        self.assertEqual(ui.choose_option(5), 1)
+        self.assertTrue(ui.confirm("Are you sure?"))
+
+    def test_skip(self):
+        ui.set_answer_policy(ui.AnswerPolicy.SKIP)
+
+        self.assertEqual(ui.choose_option(5), 6)
+        self.assertFalse(ui.confirm("Are you sure?"))
+
+    def test_interactive(self):
+        self.assertTrue(ui.is_interactive())
+
+        with mock.patch("click.prompt", side_effect=[0, 7, 3]):
+            self.assertEqual(ui.choose_option(5), 3)
+
+        with mock.patch("click.confirm", return_value=False):
+            self.assertFalse(ui.confirm("Are you sure?"))
+
+    def test_action_without_animation(self):
+        ui.set_answer_policy(ui.AnswerPolicy.BEST)
+
+        # the action is carried out on the calling thread
+        self.assertIs(ui.threaded_action(threading.current_thread), threading.current_thread())
+
+
+class TestCaptureOutput(unittest.TestCase):
+    def setUp(self):
+        self.stdout = sys.stdout
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+
+    def test_per_thread(self):
+        sys.stdout = ui.ThreadOutput(StringIO())
+        outputs = {}
+
+        def action(name):
+            print(name)
+            return name.upper()
+
+        def capture(name):
+            outputs[name] = ui.capture_output(action, name)
+
+        threads = [threading.Thread(target=capture, args=(name,)) for name in ["a", "b", "c"]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outputs, {"a": ("A", "a\n"), "b": ("B", "b\n"), "c": ("C", "c\n")})
+        self.assertEqual(sys.stdout.stream.getvalue(), "")
+
+    def test_without_thread_output(self):
+        sys.stdout = StringIO()
+
+        self.assertEqual(ui.capture_output(print, "text"), (None, ""))
+        self.assertEqual(sys.stdout.getvalue(), "text\n")
 
 
 if __name__ == '__main__':
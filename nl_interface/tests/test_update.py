@@ -1,57 +1,61 @@
 import unittest
 from unittest import mock
 
+from nl_interface import session
 from nl_interface import update
 from nl_interface.tests.constants_for_tests import credentials
 
+user_session = session.Session(credentials)
+
 
 class TestUpdateAnimeListEntry(unittest.TestCase):
     def test_invalid_search_type(self):
-        self.assertRaises(ValueError, update.update_anime_list_entry, credentials, "badsearchtype", "")
+        self.assertRaises(ValueError, update.update_anime_list_entry, user_session, "badsearchtype", "")
 
 
 class TestUpdateMangaListEntry(unittest.TestCase):
     def test_invalid_search_type(self):
-        self.assertRaises(ValueError, update.update_manga_list_entry, credentials, "badsearchtype", "")
+        self.assertRaises(ValueError, update.update_manga_list_entry, user_session, "badsearchtype", "")
 
 
 class TestSearchList(unittest.TestCase):
+    def setUp(self):
+        # keep the lists fetched by these tests out of the user's data directory (using the store sessions use)
+        update.writequeue.liststore.set_store(update.writequeue.liststore.ListStore(":memory:"))
+        self.addCleanup(update.writequeue.liststore.set_store, None)
+
     def test_invalid_search_type(self):
-        self.assertRaises(ValueError, update.search_list, credentials[0], "badsearchtype", "")
+        self.assertRaises(ValueError, update.search_list, user_session, "badsearchtype", "")
 
     def test_no_results(self):
-        self.assertEqual(update.search_list(credentials[0], "anime", "longstringthatshouldnotreturnaresult"),
+        self.assertEqual(update.search_list(user_session, "anime", "longstringthatshouldnotreturnaresult"),
                          update.ListSearchStatusCode.NO_RESULTS)
-        self.assertEqual(update.search_list(credentials[0], "manga", "longstringthatshouldnotreturnaresult"),
+        self.assertEqual(update.search_list(user_session, "manga", "longstringthatshouldnotreturnaresult"),
                          update.ListSearchStatusCode.NO_RESULTS)
 
     def test_one_result(self):
         search_term = "naruto"  # change this for something for that is unique on each the lists if needed
 
-        anime_search = update.search_list(credentials[0], "anime", search_term)
-        self.assertEqual(anime_search.name, "anime")
-        self.assertEqual(anime_search.parent.name, "myanimelist")
+        anime_search = update.search_list(user_session, "anime", search_term)
+        self.assertEqual(anime_search.media_type, "anime")
 
-        manga_search = update.search_list(credentials[0], "manga", search_term)
-        self.assertEqual(manga_search.name, "manga")
-        self.assertEqual(manga_search.parent.name, "myanimelist")
+        manga_search = update.search_list(user_session, "manga", search_term)
+        self.assertEqual(manga_search.media_type, "manga")
 
     def test_good_result(self):
         with mock.patch("click.prompt", side_effect=[1, 1]):
             search_term = "no"  # change this for something for that should return multiple results
 
-            anime_search = update.search_list(credentials[0], "anime", search_term)
-            self.assertEqual(anime_search.name, "anime")
-            self.assertEqual(anime_search.parent.name, "myanimelist")
+            anime_search = update.search_list(user_session, "anime", search_term)
+            self.assertEqual(anime_search.media_type, "anime")
 
-            manga_search = update.search_list(credentials[0], "manga", search_term)
-            self.assertEqual(manga_search.name, "manga")
-            self.assertEqual(manga_search.parent.name, "myanimelist")
+            manga_search = update.search_list(user_session, "manga", search_term)
+            self.assertEqual(manga_search.media_type, "manga")
 
 
 class TestViewList(unittest.TestCase):
     def test_invalid_search_type(self):
-        self.assertRaises(ValueError, update.view_list, credentials[0], "badsearchtype")
+        self.assertRaises(ValueError, update.view_list, user_session, "badsearchtype")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,222 @@
+from collections import OrderedDict
+import os
+import subprocess
+import sys
+import threading
+import unittest
+from unittest import mock
+
+from nl_interface import session, writequeue
+
+journal = writequeue.journal
+liststore = writequeue.liststore
+network = writequeue.network
+
+
+# the directory holding the program's modules, which import each other by name
+PROGRAM_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_entry(entry_id, title, episodes="0"):
+    return liststore.records.list_entry("anime", {"series_animedb_id": entry_id, "series_title": title,
+                                                  "series_episodes": "12", "my_watched_episodes": episodes,
+                                                  "my_status": "1"})
+
+
+def response(status_code):
+    return mock.Mock(status_code=status_code)
+
+
+class TestWriteQueue(unittest.TestCase):
+    def setUp(self):
+        liststore.set_store(liststore.ListStore(":memory:"))
+        self.addCleanup(liststore.set_store, None)
+
+        self.journal = journal.Journal(None)
+        journal.set_journal(self.journal)
+        self.addCleanup(journal.set_journal, None)
+
+        self.session = session.Session(("user", "password"))
+        self.session.store.replace_list("user", "anime", [make_entry("1", "Naruto"), make_entry("2", "Bleach")])
+
+        self.failed = []
+        self.queue = writequeue.WriteQueue(delay=0.05, retry_delay=0.01,
+                                           on_failure=lambda update, result: self.failed.append(update.title))
+
+        # the update requests that were sent, as tuples (entry id, xml)
+        self.sent = []
+        self.results = []
+        self.sent_lock = threading.Lock()
+
+        def update_entry(credentials, entry_type, entry_id, xml):
+            with self.sent_lock:
+                self.sent.append((entry_id, xml[xml.index("<entry>"):]))
+                return self.results.pop(0) if self.results else response(200)
+
+        patcher = mock.patch.object(writequeue.client, "update_entry", mock.Mock(side_effect=update_entry))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch.object(writequeue.client, "run", side_effect=lambda result: result)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # don't leave updates to be sent during later tests
+        self.addCleanup(self.queue.flush, 5)
+
+    def submit(self, entry_id, **fields):
+        return self.queue.submit(self.session, "anime", entry_id, OrderedDict(sorted(fields.items())),
+                                 "Title {}".format(entry_id))
+
+    def test_applied_immediately(self):
+        entry = self.submit("1", episode=1)
+
+        self.assertEqual(entry.watched_episodes, 1)
+        self.assertEqual(self.session.store.get_entry("user", "anime", "1").watched_episodes, 1)
+        self.assertEqual(self.sent, [])
+        self.assertEqual(self.queue.pending_count(), 1)
+
+    def test_coalesced(self):
+        for episode in range(1, 6):
+            self.submit("1", episode=episode)
+        self.submit("1", status=2)
+
+        self.assertTrue(self.queue.flush(5))
+
+        self.assertEqual(self.sent, [("1", "<entry><episode>5</episode><status>2</status></entry>")])
+        self.assertEqual(self.queue.pending_count(), 0)
+
+    def test_debounced(self):
+        self.submit("1", episode=1)
+        self.submit("2", episode=3)
+
+        # wait for the debounce window to pass without flushing
+        with self.queue._condition:
+            self.assertTrue(self.queue._condition.wait_for(lambda: len(self.sent) == 2 and not self.queue._sending, 5))
+
+        self.assertEqual(sorted(self.sent), [("1", "<entry><episode>1</episode></entry>"),
+                                             ("2", "<entry><episode>3</episode></entry>")])
+
+    def test_retried(self):
+        self.results = [network.StatusCode.CONNECTION_ERROR, response(503)]
+
+        self.submit("1", episode=1)
+        self.assertTrue(self.queue.flush(5))
+
+        self.assertEqual(len(self.sent), 3)
+        self.assertEqual(self.failed, [])
+        self.assertEqual(self.queue.failures, 0)
+
+    def test_gives_up(self):
+        self.results = [network.StatusCode.TIMEOUT] * writequeue.MAX_ATTEMPTS
+
+        self.submit("1", episode=1)
+        self.assertTrue(self.queue.flush(5))
+
+        self.assertEqual(len(self.sent), writequeue.MAX_ATTEMPTS)
+        self.assertEqual(self.failed, ["Title 1"])
+        self.assertEqual(self.queue.failures, 1)
+
+    def test_parked_while_offline(self):
+        self.results = [network.StatusCode.CONNECTION_ERROR] * writequeue.MAX_ATTEMPTS
+
+        self.submit("1", episode=1)
+        self.assertTrue(self.queue.flush(5))
+
+        self.assertEqual(self.failed, ["Title 1"])
+        self.assertEqual([dict(record.fields) for record in self.journal.parked("user")], [{"episode": 1}])
+
+        # later changes to the entry wait in the journal behind it rather than overtaking it
+        with mock.patch.object(journal, "replay_in_background") as replay_in_background:
+            self.submit("1", episode=2)
+            replay_in_background.assert_called_once_with(self.session)
+
+        self.assertEqual(self.queue.pending_count(), 0)
+        self.assertEqual(len(self.journal.parked("user")), 2)
+        self.assertEqual(self.session.store.get_entry("user", "anime", "1").watched_episodes, 2)
+
+    def test_journalled(self):
+        self.submit("1", episode=1)
+        self.assertEqual(len(self.journal.pending("user", "anime")), 1)
+        self.assertFalse(self.journal.has_parked("user"))
+
+        self.assertTrue(self.queue.flush(5))
+        self.assertEqual(self.journal.pending("user", "anime"), [])
+
+    def test_rejected_not_retried(self):
+        self.results = [response(400)]
+
+        self.submit("1", episode=1)
+        self.assertTrue(self.queue.flush(5))
+
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(self.failed, ["Title 1"])
+        self.assertEqual(self.journal.pending("user", "anime"), [])
+
+    def test_changes_while_sending(self):
+        sending = threading.Event()
+        release = threading.Event()
+
+        def slow_update_entry(credentials, entry_type, entry_id, xml):
+            self.sent.append((entry_id, xml[xml.index("<entry>"):]))
+            if len(self.sent) == 1:
+                sending.set()
+                release.wait(5)
+            return response(200)
+
+        writequeue.client.update_entry.side_effect = slow_update_entry
+
+        self.submit("1", episode=1)
+        self.queue.flush(0)
+        self.assertTrue(sending.wait(5))
+
+        # the second change has to wait for the first to reach MAL
+        self.submit("1", episode=2)
+        self.queue.flush(0.2)
+        self.assertEqual(len(self.sent), 1)
+
+        release.set()
+        self.assertTrue(self.queue.flush(5))
+
+        self.assertEqual(self.sent, [("1", "<entry><episode>1</episode></entry>"),
+                                     ("1", "<entry><episode>2</episode></entry>")])
+        self.assertEqual(self.session.store.get_entry("user", "anime", "1").watched_episodes, 2)
+
+    def test_error_while_sending(self):
+        writequeue.client.run.side_effect = RuntimeError("cannot schedule new futures after interpreter shutdown")
+
+        self.submit("1", episode=1)
+
+        # the error is raised in the timer's thread
+        with mock.patch.object(threading, "excepthook") as excepthook:
+            self.assertTrue(self.queue.flush(5))
+
+        self.assertEqual(excepthook.call_count, 1)
+        self.assertEqual(self.queue.pending_count(), 0)
+        self.assertEqual([dict(record.fields) for record in self.journal.parked("user")], [{"episode": 1}])
+
+
+class TestGetQueue(unittest.TestCase):
+    def test_flushed_at_exit(self):
+        script = "\n".join([
+            "from collections import OrderedDict",
+            "from unittest import mock",
+            "import session, writequeue",
+            "writequeue.liststore.set_store(writequeue.liststore.ListStore(':memory:'))",
+            "writequeue.journal.set_journal(writequeue.journal.Journal(None))",
+            "user = session.Session(('user', 'password'))",
+            "writequeue.network.make_request = lambda *args, **kwargs: print('sent') or mock.Mock(status_code=200)",
+            "writequeue.get_queue().submit(user, 'anime', '1', OrderedDict(episode=1), 'Naruto')",
+        ])
+
+        result = subprocess.run([sys.executable, "-c", script], cwd=PROGRAM_DIR,
+                                env=dict(os.environ, PYTHONPATH=PROGRAM_DIR), stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, universal_newlines=True, timeout=writequeue.FLUSH_TIMEOUT)
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout, "sent\n")
+        self.assertEqual(result.stderr, "")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import gzip
+import io
+import unittest
+from unittest import mock
+
+from nl_interface import xmlstream
+from stubserver import datagen
+
+LIST_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<myanimelist>
+    <myinfo><user_id>1</user_id></myinfo>
+    <anime>
+        <series_animedb_id>1</series_animedb_id>
+        <series_title>Cowboy Bebop</series_title>
+        <series_synonyms></series_synonyms>
+    </anime>
+    <!-- a comment -->
+    <anime>
+        <series_animedb_id>5</series_animedb_id>
+        <series_title>Tom &amp; Jerry &mdash; The Movie</series_title>
+        <series_synonyms>; TJ</series_synonyms>
+    </anime>
+</myanimelist>
+"""
+
+
+class TestIterEntries(unittest.TestCase):
+    def test_entries(self):
+        entries = list(xmlstream.iter_entries(io.BytesIO(LIST_XML), "anime"))
+
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(list(entries[0].items()), [("series_animedb_id", "1"), ("series_title", "Cowboy Bebop"),
+                                                    ("series_synonyms", "")])
+        self.assertEqual(entries[1]["series_synonyms"], "; TJ")
+
+    def test_undefined_entities_are_skipped(self):
+        entries = list(xmlstream.iter_entries(io.BytesIO(LIST_XML), "anime"))
+        self.assertTrue(entries[1]["series_title"].startswith("Tom"))
+
+    def test_no_entries(self):
+        error = b'<?xml version="1.0" encoding="UTF-8"?><myanimelist><error>Invalid username</error></myanimelist>'
+        self.assertEqual(list(xmlstream.iter_entries(io.BytesIO(error), "anime")), [])
+
+    def test_large_document(self):
+        database = datagen.generate_database("manga", 500)
+        document = datagen.render_list("user", 1, "manga", datagen.generate_list("manga", database, 500))
+
+        entries = list(xmlstream.iter_entries(io.BytesIO(document), "manga"))
+
+        self.assertEqual(len(entries), 500)
+        self.assertEqual(len({entry["series_mangadb_id"] for entry in entries}), 500)
+
+    def test_response(self):
+        document = datagen.render_search("anime", datagen.generate_database("anime", 3))
+        response = mock.Mock()
+        response.iter_content.return_value = [document[i:i + 7] for i in range(0, len(document), 7)]
+
+        entries = list(xmlstream.iter_response_entries(response, "entry"))
+
+        response.iter_content.assert_called_once_with(xmlstream.CHUNK_SIZE)
+        self.assertEqual([entry["id"] for entry in entries], ["1", "2", "3"])
+
+    def test_chunks(self):
+        chunks = [LIST_XML[i:i + 10] for i in range(0, len(LIST_XML), 10)]
+        self.assertEqual(list(xmlstream.iter_chunk_entries(chunks, "anime")),
+                         list(xmlstream.iter_entries(io.BytesIO(LIST_XML), "anime")))
+
+    def test_empty_chunks(self):
+        with self.assertRaises(xmlstream.etree.XMLSyntaxError):
+            list(xmlstream.iter_chunk_entries([b""], "anime"))
+
+    def test_gzipped_source(self):
+        source = gzip.GzipFile(fileobj=io.BytesIO(gzip.compress(LIST_XML)))
+        self.assertEqual(len(list(xmlstream.iter_entries(source, "anime"))), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
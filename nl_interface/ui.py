@@ -1,35 +1,179 @@
-from time import sleep
-from multiprocessing.pool import ThreadPool
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+import io
+import sys
+import threading
 
 import click
 
+# the number of seconds each frame of the loading animation is shown for
+SPINNER_INTERVAL = 0.07
 
-def loading_animation(msg):
+# the frames of the spinning bar loading animation
+SPINNER_FRAMES = "|/-\\"
+
+# the maximum number of actions that may run at the same time, e.g. an action that starts another action
+MAX_CONCURRENT_ACTIONS = 4
+
+# the threads that actions are run on, shared for the whole session rather than created for each action
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_ACTIONS)
+
+
+class AnswerPolicy(Enum):
+    """An Enum representing how questions are answered when there is nobody at the terminal to ask"""
+    BEST = 0    # choose the closest match and answer yes
+    SKIP = 1    # choose none of the matches and answer no
+
+
+# the policy that answers questions instead of the user, None when the user is asked
+_answer_policy = None
+
+
+def set_answer_policy(policy):
+    """Answer questions with a policy instead of prompting the user, e.g. when running a batch of commands
+
+    :param policy: An AnswerPolicy enum value, or None to go back to prompting the user
+    """
+    global _answer_policy
+    _answer_policy = policy
+
+
+def is_interactive():
+    """Check whether there is a user to prompt for answers and show loading animations to
+
+    :return: A boolean, False if an answer policy has been set
+    """
+    return _answer_policy is None
+
+
+def choose_option(num_options):
+    """Get the user's choice from a numbered list of options that ends with a "None of these" option
+
+    :param num_options: An int, the number of options not counting the "None of these" option
+    :return: An int between 1 and num_options + 1
+    """
+    # show the answer that the policy gave in place of the user
+    if _answer_policy is not None:
+        option = 1 if _answer_policy == AnswerPolicy.BEST else num_options + 1
+        click.echo("Please choose an option: {}".format(option))
+        return option
+
+    # get a valid choice from the user
+    while True:
+        option = click.prompt("Please choose an option", type=int)
+        if 1 <= option <= num_options + 1:
+            return option
+        else:
+            click.echo("You must enter a value between {} and {}".format(1, num_options + 1))
+
+
+def confirm(msg):
+    """Ask the user a yes or no question
+
+    :param msg: A string, the question to ask
+    :return: A boolean, whether the answer was yes
+    """
+    # show the answer that the policy gave in place of the user
+    if _answer_policy is not None:
+        click.echo("{} [y/N]: {}".format(msg, "y" if _answer_policy == AnswerPolicy.BEST else "n"))
+        return _answer_policy == AnswerPolicy.BEST
+
+    return click.confirm(msg)
+
+
+def loading_animation(msg, done=None):
     """Print out one rotation of a spinning bar loading animation
-    
+
     :param msg: A string, the message to display
+    :param done: A threading.Event or None, stops the animation as soon as it is set
     """
-    for c in "|/-\\":
+    done = done or threading.Event()
+
+    for c in SPINNER_FRAMES:
         click.echo("\r{}...{}".format(msg, c), nl=False)
-        sleep(0.07)
+        if done.wait(SPINNER_INTERVAL):
+            return
 
 
 def threaded_action(action, msg="Loading", *args, **kwds):
     """Perform a potentially long-running action while displaying a loading animation
-    
+
+    The animation stops the moment the action finishes rather than at the end of a rotation.
+
     :param action: A function to perform
     :param msg: A string, the message to display while action is running
     :param args: A tuple, arguments to pass to the action function
     :param kwds: A dictionary, keyword arguments to pass to the action function
     :return: The return value of action function
     """
-    tp = ThreadPool(processes=1)
+    # nobody is watching the animation, so just perform the action
+    if not is_interactive():
+        return action(*args, **kwds)
 
-    action_result = tp.apply_async(action, args=args, kwds=kwds)
+    done = threading.Event()
 
-    while not action_result.ready():
-        loading_animation(msg)
+    future = _executor.submit(action, *args, **kwds)
+    future.add_done_callback(lambda f: done.set())
+
+    # keep the animation going until the action is done, each rotation stops early once it is
+    while not done.is_set():
+        loading_animation(msg, done)
 
     click.echo("\r{}...Finished".format(msg))
 
-    return action_result.get()
+    return future.result()
+
+
+class ThreadOutput(io.TextIOBase):
+    """A stand-in for sys.stdout that sends what each thread writes to its own buffer, if it has one
+
+    Lets commands that run at the same time print their messages without them being mixed up.
+    """
+
+    def __init__(self, stream):
+        """
+        :param stream: A text stream, where writes from threads without a buffer go, e.g. the real sys.stdout
+        """
+        self.stream = stream
+        self._local = threading.local()
+
+    @property
+    def encoding(self):
+        return self.stream.encoding
+
+    def set_buffer(self, buffer):
+        """Send what the current thread writes to a buffer
+
+        :param buffer: A text stream, e.g. an io.StringIO, or None to write to the stream again
+        """
+        self._local.buffer = buffer
+
+    def write(self, text):
+        return (getattr(self._local, "buffer", None) or self.stream).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def capture_output(action, *args, **kwds):
+    """Perform an action, collecting what it prints instead of printing it
+
+    Only what is printed on the current thread is collected, which needs sys.stdout to be a ThreadOutput. Otherwise
+    the output is printed as usual and nothing is collected.
+
+    :param action: A function to perform
+    :param args: A tuple, arguments to pass to the action function
+    :param kwds: A dictionary, keyword arguments to pass to the action function
+    :return: A tuple (return value of the action function, string printed by it)
+    """
+    buffer = io.StringIO()
+    capture = isinstance(sys.stdout, ThreadOutput)
+
+    if capture:
+        sys.stdout.set_buffer(buffer)
+
+    try:
+        return action(*args, **kwds), buffer.getvalue()
+    finally:
+        if capture:
+            sys.stdout.set_buffer(None)
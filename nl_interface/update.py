@@ -1,13 +1,15 @@
+from collections import OrderedDict
 from enum import Enum
 
 import click
-import requests
-from bs4 import BeautifulSoup
 
 import agent
 from constants import ANIME_STATUS_MAP, ANIME_TYPE_MAP, MANGA_STATUS_MAP, MANGA_TYPE_MAP
+import constants
+import listindex
 import network
 import ui
+import writequeue
 
 
 class ListSearchStatusCode(Enum):
@@ -16,10 +18,10 @@ class ListSearchStatusCode(Enum):
     USER_CANCELLED = 1
 
 
-def update_anime_list_entry(credentials, field_type, search_string, new_value=None):
+def update_anime_list_entry(session, field_type, search_string, new_value=None):
     """Update the details of a users anime list entry
 
-    :param credentials: A tuple containing valid MAL account details in the format (username, password)
+    :param session: A session.Session, the account whose list to update
     :param field_type: A string, the detail to update, must be either "episode", "status" or "score"
     :param search_string: A string, the anime that the user wants to update
     :param new_value: An int or None, the new value to set for the field_type
@@ -32,19 +34,18 @@ def update_anime_list_entry(credentials, field_type, search_string, new_value=No
     if field_type not in valid_field_types:
         raise ValueError("Invalid argument for {}, must be one of {}.".format(field_type, valid_field_types))
 
-    # get the BeautifulSoup tag corresponding to the user's search phrase
-    anime_entry = search_list(credentials[0], "anime", search_string)
+    # get the list entry corresponding to the user's search phrase
+    anime_entry = search_list(session, "anime", search_string)
 
     # check that a valid match was returned
     if anime_entry == ListSearchStatusCode.USER_CANCELLED:
         agent.print_msg("I have cancelled the operation. Nothing was changed.")
         return
-    elif anime_entry == network.StatusCode.CONNECTION_ERROR or anime_entry == network.StatusCode.OTHER_ERROR \
-            or anime_entry == ListSearchStatusCode.NO_RESULTS:
+    elif isinstance(anime_entry, network.StatusCode) or anime_entry == ListSearchStatusCode.NO_RESULTS:
         return
     else:
-        xml_tag_format = "<{0}>{1}</{0}>"
-        xml_field_tags = ""
+        # the fields to send to MAL, in the order they should appear in the XML
+        fields = OrderedDict()
 
         new_status = 0
 
@@ -52,63 +53,47 @@ def update_anime_list_entry(credentials, field_type, search_string, new_value=No
         if field_type == "episode":
             # we are are incrementing the count
             if new_value is None:
-                current_ep_count = int(anime_entry.my_watched_episodes.get_text())
+                current_ep_count = anime_entry.watched_episodes
                 new_value = current_ep_count + 1
 
             # check if the user has reached the last episode
-            if new_value == int(anime_entry.series_episodes.get_text()):
+            if new_value == anime_entry.series_episodes:
                 agent.print_msg("Episode {} is the last in the series.".format(new_value))
-                if click.confirm("Sammy> Do you wish to change the status to completed?"):
-                    xml_field_tags += xml_tag_format.format("status", "2")
+                if ui.confirm("Sammy> Do you wish to change the status to completed?"):
+                    fields["status"] = "2"
                     new_status = 2
             # check if the user has a status of not watching
-            elif anime_entry.my_status.get_text() != "1":
-                if click.confirm("Sammy> Do you wish to change the status to watching?"):
-                    xml_field_tags += xml_tag_format.format("status", "1")
+            elif anime_entry.status != "1":
+                if ui.confirm("Sammy> Do you wish to change the status to watching?"):
+                    fields["status"] = "1"
                     new_status = 1
 
         # set the number of episodes to number in series if status set to completed
-        elif field_type == "status" and new_value == 2 and anime_entry.series_episodes.get_text() != "0":
-            xml_field_tags += xml_tag_format.format("episode", anime_entry.series_episodes.get_text())
+        elif field_type == "status" and new_value == 2 and anime_entry.series_episodes != 0:
+            fields["episode"] = anime_entry.series_episodes
 
-        xml_field_tags += xml_tag_format.format(field_type, new_value)
+        fields[field_type] = new_value
 
-        # form the XML string
-        xml = '<?xml version="1.0" encoding="UTF-8"?><entry>{}</entry>'.format(xml_field_tags)
+        # change the list straight away and send the change to MAL in the background
+        writequeue.get_queue().submit(session, "anime", anime_entry.series_id, fields, anime_entry.title)
 
-        # prepare the URL
-        url = "https://myanimelist.net/api/animelist/update/{}.xml".format(anime_entry.series_animedb_id.get_text())
+        anime_title = anime_entry.title
+        updated_msg_format = 'I have updated "{}" to {} "{}".'
+        updated_msg = updated_msg_format.format(anime_title, field_type, new_value)
 
-        # send the async request to the server, uses GET due to bug in API handling POST requests
-        r = ui.threaded_action(network.make_request, msg="Updating", request=requests.get, url=url,
-                               params={"data": xml}, auth=credentials)
+        if field_type == "status":
+            updated_msg = updated_msg_format.format(anime_title, field_type, ANIME_STATUS_MAP[str(new_value)])
+        # check if the status was changed
+        elif new_status:
+            updated_msg += " Status set to \"{}\"".format(ANIME_STATUS_MAP[str(new_status)])
 
-        # check if there was an error with the user's internet connection
-        if r == network.StatusCode.CONNECTION_ERROR:
-            agent.print_connection_error_msg()
-            return
+        agent.print_msg(updated_msg)
 
-        # inform the user whether the request was successful or not
-        if r.status_code == 200:
-            anime_title = anime_entry.series_title.get_text()
-            updated_msg_format = 'I have updated "{}" to {} "{}".'
-            updated_msg = updated_msg_format.format(anime_title, field_type, new_value)
 
-            if field_type == "status":
-                updated_msg = updated_msg_format.format(anime_title, field_type, ANIME_STATUS_MAP[str(new_value)])
-            # check if the status was changed
-            elif new_status:
-                updated_msg += " Status set to \"{}\"".format(ANIME_STATUS_MAP[str(new_status)])
-
-            agent.print_msg(updated_msg)
-        else:
-            agent.print_msg("There was an error updating the anime. Please try again.")
-
-
-def update_manga_list_entry(credentials, field_type, search_string, new_value=None):
+def update_manga_list_entry(session, field_type, search_string, new_value=None):
     """Increment the chapter or volume count of a manga on the user's list
 
-    :param credentials: A tuple containing valid MAL account details in the format (username, password)
+    :param session: A session.Session, the account whose list to update
     :param field_type: A string, the detail to update, must be either "chapter", "volume", "status" or "score"
     :param search_string: A string, the manga that the user wants to update
     :param new_value: An int or None, the new value to set for the field_type
@@ -128,21 +113,20 @@ def update_manga_list_entry(credentials, field_type, search_string, new_value=No
         agent.print_msg("The value for {} cannot be less than 0.".format(field_type))
         return
 
-    # get the BeautifulSoup tag corresponding to the user's search phrase
-    manga_entry = search_list(credentials[0], "manga", search_string)
+    # get the list entry corresponding to the user's search phrase
+    manga_entry = search_list(session, "manga", search_string)
 
     # check that a valid match was returned
     if manga_entry == ListSearchStatusCode.USER_CANCELLED:
         agent.print_msg("I have cancelled the operation. Nothing was changed.")
         return
-    elif manga_entry == network.StatusCode.CONNECTION_ERROR or manga_entry == network.StatusCode.OTHER_ERROR \
-            or manga_entry == ListSearchStatusCode.NO_RESULTS:
+    elif isinstance(manga_entry, network.StatusCode) or manga_entry == ListSearchStatusCode.NO_RESULTS:
         return
     else:
-        manga_title = manga_entry.series_title.get_text()
+        manga_title = manga_entry.title
 
-        xml_tag_format = "<{0}>{1}</{0}>"
-        xml_field_tags = ""
+        # the fields to send to MAL, in the order they should appear in the XML
+        fields = OrderedDict()
 
         new_status = 0
 
@@ -151,13 +135,13 @@ def update_manga_list_entry(credentials, field_type, search_string, new_value=No
             # we are incrementing the count
             if new_value is None:
                 if field_type == "chapter":
-                    current_value = int(manga_entry.my_read_chapters.get_text())
+                    current_value = manga_entry.read_chapters
                 else:
-                    current_value = int(manga_entry.my_read_volumes.get_text())
+                    current_value = manga_entry.read_volumes
                 new_value = current_value + 1
 
-            series_chapters = int(manga_entry.series_chapters.get_text())
-            series_volumes = int(manga_entry.series_volumes.get_text())
+            series_chapters = manga_entry.series_chapters
+            series_volumes = manga_entry.series_volumes
 
             if field_type == "chapters" and series_chapters != 0 and new_value > series_chapters:
                 agent.print_msg("There are only {} chapters in this series.".format(series_chapters))
@@ -170,66 +154,69 @@ def update_manga_list_entry(credentials, field_type, search_string, new_value=No
             if (new_value == series_chapters and field_type == "chapter" and series_chapters != 0) or \
                (new_value == series_volumes and field_type == "volume" and series_volumes != 0):
                 agent.print_msg("{} {} is the last in the series.".format(field_type.title(), new_value))
-                if click.confirm("Sammy> Do you wish to change the status to completed?"):
+                if ui.confirm("Sammy> Do you wish to change the status to completed?"):
                     # set both the chapter and volume counts to the number in the series
-                    xml_field_tags += xml_tag_format.format("status", "2")
-                    xml_field_tags += xml_tag_format.format("chapter", series_chapters)
-                    xml_field_tags += xml_tag_format.format("volume", series_volumes)
+                    fields["status"] = "2"
+                    fields["chapter"] = series_chapters
+                    fields["volume"] = series_volumes
                     new_status = 2
             # check if the user has a status of not reading
-            elif manga_entry.my_status.get_text() != "1":
-                if click.confirm("Sammy> Do you wish to change the status to watching?"):
-                    xml_field_tags += xml_tag_format.format("status", "1")
+            elif manga_entry.status != "1":
+                if ui.confirm("Sammy> Do you wish to change the status to watching?"):
+                    fields["status"] = "1"
                     new_status = 1
 
         # set the number of chapters and volumes to number in series if status set to completed
         elif field_type == "status" and new_value == 2:
-            if manga_entry.series_chapters.get_text() != "0":
-                xml_field_tags += xml_tag_format.format("chapter", manga_entry.series_chapters.get_text())
-            if manga_entry.series_volumes.get_text() != "0":
-                xml_field_tags += xml_tag_format.format("volume", manga_entry.series_volumes.get_text())
+            if manga_entry.series_chapters != 0:
+                fields["chapter"] = manga_entry.series_chapters
+            if manga_entry.series_volumes != 0:
+                fields["volume"] = manga_entry.series_volumes
 
         if new_status != 2:
-            xml_field_tags += xml_tag_format.format(field_type, new_value)
+            fields[field_type] = new_value
 
-        # form the XML string
-        xml = '<?xml version="1.0" encoding="UTF-8"?><entry>{}</entry>'.format(xml_field_tags)
+        # change the list straight away and send the change to MAL in the background
+        writequeue.get_queue().submit(session, "manga", manga_entry.series_id, fields, manga_title)
 
-        # prepare the url
-        url = "https://myanimelist.net/api/mangalist/update/{}.xml".format(manga_entry.series_mangadb_id.get_text())
+        updated_msg_format = 'Updated "{}" to {} "{}".'
 
-        # send the async request to the server, uses GET due to bug in API handling POST requests
-        r = ui.threaded_action(network.make_request, msg="Updating", request=requests.get, url=url,
-                               params={"data": xml}, auth=credentials)
+        updated_msg = updated_msg_format.format(manga_title, field_type, new_value)
 
-        if r == network.StatusCode.CONNECTION_ERROR:
-            agent.print_connection_error_msg()
-            return
+        if field_type == "status":
+            updated_msg = updated_msg_format.format(manga_title, field_type, MANGA_STATUS_MAP[str(new_value)])
+        # check if the status was changed
+        elif new_status:
+            updated_msg += ' Status set to "{}"'.format(MANGA_STATUS_MAP[str(new_status)])
 
-        # inform the user whether the request was successful or not
-        if r.status_code == 200:
-            updated_msg_format = 'Updated "{}" to {} "{}".'
+        agent.print_msg(updated_msg)
 
-            updated_msg = updated_msg_format.format(manga_title, field_type, new_value)
 
-            if field_type == "status":
-                updated_msg = updated_msg_format.format(manga_title, field_type, MANGA_STATUS_MAP[str(new_value)])
-            # check if the status was changed
-            elif new_status:
-                updated_msg += ' Status set to "{}"'.format(MANGA_STATUS_MAP[str(new_status)])
+def get_list_entries(session, list_type, action_msg):
+    """Get the entries on a user's list from the local list store
 
-            agent.print_msg(updated_msg)
-        else:
-            agent.print_msg("There was an error updating the manga. Please try again.")
+    The list is only downloaded (with a spinner showing action_msg) if it has never been fetched before. Stale lists
+    are returned straight away and refreshed in the background.
+
+    :param session: A session.Session, the account whose list to get
+    :param list_type: A string, must be either "anime" or "manga"
+    :param action_msg: A string, the message to show while the list is being downloaded
+    :return: A list of records.ListEntry or a network.StatusCode if the list couldn't be downloaded
+    """
+    # only show the spinner if we actually have to wait for the network
+    if session.has_list(list_type):
+        return session.get_list(list_type)
+    else:
+        return ui.threaded_action(session.get_list, action_msg, list_type)
 
 
-def search_list(username, search_type, search_string):
+def search_list(session, search_type, search_string):
     """Search a user's list for a manga or anime and return the matching entry
 
-    :param username: A string, the username of a MAL user
+    :param session: A session.Session, the account whose list to search
     :param search_type: A string, must be either "anime" or "manga"
     :param search_string: A string, the entry the user wants to update
-    :return: A beautiful soup tag or None if unsuccessful
+    :return: A records.ListEntry, a ListSearchStatusCode or a network.StatusCode if unsuccessful
     """
 
     if search_type not in ["anime", "manga"]:
@@ -237,124 +224,85 @@ def search_list(username, search_type, search_string):
 
     click.echo()
 
-    # the base url of the user list xml data
-    url = "https://myanimelist.net/malappinfo.php"
+    entries = get_list_entries(session, search_type, "Searching your {} list".format(search_type))
 
-    # send the async request to the server
-    r = ui.threaded_action(network.make_request, msg="Searching your {} list".format(search_type), request=requests.get,
-                           url=url, params={"u": username, "type": search_type}, stream=True)
-
-    # check if there was an error with the user's internet connection
-    if r == network.StatusCode.CONNECTION_ERROR:
-        agent.print_connection_error_msg()
-        return r
-
-    if r.status_code == 200:
-        r.raw.decode_content = True
-
-        soup = BeautifulSoup(r.raw, "xml")
-
-        matches = []
-
-        # iterate over the returned entries for the search type
-        for entry in soup.find_all(search_type):
-            # normalise the title and synonyms to lowercase
-            series_title_lower = entry.series_title.get_text().lower()
-            series_synonyms_lower = entry.series_synonyms.get_text().lower()
+    # check if there was an error getting the list
+    if entries == network.StatusCode.OTHER_ERROR:
+        agent.print_msg("There was an error getting the entry on your list. Please try again.")
+        return entries
+    elif isinstance(entries, network.StatusCode):
+        agent.print_network_error_msg(entries)
+        return entries
+
+    # look the search string up in the list's index rather than scanning every entry, best matches first
+    index = session.store.get_index(session.username, search_type)
+    ranked = index.rank(search_string, constants.MAX_SUGGESTIONS, constants.MIN_FUZZY_SIMILARITY)
+    matches = [entry for entry, score in ranked]
+
+    num_results = len(matches)
+
+    if num_results == 0:
+        agent.print_msg('I could not find "{}" on your {} list'.format(search_string, search_type))
+        return ListSearchStatusCode.NO_RESULTS
+    elif num_results == 1 or listindex.should_auto_select(ranked, constants.AUTO_SELECT_THRESHOLD):
+        return matches[0]
+    else:
+        agent.print_msg("I found {} results. Did you mean:".format(num_results))
 
-            # if the whole search string matches the entry then add it to our list of matches
-            if search_string in series_title_lower or search_string in series_synonyms_lower:
-                matches.append(entry)
-                continue
+        # iterate over the matches and print them out
+        for i in range(len(matches)):
+            title_format = "{}> {} ({})" if matches[i].synonyms != "" else "{}> {}"
+            click.echo(title_format.format(i + 1, matches[i].title, matches[i].synonyms))
 
-            # check if any of our tokens matches the entry
-            for token in search_string.split():
-                if token in series_title_lower or token in series_synonyms_lower:
-                    matches.append(entry)
-                    break
+        click.echo("{}> [None of these]".format(num_results + 1))
 
-        num_results = len(matches)
+        # get a valid choice from the user
+        option = ui.choose_option(num_results)
 
-        if num_results == 0:
-            agent.print_msg('I could not find "{}" on your {} list'.format(search_string, search_type))
-            return ListSearchStatusCode.NO_RESULTS
-        elif num_results == 1:
-            return matches[0]
+        # check that the user didn't choose the none of these option before returning the match
+        if option != num_results + 1:
+            return matches[option - 1]
         else:
-            agent.print_msg("I found {} results. Did you mean:".format(num_results))
-
-            # iterate over the matches and print them out
-            for i in range(len(matches)):
-                title_format = "{}> {} ({})" if matches[i].series_synonyms.get_text() != "" else "{}> {}"
-                click.echo(title_format.format(i + 1, matches[i].series_title.get_text(),
-                                               matches[i].series_synonyms.get_text()))
+            return ListSearchStatusCode.USER_CANCELLED
 
-            click.echo("{}> [None of these]".format(num_results + 1))
 
-            # get a valid choice from the user
-            while True:
-                option = click.prompt("Please choose an option", type=int)
-                if 1 <= option <= num_results + 1:
-                    break
-                else:
-                    click.echo("You must enter a value between {} and {}".format(1, num_results + 1))
-
-            # check that the user didn't choose the none of these option before returning the match
-            if option != num_results + 1:
-                return matches[option - 1]
-            else:
-                return ListSearchStatusCode.USER_CANCELLED
-    else:
-        agent.print_msg("There was an error getting the entry on your list. Please try again.")
-        return network.StatusCode.OTHER_ERROR
-
-
-def view_list(username, search_type):
+def view_list(session, search_type):
     """View the anime and manga list of a user
 
-    :param username: A valid MAL username
+    :param session: A session.Session, the account whose list to view
     :param search_type: A string, must be either "anime" or "manga"
     """
     if search_type not in ["anime", "manga"]:
         raise ValueError("Invalid argument for {}, must be either {} or {}.".format(search_type, "anime", "manga"))
 
-    # the base url of the user list xml data
-    url = "https://myanimelist.net/malappinfo.php"
-
-    # make the request to the server and get the results
-    r = ui.threaded_action(network.make_request, "Getting {} list".format(search_type),
-                           request=requests.get, url=url, params={"u": username, "type": search_type}, stream=True)
-
-    # check if there was an error with the user's internet connection
-    if r == network.StatusCode.CONNECTION_ERROR:
-        agent.print_connection_error_msg()
-
-    elif r.status_code == 200:
-        r.raw.decode_content = True
-
-        soup = BeautifulSoup(r.raw, "xml")
+    # get the list from the store, downloading it if needed
+    entries = get_list_entries(session, search_type, "Getting {} list".format(search_type))
 
+    # check if there was an error getting the list
+    if entries == network.StatusCode.OTHER_ERROR:
+        agent.print_msg("There was an error getting your {} list. Please try again.".format(search_type))
+    elif isinstance(entries, network.StatusCode):
+        agent.print_network_error_msg(entries)
+    else:
         # use a different layout depending on whether it is anime or manga
         layout_string = "{}) {}" + "\n    - {}: {}" * (4 if search_type == "anime" else 5)
 
         i = 1
-        for entry in soup.find_all(search_type):
+        for entry in entries:
             if search_type == "anime":
                 click.echo(layout_string.format(
-                    i, entry.series_title.get_text(),
-                    "Status", ANIME_STATUS_MAP[entry.my_status.get_text()],
-                    "Score", entry.my_score.get_text(),
-                    "Type", ANIME_TYPE_MAP[entry.series_type.get_text()],
-                    "Progress", entry.my_watched_episodes.get_text() + "/" + entry.series_episodes.get_text()))
+                    i, entry.title,
+                    "Status", ANIME_STATUS_MAP[entry.status],
+                    "Score", entry.score,
+                    "Type", ANIME_TYPE_MAP[entry.series_type],
+                    "Progress", "{}/{}".format(entry.watched_episodes, entry.series_episodes)))
             else:
                 click.echo(layout_string.format(
-                    i, entry.series_title.get_text(),
-                    "Status", MANGA_STATUS_MAP[entry.my_status.get_text()],
-                    "Score", entry.my_score.get_text(),
-                    "Type", MANGA_TYPE_MAP[entry.series_type.get_text()],
-                    "Chapters", entry.my_read_chapters.get_text() + "/" + entry.series_chapters.get_text(),
-                    "Volumes", entry.my_read_volumes.get_text() + "/" + entry.series_volumes.get_text()))
+                    i, entry.title,
+                    "Status", MANGA_STATUS_MAP[entry.status],
+                    "Score", entry.score,
+                    "Type", MANGA_TYPE_MAP[entry.series_type],
+                    "Chapters", "{}/{}".format(entry.read_chapters, entry.series_chapters),
+                    "Volumes", "{}/{}".format(entry.read_volumes, entry.series_volumes)))
 
             i += 1
-    else:
-        agent.print_msg("There was an error getting your {} list. Please try again.".format(search_type))
@@ -0,0 +1,352 @@
+from collections import OrderedDict
+import threading
+
+import agent
+import client
+import helpers
+import journal
+import liststore
+import network
+
+# the seconds to wait for more changes to an entry before sending them all to MAL in one update
+DEBOUNCE_DELAY = 1.5
+
+# the number of times an update is sent before giving up on it
+MAX_ATTEMPTS = 4
+
+# the seconds to wait before sending a failed update again, doubled after each failure
+RETRY_DELAY = 1
+
+# the most seconds to wait for pending updates to be sent when the program exits
+FLUSH_TIMEOUT = 30
+
+
+def is_retryable(result):
+    """Check whether a failed update is worth sending again
+
+    :param result: A requests.Response or a network.StatusCode, the result of sending the update
+    :return: A boolean, True for network failures and server errors, False if MAL rejected the update
+    """
+    if isinstance(result, network.StatusCode):
+        return result != network.StatusCode.UNAUTHORISED
+
+    return result.status_code >= 500
+
+
+def report_failure(update, result):
+    """Tell the user that an update couldn't be saved
+
+    Updates that failed because MAL couldn't be reached are kept in the journal to be sent later, any others are
+    undone by putting the list back the way MAL has it.
+
+    :param update: A PendingUpdate, the update that failed
+    :param result: A requests.Response or a network.StatusCode, the result of the last attempt to send it
+    """
+    if journal.is_offline(result):
+        agent.print_msg('I couldn\'t reach MAL, so I will save your changes to "{}" as soon as I can.'
+                        .format(update.title))
+        return
+
+    if isinstance(result, network.StatusCode):
+        agent.print_network_error_msg(result)
+
+    agent.print_msg('I couldn\'t save your changes to "{}" on MAL, so I have undone them.'.format(update.title))
+
+    liststore.refresh_in_background(update.session.username, update.media_type)
+
+
+class PendingUpdate:
+    """Changes to a list entry that have been made locally but not yet sent to MAL"""
+
+    def __init__(self, session, media_type, entry_id, title):
+        """
+        :param session: A session.Session, the account whose list the entry is on
+        :param media_type: A string, must be either "anime" or "manga"
+        :param entry_id: A string, the MAL database id of the entry
+        :param title: A string, the title of the entry, used to tell the user if the update fails
+        """
+        self.session = session
+        self.media_type = media_type
+        self.entry_id = entry_id
+        self.title = title
+
+        # the fields to send, in the order they should appear in the XML
+        self.fields = OrderedDict()
+
+        # the number of times the update has been sent and failed
+        self.attempts = 0
+
+        # the seqs of the changes in the journal that the update is made up of
+        self.seqs = []
+
+        # the threading.Timer that will send the update
+        self.timer = None
+
+        # whether the timer went off while an earlier update to the entry was still being sent
+        self.held = False
+
+    @property
+    def key(self):
+        """A tuple (username, media type, entry id) identifying the entry"""
+        return self.session.username, self.media_type, self.entry_id
+
+
+class WriteQueue:
+    """Send changes to list entries to MAL in the background
+
+    Changes are applied to the list store straight away, then held back for a short debounce window so that several
+    changes to the same entry (e.g. incrementing the episode count a few times in a row) are sent as a single update.
+    Updates that fail because of the network or MAL are retried with a backoff, and the user is told about any that
+    still fail. Only one update for a given entry is ever being sent at a time, so they reach MAL in order.
+
+    Every change is written to the journal first. Updates that fail because MAL can't be reached are left in the
+    journal to be replayed later, as are any later changes to the same entry.
+    """
+
+    def __init__(self, delay=DEBOUNCE_DELAY, max_attempts=MAX_ATTEMPTS, retry_delay=RETRY_DELAY,
+                 on_failure=report_failure):
+        """
+        :param delay: A number, the seconds to wait for more changes to an entry before sending them
+        :param max_attempts: An int, the number of times an update is sent before giving up on it
+        :param retry_delay: A number, the seconds to wait before the first retry of a failed update
+        :param on_failure: A function taking the PendingUpdate and the result of its last attempt, called from a
+                           background thread when an update is given up on
+        """
+        self.delay = delay
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.on_failure = on_failure
+
+        # the number of updates that have been given up on
+        self.failures = 0
+
+        self._condition = threading.Condition()
+
+        # the updates waiting to be sent, keyed by PendingUpdate.key
+        self._pending = {}
+
+        # the updates that are being sent right now, keyed by PendingUpdate.key
+        self._sending = {}
+
+    def submit(self, session, media_type, entry_id, fields, title=""):
+        """Apply changes to an entry on a user's list and queue them to be sent to MAL
+
+        :param session: A session.Session, the account whose list the entry is on
+        :param media_type: A string, must be either "anime" or "manga"
+        :param entry_id: A string or int, the MAL database id of the entry
+        :param fields: An OrderedDict, the fields to change, e.g. {"episode": 3}
+        :param title: A string, the title of the entry
+        :return: The updated records.ListEntry or None if the entry isn't in the store
+        """
+        entry = session.store.update_entry(session.username, media_type, entry_id, fields)
+        changes = journal.get_journal()
+
+        with self._condition:
+            key = (session.username, media_type, str(entry_id))
+            update = self._pending.get(key)
+
+            # the changes to the entry that this queue is already sending
+            own_seqs = set()
+            for own_update in [update, self._sending.get(key)]:
+                if own_update is not None:
+                    own_seqs.update(own_update.seqs)
+
+            # queue behind earlier changes to the entry that are waiting for MAL to be reachable again
+            if any(record.seq not in own_seqs for record in changes.pending(session.username, media_type, entry_id)):
+                changes.append(session.username, media_type, journal.Action.UPDATE, entry_id, fields, title,
+                               in_flight=False)
+                journal.replay_in_background(session)
+                return entry
+
+            record = changes.append(session.username, media_type, journal.Action.UPDATE, entry_id, fields, title)
+
+            if update is None:
+                update = self._pending[key] = PendingUpdate(session, media_type, str(entry_id), title)
+
+            # newer values replace older ones for the same field
+            update.fields.update(fields)
+            update.seqs.append(record.seq)
+            update.attempts = 0
+
+            # restart the debounce window
+            self._schedule(update, self.delay)
+
+        return entry
+
+    def pending_count(self):
+        """Get the number of updates that haven't been sent successfully yet
+
+        :return: An int
+        """
+        with self._condition:
+            return len(self._pending) + len(self._sending)
+
+    def flush(self, timeout=None):
+        """Send every pending update now and wait for them to finish
+
+        Failed updates are still retried after their usual backoff, so this can take a while if MAL can't be reached.
+
+        :param timeout: A number or None, the most seconds to wait
+        :return: A boolean, True if every update was sent or given up on, False if the timeout ran out first
+        """
+        with self._condition:
+            for update in list(self._pending.values()):
+                if update.attempts == 0:
+                    self._schedule(update, 0)
+
+            return self._condition.wait_for(lambda: not self._pending and not self._sending, timeout)
+
+    def _schedule(self, update, delay):
+        """Start (or restart) the timer that sends an update (must hold the lock)
+
+        :param update: A PendingUpdate
+        :param delay: A number, the seconds to wait before sending it
+        """
+        if update.timer is not None:
+            update.timer.cancel()
+
+        update.held = False
+
+        update.timer = threading.Timer(delay, self._send, (update.key,))
+        update.timer.daemon = True
+        update.timer.start()
+
+    def _send(self, key):
+        """Send the pending update to an entry, called by its timer
+
+        :param key: A tuple (username, media type, entry id)
+        """
+        with self._condition:
+            update = self._pending.get(key)
+
+            # the update has already been sent or rescheduled
+            if update is None or update.timer is not threading.current_thread():
+                return
+
+            # another update to the same entry is being sent right now, this one goes once that has finished
+            if key in self._sending:
+                update.held = True
+                return
+
+            del self._pending[key]
+            self._sending[key] = update
+            update.attempts += 1
+
+        result = None
+        try:
+            xml = helpers.entry_xml(update.fields)
+            # the change has already been made locally, so let requests from the prompt go first
+            with network.priority(network.Priority.BACKGROUND):
+                result = client.run(client.update_entry(update.session.credentials, update.media_type,
+                                                        update.entry_id, xml))
+        finally:
+            # the update couldn't be sent at all, e.g. because the program is exiting
+            if result is None:
+                self._abandon(update)
+
+        succeeded = not isinstance(result, network.StatusCode) and result.status_code == 200
+
+        if succeeded:
+            # apply the fields again in case a refresh of the list replaced them with MAL's copy from before the update
+            update.session.store.update_entry(update.session.username, update.media_type, update.entry_id,
+                                              update.fields)
+
+        gave_up = False
+
+        with self._condition:
+            del self._sending[key]
+            newer = self._pending.get(key)
+
+            if not succeeded and update.attempts < self.max_attempts and is_retryable(result):
+                # resend the failed fields along with any that have changed since
+                if newer is not None:
+                    update.fields.update(newer.fields)
+                    update.seqs.extend(newer.seqs)
+                    newer.timer.cancel()
+
+                self._pending[key] = update
+                self._schedule(update, self.retry_delay * 2 ** (update.attempts - 1))
+            elif not succeeded and journal.is_offline(result):
+                gave_up = True
+                self.failures += 1
+
+                # keep the update and any changes made since in the journal to be replayed in order
+                if newer is not None:
+                    update.fields.update(newer.fields)
+                    update.seqs.extend(newer.seqs)
+                    newer.timer.cancel()
+                    del self._pending[key]
+
+                journal.get_journal().park(*update.seqs)
+            else:
+                gave_up = not succeeded
+                if gave_up:
+                    self.failures += 1
+
+                journal.get_journal().finish(*update.seqs)
+
+                # an update to the entry that was held back while this one was being sent can go now
+                if newer is not None and newer.held:
+                    self._schedule(newer, 0)
+
+            self._condition.notify_all()
+
+        if not isinstance(result, network.StatusCode):
+            result.close()
+
+        if gave_up and self.on_failure is not None:
+            self.on_failure(update, result)
+
+    def _abandon(self, update):
+        """Stop sending an update that raised an error instead of returning a result
+
+        The update and any changes made to the entry since are left in the journal to be replayed later, so that they
+        still reach MAL in order.
+
+        :param update: A PendingUpdate, the update that is being sent
+        """
+        with self._condition:
+            del self._sending[update.key]
+            newer = self._pending.pop(update.key, None)
+
+            if newer is not None:
+                update.seqs.extend(newer.seqs)
+                newer.timer.cancel()
+
+            journal.get_journal().park(*update.seqs)
+
+            self._condition.notify_all()
+
+
+# the queue shared by the whole program, created on first use
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """Get the shared write queue, creating it on first use
+
+    Pending updates are flushed when the program exits, before the threads that send requests are shut down.
+
+    :return: A WriteQueue
+    """
+    global _queue
+
+    with _queue_lock:
+        if _queue is None:
+            _queue = WriteQueue()
+            # run before the client's executor is shut down (hooks registered later run first), an atexit hook would
+            # run after it and every update would fail to be sent
+            threading._register_atexit(_queue.flush, FLUSH_TIMEOUT)
+        return _queue
+
+
+def set_queue(queue):
+    """Replace the shared write queue, e.g. with one that doesn't wait before sending
+
+    :param queue: A WriteQueue
+    """
+    global _queue
+
+    with _queue_lock:
+        _queue = queue
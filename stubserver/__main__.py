@@ -0,0 +1,42 @@
+import click
+
+from stubserver import server
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", help="The interface to listen on.")
+@click.option("--port", default=8000, help="The port to listen on.")
+@click.option("--list-size", default=100, help="The number of entries on each user's anime and manga lists.")
+@click.option("--database-size", default=2000, help="The number of anime and manga that can be searched for.")
+@click.option("--seed", default=0, help="The seed for the generated data.")
+@click.option("--latency", default=0.0, help="Seconds to wait before answering each request.")
+@click.option("--jitter", default=0.0, help="Up to this many extra seconds are randomly added to the latency.")
+@click.option("--error-rate", default=0.0, help="The fraction of requests answered with a 503 error.")
+@click.option("--no-results-rate", default=0.0, help="The fraction of searches answered with a 204 no content.")
+@click.option("--user", "users", multiple=True, metavar="NAME:PASSWORD",
+              help="Only accept these credentials (any non-empty credentials are accepted if none are given).")
+@click.option("--conditional-lists", is_flag=True,
+              help="Send ETag and Last-Modified headers with lists and answer conditional requests with a 304.")
+@click.option("--verbose", is_flag=True, help="Log every request.")
+def main(host, port, list_size, database_size, seed, latency, jitter, error_rate, no_results_rate, users,
+         conditional_lists, verbose):
+    """Run a local stand-in for the MAL API"""
+    config = server.StubConfig(list_size=list_size, database_size=database_size, seed=seed, latency=latency,
+                               jitter=jitter, error_rate=error_rate, no_results_rate=no_results_rate,
+                               users=dict(user.split(":", 1) for user in users) if users else None,
+                               conditional_lists=conditional_lists)
+
+    stub = server.StubServer((host, port), config, verbose=verbose)
+
+    click.echo("Serving a stand-in MAL API on {}".format(stub.base_url))
+    click.echo("Run Sammy with the environment variable MAL_BASE_URL={} to use it".format(stub.base_url))
+
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+from collections import OrderedDict
+import random
+import time
+from xml.sax.saxutils import escape
+
+# words that synthetic titles are built out of, a mix of common title words and short ones like "no" that match a lot
+TITLE_WORDS = [
+    "shingeki", "no", "kyojin", "naruto", "bleach", "cowboy", "bebop", "death", "note", "sword", "art", "online",
+    "steins", "gate", "fullmetal", "alchemist", "hunter", "one", "piece", "tokyo", "ghoul", "code", "geass",
+    "neon", "genesis", "evangelion", "mob", "psycho", "spirited", "away", "clannad", "toradora", "haikyuu",
+    "kimi", "na", "wa", "boku", "hero", "academia", "black", "clover", "lagoon", "trigun", "monster", "berserk",
+    "vinland", "saga", "mushishi", "nana", "paradise", "kiss", "school", "days", "love", "live", "idol", "star",
+    "dragon", "ball", "slam", "dunk", "great", "teacher", "onizuka", "rurouni", "kenshin", "yuu", "hakusho",
+    "sakura", "card", "captor", "magical", "girl", "madoka", "magica", "gintama", "durarara", "baccano", "mirai"
+]
+
+# extra words tacked on the end of some titles, like sequels and spin-offs
+TITLE_SUFFIXES = ["2nd Season", "Season 3", "The Movie", "OVA", "Specials", "Shippuuden", "Kai", "Zero", "Final"]
+
+# the media types in the order of their MAL type codes (so the code for a type is its index plus one)
+ANIME_TYPES = ["TV", "OVA", "Movie", "Special", "ONA", "Music"]
+MANGA_TYPES = ["Manga", "Novel", "One-shot", "Doujinshi", "Manhwa", "Manhua", "OEL"]
+
+# the statuses a list entry can have
+LIST_STATUSES = ["1", "2", "3", "4", "6"]
+
+
+def generate_title(rng):
+    """Build a random title out of two to four title words, sometimes followed by a suffix
+
+    :param rng: A random.Random instance
+    :return: A string, the title
+    """
+    title = " ".join(word.title() for word in rng.sample(TITLE_WORDS, rng.randint(2, 4)))
+
+    if rng.random() < 0.2:
+        title += " " + rng.choice(TITLE_SUFFIXES)
+
+    return title
+
+
+def generate_database(media_type, size, seed=0):
+    """Generate the MAL database of anime or manga that searches are run against
+
+    Entries are shaped like those in the api/{type}/search.xml responses.
+
+    :param media_type: A string, must be either "anime" or "manga"
+    :param size: An int, the number of entries to generate
+    :param seed: An int, the seed for the random number generator so the same database can be recreated
+    :return: A list of OrderedDicts with string values, one per entry
+    """
+    if media_type not in ["anime", "manga"]:
+        raise ValueError("Invalid argument for {}, must be either {} or {}.".format(media_type, "anime", "manga"))
+
+    rng = random.Random("{}-{}".format(media_type, seed))
+
+    database = []
+
+    for entry_id in range(1, size + 1):
+        title = generate_title(rng)
+
+        entry = OrderedDict()
+        entry["id"] = str(entry_id)
+        entry["title"] = title
+        entry["english"] = title if rng.random() < 0.5 else ""
+        entry["synonyms"] = generate_title(rng) if rng.random() < 0.3 else ""
+
+        if media_type == "anime":
+            entry["episodes"] = str(rng.choice([0, 1, 1, 3, 6, 12, 13, 24, 25, 26, 50]))
+        else:
+            entry["chapters"] = str(rng.choice([0, 1, 10, 45, 100, 250]))
+            entry["volumes"] = str(rng.choice([0, 1, 3, 8, 20, 40]))
+
+        entry["score"] = "{:.2f}".format(rng.uniform(4, 9.5))
+        entry["type"] = rng.choice(ANIME_TYPES if media_type == "anime" else MANGA_TYPES)
+        entry["status"] = rng.choice(["Finished Airing", "Currently Airing", "Not yet aired"] if media_type == "anime"
+                                     else ["Finished", "Publishing", "Not yet published"])
+        entry["start_date"] = "{}-{:02d}-{:02d}".format(rng.randint(1970, 2017), rng.randint(1, 12), rng.randint(1, 28))
+        entry["end_date"] = "0000-00-00"
+        entry["synopsis"] = "A story about {} and {}.<br />\n<br />\n[i](Source: Sammy stand-in)[/i]".format(
+            *rng.sample(TITLE_WORDS, 2))
+        entry["image"] = "https://myanimelist.cdn-dena.com/images/{}/{}/{}.jpg".format(media_type, entry_id % 10,
+                                                                                       entry_id)
+
+        database.append(entry)
+
+    return database
+
+
+def list_entry_from_database(media_type, database_entry, status="6", score="0", progress=(0, 0)):
+    """Create a list entry, shaped like those in malappinfo.php responses, for an entry in the database
+
+    :param media_type: A string, must be either "anime" or "manga"
+    :param database_entry: An OrderedDict, the database entry as generated by generate_database
+    :param status: A string, the status code of the entry on the user's list
+    :param score: A string, the user's score for the entry
+    :param progress: A tuple of ints, the watched episodes or the read (chapters, volumes)
+    :return: An OrderedDict with string values
+    """
+    types = ANIME_TYPES if media_type == "anime" else MANGA_TYPES
+
+    entry = OrderedDict()
+    entry["series_{}db_id".format(media_type)] = database_entry["id"]
+    entry["series_title"] = database_entry["title"]
+    entry["series_synonyms"] = "; " + database_entry["synonyms"] if database_entry["synonyms"] else ""
+    entry["series_type"] = str(types.index(database_entry["type"]) + 1)
+
+    if media_type == "anime":
+        entry["series_episodes"] = database_entry["episodes"]
+    else:
+        entry["series_chapters"] = database_entry["chapters"]
+        entry["series_volumes"] = database_entry["volumes"]
+
+    entry["series_status"] = "2"
+    entry["series_start"] = database_entry["start_date"]
+    entry["series_end"] = database_entry["end_date"]
+    entry["series_image"] = database_entry["image"]
+    entry["my_id"] = "0"
+
+    if media_type == "anime":
+        entry["my_watched_episodes"] = str(progress[0])
+    else:
+        entry["my_read_chapters"] = str(progress[0])
+        entry["my_read_volumes"] = str(progress[1])
+
+    entry["my_start_date"] = "0000-00-00"
+    entry["my_finish_date"] = "0000-00-00"
+    entry["my_score"] = str(score)
+    entry["my_status"] = str(status)
+
+    if media_type == "anime":
+        entry["my_rewatching"] = "0"
+        entry["my_rewatching_ep"] = "0"
+    else:
+        entry["my_rereadingg"] = "0"
+        entry["my_rereading_chap"] = "0"
+
+    entry["my_last_updated"] = str(int(time.time()))
+    entry["my_tags"] = ""
+
+    return entry
+
+
+def generate_list(media_type, database, size, seed=0):
+    """Generate a user's anime or manga list out of entries in the database
+
+    :param media_type: A string, must be either "anime" or "manga"
+    :param database: A list of OrderedDicts, the database as generated by generate_database
+    :param size: An int, the number of entries on the list, capped at the size of the database
+    :param seed: An int or string, the seed for the random number generator
+    :return: An OrderedDict mapping the string id of each entry to the list entry
+    """
+    rng = random.Random("{}-list-{}".format(media_type, seed))
+
+    user_list = OrderedDict()
+
+    for database_entry in rng.sample(database, min(size, len(database))):
+        status = rng.choice(LIST_STATUSES)
+
+        if media_type == "anime":
+            totals = (int(database_entry["episodes"]), 0)
+        else:
+            totals = (int(database_entry["chapters"]), int(database_entry["volumes"]))
+
+        # make progress consistent with the status of the entry
+        if status == "2":
+            progress = totals
+        elif status == "6":
+            progress = (0, 0)
+        else:
+            progress = tuple(rng.randint(0, total) if total else rng.randint(0, 20) for total in totals)
+
+        score = rng.randint(1, 10) if status in ["2", "4"] or rng.random() < 0.3 else 0
+
+        user_list[database_entry["id"]] = list_entry_from_database(media_type, database_entry, status, score, progress)
+
+    return user_list
+
+
+def _render_fields(entry, indent):
+    """Render the fields of an entry as XML elements
+
+    :param entry: An OrderedDict with string values
+    :param indent: A string, whitespace to put before each element
+    :return: A string
+    """
+    return "".join("{0}<{1}>{2}</{1}>\n".format(indent, name, escape(value)) for name, value in entry.items())
+
+
+def render_list(username, user_id, media_type, user_list):
+    """Render a user's list as a malappinfo.php XML document
+
+    :param username: A string, the name of the user
+    :param user_id: An int, the id of the user
+    :param media_type: A string, must be either "anime" or "manga"
+    :param user_list: An OrderedDict of list entries as generated by generate_list
+    :return: Bytes, the UTF-8 encoded document
+    """
+    counts = {status: 0 for status in LIST_STATUSES}
+    for entry in user_list.values():
+        counts[entry["my_status"]] = counts.get(entry["my_status"], 0) + 1
+
+    info = OrderedDict()
+    info["user_id"] = str(user_id)
+    info["user_name"] = username
+    info["user_watching" if media_type == "anime" else "user_reading"] = str(counts["1"])
+    info["user_completed"] = str(counts["2"])
+    info["user_onhold"] = str(counts["3"])
+    info["user_dropped"] = str(counts["4"])
+    info["user_plantowatch" if media_type == "anime" else "user_plantoread"] = str(counts["6"])
+    info["user_days_spent_watching"] = "0.00"
+
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<myanimelist>\n<myinfo>\n', _render_fields(info, "    "),
+             "</myinfo>\n"]
+
+    for entry in user_list.values():
+        parts.append("<{}>\n".format(media_type))
+        parts.append(_render_fields(entry, "    "))
+        parts.append("</{}>\n".format(media_type))
+
+    parts.append("</myanimelist>\n")
+
+    return "".join(parts).encode("utf-8")
+
+
+def render_search(media_type, entries):
+    """Render database entries as an api/{type}/search.xml XML document
+
+    :param media_type: A string, must be either "anime" or "manga"
+    :param entries: A list of OrderedDicts, database entries as generated by generate_database
+    :return: Bytes, the UTF-8 encoded document
+    """
+    parts = ['<?xml version="1.0" encoding="utf-8"?>\n<{}>\n'.format(media_type)]
+
+    for entry in entries:
+        parts.append("  <entry>\n")
+        parts.append(_render_fields(entry, "    "))
+        parts.append("  </entry>\n")
+
+    parts.append("</{}>\n".format(media_type))
+
+    return "".join(parts).encode("utf-8")
@@ -0,0 +1,471 @@
+import base64
+from email.utils import formatdate, parsedate_to_datetime
+import hashlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import random
+import re
+from socketserver import ThreadingMixIn
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+import xml.etree.ElementTree as ElementTree
+
+from stubserver import datagen
+
+# maps the fields in the XML sent to the add/update endpoints to the list entry fields they change
+ANIME_UPDATE_FIELDS = {
+    "episode": "my_watched_episodes",
+    "status": "my_status",
+    "score": "my_score"
+}
+
+MANGA_UPDATE_FIELDS = {
+    "chapter": "my_read_chapters",
+    "volume": "my_read_volumes",
+    "status": "my_status",
+    "score": "my_score"
+}
+
+
+class StubConfig:
+    """The behaviour of the stand-in server: how much data it generates and how badly it behaves"""
+
+    def __init__(self, list_size=100, database_size=2000, seed=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 no_results_rate=0.0, search_limit=50, users=None, conditional_lists=False):
+        """
+        :param list_size: An int, the number of entries generated for each user's anime and manga lists
+        :param database_size: An int, the number of anime and manga that can be searched for (at least list_size)
+        :param seed: An int, the seed for the data generator so runs can be repeated
+        :param latency: A number, the seconds to wait before answering each request
+        :param jitter: A number, up to this many extra seconds are randomly added to the latency
+        :param error_rate: A float between 0 and 1, the fraction of requests answered with a 503 error
+        :param no_results_rate: A float between 0 and 1, the fraction of searches answered with a 204 no content
+        :param search_limit: An int, the maximum number of entries returned by a search
+        :param users: A dictionary mapping usernames to passwords, or None to accept any non-empty credentials
+        :param conditional_lists: A boolean, whether list downloads carry ETag and Last-Modified headers and answer
+                                  conditional requests with a 304 (malappinfo.php doesn't send them)
+        """
+        self.list_size = list_size
+        self.database_size = max(database_size, list_size)
+        self.seed = seed
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.no_results_rate = no_results_rate
+        self.search_limit = search_limit
+        self.users = users
+        self.conditional_lists = conditional_lists
+
+
+class StubMAL:
+    """The state behind the stand-in server: the generated database and every user's lists"""
+
+    def __init__(self, config):
+        """
+        :param config: A StubConfig
+        """
+        self.config = config
+
+        self._lock = threading.Lock()
+        self._databases = {media_type: datagen.generate_database(media_type, config.database_size, config.seed)
+                           for media_type in ["anime", "manga"]}
+        self._lists = {}
+        self._rendered = {}
+        self._user_ids = {}
+
+    def check_credentials(self, username, password):
+        """Check whether a pair of credentials belongs to a user
+
+        :param username: A string
+        :param password: A string
+        :return: True if the credentials are valid, False otherwise
+        """
+        if self.config.users is None:
+            return bool(username) and bool(password)
+
+        return self.config.users.get(username) == password
+
+    def user_exists(self, username):
+        """Check whether a username belongs to a user
+
+        :param username: A string
+        :return: True if the user exists, False otherwise
+        """
+        if self.config.users is None:
+            return bool(username)
+
+        return username in self.config.users
+
+    def _get_list(self, username, media_type):
+        """Get a user's list, generating it on first use (must be called with the lock held)
+
+        :param username: A string
+        :param media_type: A string, must be either "anime" or "manga"
+        :return: An OrderedDict of list entries keyed by id
+        """
+        key = (username, media_type)
+
+        if key not in self._lists:
+            self._lists[key] = datagen.generate_list(media_type, self._databases[media_type], self.config.list_size,
+                                                     "{}-{}".format(self.config.seed, username))
+            self._user_ids.setdefault(username, len(self._user_ids) + 1)
+
+        return self._lists[key]
+
+    def render_list(self, username, media_type):
+        """Get a user's list as a malappinfo.php document, rendering it only when it has changed
+
+        :param username: A string
+        :param media_type: A string, must be either "anime" or "manga"
+        :return: A tuple (bytes, string, float), the document, its ETag and the time it last changed
+        """
+        with self._lock:
+            key = (username, media_type)
+
+            if key not in self._rendered:
+                user_list = self._get_list(username, media_type)
+                document = datagen.render_list(username, self._user_ids[username], media_type, user_list)
+                etag = '"{}"'.format(hashlib.sha1(document).hexdigest())
+                self._rendered[key] = (document, etag, time.time())
+
+            return self._rendered[key]
+
+    def list_entries(self, username, media_type):
+        """Get a copy of the entries on a user's list
+
+        :param username: A string
+        :param media_type: A string, must be either "anime" or "manga"
+        :return: A list of OrderedDicts
+        """
+        with self._lock:
+            return [entry.copy() for entry in self._get_list(username, media_type).values()]
+
+    def search(self, media_type, query):
+        """Search the database for entries with every word in the query in one of their titles
+
+        :param media_type: A string, must be either "anime" or "manga"
+        :param query: A string, the search query
+        :return: A list of OrderedDicts, the matching database entries
+        """
+        tokens = query.lower().split()
+
+        if not tokens:
+            return []
+
+        matches = []
+
+        for entry in self._databases[media_type]:
+            titles = " ".join([entry["title"], entry["english"], entry["synonyms"]]).lower()
+
+            if all(token in titles for token in tokens):
+                matches.append(entry)
+
+                if len(matches) >= self.config.search_limit:
+                    break
+
+        return matches
+
+    def add(self, username, media_type, entry_id, fields):
+        """Add an entry from the database to a user's list
+
+        :param username: A string
+        :param media_type: A string, must be either "anime" or "manga"
+        :param entry_id: A string, the database id of the entry
+        :param fields: A dictionary of the fields sent in the request XML
+        :return: A tuple (int, string), the HTTP status code and message to respond with
+        """
+        with self._lock:
+            user_list = self._get_list(username, media_type)
+            database = self._databases[media_type]
+
+            if not entry_id.isdigit() or not 1 <= int(entry_id) <= len(database):
+                return 400, "Invalid ID"
+
+            if entry_id in user_list:
+                return 400, "The {} (id: {}) is already in the list.".format(media_type, entry_id)
+
+            user_list[entry_id] = datagen.list_entry_from_database(media_type, database[int(entry_id) - 1])
+            self._apply_fields(media_type, user_list[entry_id], fields)
+            self._rendered.pop((username, media_type), None)
+
+            return 201, "Created"
+
+    def update(self, username, media_type, entry_id, fields):
+        """Change the fields of an entry on a user's list
+
+        :param username: A string
+        :param media_type: A string, must be either "anime" or "manga"
+        :param entry_id: A string, the database id of the entry
+        :param fields: A dictionary of the fields sent in the request XML
+        :return: A tuple (int, string), the HTTP status code and message to respond with
+        """
+        with self._lock:
+            user_list = self._get_list(username, media_type)
+
+            if entry_id not in user_list:
+                return 400, "The {} (id: {}) is not in the list.".format(media_type, entry_id)
+
+            self._apply_fields(media_type, user_list[entry_id], fields)
+            self._rendered.pop((username, media_type), None)
+
+            return 200, "Updated"
+
+    def delete(self, username, media_type, entry_id):
+        """Remove an entry from a user's list
+
+        :param username: A string
+        :param media_type: A string, must be either "anime" or "manga"
+        :param entry_id: A string, the database id of the entry
+        :return: A tuple (int, string), the HTTP status code and message to respond with
+        """
+        with self._lock:
+            user_list = self._get_list(username, media_type)
+
+            if user_list.pop(entry_id, None) is None:
+                return 400, "The {} (id: {}) is not in the list.".format(media_type, entry_id)
+
+            self._rendered.pop((username, media_type), None)
+
+            return 200, "Deleted"
+
+    @staticmethod
+    def _apply_fields(media_type, entry, fields):
+        """Copy the fields sent in a request onto a list entry
+
+        :param media_type: A string, must be either "anime" or "manga"
+        :param entry: An OrderedDict, the list entry
+        :param fields: A dictionary of the fields sent in the request XML
+        """
+        field_map = ANIME_UPDATE_FIELDS if media_type == "anime" else MANGA_UPDATE_FIELDS
+
+        for name, value in fields.items():
+            if name in field_map:
+                entry[field_map[name]] = value
+
+        entry["my_last_updated"] = str(int(time.time()))
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """Answer requests to the MAL API endpoints used by Sammy"""
+
+    # keep connections alive so clients can pool them
+    protocol_version = "HTTP/1.1"
+
+    routes = [
+        (re.compile(r"^/api/account/verify_credentials\.xml$"), "handle_verify_credentials"),
+        (re.compile(r"^/api/(anime|manga)/search\.xml$"), "handle_search"),
+        (re.compile(r"^/malappinfo\.php$"), "handle_list"),
+        (re.compile(r"^/api/(anime|manga)list/(add|update|delete)/(\w+)\.xml$"), "handle_list_write")
+    ]
+
+    def log_message(self, format, *args):
+        """Only log requests if the server was asked to be verbose"""
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        """Answer a GET request, the MAL API uses these for adds and updates as well as reads"""
+        self.dispatch()
+
+    def do_HEAD(self):
+        """Answer a HEAD request like a GET but without the body, e.g. a client opening a connection ahead of time"""
+        self.dispatch()
+
+    def do_DELETE(self):
+        """Answer a DELETE request"""
+        self.dispatch()
+
+    def dispatch(self):
+        """Simulate latency and failures then route the request to its handler"""
+        config = self.server.mal.config
+
+        if config.latency or config.jitter:
+            time.sleep(config.latency + random.uniform(0, config.jitter))
+
+        if random.random() < config.error_rate:
+            self.respond(503, "Service Unavailable")
+            return
+
+        url = urlsplit(self.path)
+        self.query = {name: values[-1] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+
+        for pattern, handler_name in self.routes:
+            match = pattern.match(url.path)
+            if match:
+                getattr(self, handler_name)(*match.groups())
+                return
+
+        self.respond(404, "Not Found")
+
+    def respond(self, status, body, content_type="text/html; charset=utf-8", headers=None):
+        """Send a complete response
+
+        :param status: An int, the HTTP status code
+        :param body: A string or bytes, the response body
+        :param content_type: A string, the value of the Content-Type header
+        :param headers: A dictionary or None, any other headers to send
+        """
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def authenticate(self):
+        """Check the basic auth credentials of the request, responding with a 401 if they aren't valid
+
+        :return: A string, the authenticated username, or None if authentication failed
+        """
+        header = self.headers.get("Authorization", "")
+
+        if header.startswith("Basic "):
+            try:
+                username, _, password = base64.b64decode(header[6:]).decode("utf-8").partition(":")
+            except (ValueError, UnicodeDecodeError):
+                username, password = "", ""
+
+            if self.server.mal.check_credentials(username, password):
+                return username
+
+        self.respond(401, "Invalid credentials")
+
+    def handle_verify_credentials(self):
+        """Answer api/account/verify_credentials.xml"""
+        username = self.authenticate()
+
+        if username is not None:
+            self.respond(200, "<?xml version=\"1.0\" encoding=\"utf-8\"?>\n<user>\n  <id>1</id>\n"
+                              "  <username>{}</username>\n</user>\n".format(username),
+                         content_type="text/xml; charset=utf-8")
+
+    def handle_search(self, media_type):
+        """Answer api/{type}/search.xml
+
+        :param media_type: A string, either "anime" or "manga"
+        """
+        if self.authenticate() is None:
+            return
+
+        # clients have sent spaces both as + and as an escaped +, so treat both as spaces
+        query = self.query.get("q", "").replace("+", " ")
+        matches = self.server.mal.search(media_type, query)
+
+        if not matches or random.random() < self.server.mal.config.no_results_rate:
+            self.respond(204, "")
+        else:
+            self.respond(200, datagen.render_search(media_type, matches), content_type="text/xml; charset=utf-8")
+
+    def handle_list(self):
+        """Answer malappinfo.php, which doesn't need authenticating"""
+        username = self.query.get("u", "")
+        media_type = self.query.get("type", "anime")
+
+        if media_type not in ["anime", "manga"] or not self.server.mal.user_exists(username):
+            self.respond(200, '<?xml version="1.0" encoding="UTF-8"?>\n<myanimelist><error>Invalid username</error>'
+                              '</myanimelist>\n', content_type="text/xml; charset=utf-8")
+            return
+
+        document, etag, changed_at = self.server.mal.render_list(username, media_type)
+
+        if not self.server.mal.config.conditional_lists:
+            self.respond(200, document, content_type="text/xml; charset=utf-8")
+            return
+
+        headers = {"ETag": etag, "Last-Modified": formatdate(changed_at, usegmt=True)}
+
+        if self.is_not_modified(etag, changed_at):
+            self.respond(304, "", headers=headers)
+        else:
+            self.respond(200, document, content_type="text/xml; charset=utf-8", headers=headers)
+
+    def is_not_modified(self, etag, changed_at):
+        """Check whether the conditional headers of the request show that the client already has the document
+
+        :param etag: A string, the ETag of the current document
+        :param changed_at: A float, the time the document last changed
+        :return: True if a 304 should be sent, False otherwise
+        """
+        # If-None-Match takes precedence, as Last-Modified is only accurate to the second
+        if "If-None-Match" in self.headers:
+            return etag in [tag.strip() for tag in self.headers["If-None-Match"].split(",")]
+
+        try:
+            modified_since = parsedate_to_datetime(self.headers["If-Modified-Since"]).timestamp()
+        except (KeyError, TypeError, ValueError):
+            return False
+
+        return int(changed_at) <= modified_since
+
+    def handle_list_write(self, media_type, action, entry_id):
+        """Answer api/{type}list/add|update|delete/{id}.xml
+
+        :param media_type: A string, either "anime" or "manga"
+        :param action: A string, either "add", "update" or "delete"
+        :param entry_id: A string, the database id of the entry
+        """
+        username = self.authenticate()
+
+        if username is None:
+            return
+
+        if action == "delete":
+            self.respond(*self.server.mal.delete(username, media_type, entry_id))
+            return
+
+        try:
+            fields = {element.tag: element.text or "" for element in ElementTree.fromstring(self.query["data"])}
+        except (KeyError, ElementTree.ParseError):
+            self.respond(400, "Invalid XML data")
+            return
+
+        if action == "add":
+            self.respond(*self.server.mal.add(username, media_type, entry_id, fields))
+        else:
+            self.respond(*self.server.mal.update(username, media_type, entry_id, fields))
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """A threaded HTTP server answering like the MAL API"""
+
+    daemon_threads = True
+
+    def __init__(self, address, config=None, verbose=False):
+        """
+        :param address: A tuple (host, port), use port 0 to pick any free port
+        :param config: A StubConfig or None to use the defaults
+        :param verbose: A boolean, whether to log every request to stderr
+        """
+        HTTPServer.__init__(self, address, StubRequestHandler)
+        self.mal = StubMAL(config or StubConfig())
+        self.verbose = verbose
+
+    @property
+    def base_url(self):
+        """The url to point clients at, e.g. http://127.0.0.1:8000"""
+        host, port = self.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+
+def start_in_thread(config=None, host="127.0.0.1", port=0):
+    """Start a stand-in server on a background thread
+
+    Call shutdown() and then server_close() on the returned server to stop it.
+
+    :param config: A StubConfig or None to use the defaults
+    :param host: A string, the interface to listen on
+    :param port: An int, the port to listen on, 0 picks any free port
+    :return: The running StubServer
+    """
+    server = StubServer((host, port), config)
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return server
@@ -0,0 +1,133 @@
+import unittest
+import xml.etree.ElementTree as ElementTree
+
+import requests
+
+from stubserver import datagen
+from stubserver import server
+
+
+class TestDatagen(unittest.TestCase):
+    def test_database_is_repeatable(self):
+        self.assertEqual(datagen.generate_database("anime", 50, seed=1), datagen.generate_database("anime", 50, seed=1))
+        self.assertNotEqual(datagen.generate_database("anime", 50, seed=1),
+                            datagen.generate_database("anime", 50, seed=2))
+
+    def test_invalid_media_type(self):
+        self.assertRaises(ValueError, datagen.generate_database, "badtype", 10)
+
+    def test_list_size(self):
+        database = datagen.generate_database("manga", 100)
+
+        self.assertEqual(len(datagen.generate_list("manga", database, 10)), 10)
+        self.assertEqual(len(datagen.generate_list("manga", database, 1000)), 100)
+
+    def test_render_list(self):
+        database = datagen.generate_database("anime", 20)
+        user_list = datagen.generate_list("anime", database, 20)
+
+        root = ElementTree.fromstring(datagen.render_list("user", 1, "anime", user_list))
+
+        self.assertEqual(root.find("myinfo/user_name").text, "user")
+        self.assertEqual(len(root.findall("anime")), 20)
+        self.assertIsNotNone(root.find("anime/series_animedb_id"))
+        self.assertIsNotNone(root.find("anime/my_watched_episodes"))
+
+
+class TestStubServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = server.start_in_thread(server.StubConfig(list_size=30, database_size=200,
+                                                              users={"user": "password"}))
+        cls.credentials = "user", "password"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def url(self, path):
+        return self.server.base_url + path
+
+    def test_verify_credentials(self):
+        self.assertEqual(requests.get(self.url("/api/account/verify_credentials.xml"),
+                                      auth=self.credentials).status_code, 200)
+        self.assertEqual(requests.get(self.url("/api/account/verify_credentials.xml"),
+                                      auth=("user", "wrong")).status_code, 401)
+
+    def test_search(self):
+        r = requests.get(self.url("/api/anime/search.xml?q=longstringthatshouldnotreturnaresult"),
+                         auth=self.credentials)
+        self.assertEqual(r.status_code, 204)
+
+        title = self.server.mal.list_entries("user", "anime")[0]["series_title"]
+        r = requests.get(self.url("/api/anime/search.xml?q={}".format(title.replace(" ", "+"))), auth=self.credentials)
+        self.assertEqual(r.status_code, 200)
+        self.assertIn(title, [entry.find("title").text for entry in ElementTree.fromstring(r.content)])
+
+    def test_list(self):
+        root = ElementTree.fromstring(requests.get(self.url("/malappinfo.php"),
+                                                   params={"u": "user", "type": "manga"}).content)
+        self.assertEqual(len(root.findall("manga")), 30)
+
+        root = ElementTree.fromstring(requests.get(self.url("/malappinfo.php"),
+                                                   params={"u": "nobody", "type": "manga"}).content)
+        self.assertEqual(root.find("error").text, "Invalid username")
+
+    def test_conditional_list(self):
+        params = {"u": "user", "type": "anime"}
+        self.assertNotIn("ETag", requests.get(self.url("/malappinfo.php"), params=params).headers)
+
+        self.server.mal.config.conditional_lists = True
+        try:
+            r = requests.get(self.url("/malappinfo.php"), params=params)
+            etag, last_modified = r.headers["ETag"], r.headers["Last-Modified"]
+
+            self.assertEqual(requests.get(self.url("/malappinfo.php"), params=params,
+                                          headers={"If-None-Match": etag}).status_code, 304)
+            self.assertEqual(requests.get(self.url("/malappinfo.php"), params=params,
+                                          headers={"If-Modified-Since": last_modified}).status_code, 304)
+
+            entry_id = self.server.mal.list_entries("user", "anime")[0]["series_animedb_id"]
+            requests.get(self.url("/api/animelist/update/{}.xml".format(entry_id)),
+                         params={"data": "<entry><score>3</score></entry>"}, auth=self.credentials)
+
+            r = requests.get(self.url("/malappinfo.php"), params=params, headers={"If-None-Match": etag})
+            self.assertEqual(r.status_code, 200)
+            self.assertNotEqual(r.headers["ETag"], etag)
+        finally:
+            self.server.mal.config.conditional_lists = False
+
+    def test_add_update_delete(self):
+        on_list = {entry["series_animedb_id"] for entry in self.server.mal.list_entries("user", "anime")}
+        entry_id = next(str(i) for i in range(1, 201) if str(i) not in on_list)
+
+        r = requests.get(self.url("/api/animelist/add/{}.xml".format(entry_id)),
+                         params={"data": "<entry><status>1</status><episode>3</episode></entry>"},
+                         auth=self.credentials)
+        self.assertEqual(r.status_code, 201)
+
+        r = requests.get(self.url("/api/animelist/update/{}.xml".format(entry_id)),
+                         params={"data": "<entry><score>7</score></entry>"}, auth=self.credentials)
+        self.assertEqual(r.status_code, 200)
+
+        entry = next(e for e in self.server.mal.list_entries("user", "anime") if e["series_animedb_id"] == entry_id)
+        self.assertEqual((entry["my_status"], entry["my_watched_episodes"], entry["my_score"]), ("1", "3", "7"))
+
+        r = requests.delete(self.url("/api/animelist/delete/{}.xml".format(entry_id)), auth=self.credentials)
+        self.assertEqual(r.status_code, 200)
+
+        r = requests.get(self.url("/api/animelist/update/{}.xml".format(entry_id)),
+                         params={"data": "<entry><score>7</score></entry>"}, auth=self.credentials)
+        self.assertEqual(r.status_code, 400)
+
+    def test_error_rate(self):
+        self.server.mal.config.error_rate = 1.0
+        try:
+            self.assertEqual(requests.get(self.url("/malappinfo.php"), params={"u": "user"}).status_code, 503)
+        finally:
+            self.server.mal.config.error_rate = 0.0
+
+
+if __name__ == '__main__':
+    unittest.main()